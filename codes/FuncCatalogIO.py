@@ -0,0 +1,362 @@
+"""
+File: FuncCatalogIO.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to read and write the catalogs and the crossmatch
+intermediates, in csv or in a columnar binary format (parquet or feather).
+The format is chosen by the file extension.
+
+The catalogs can be loaded with compact dtypes (see compact_dtypes):
+the coordinates stay float64, and the fluxes, errors, IDs and labels
+get smaller types, which cuts the memory of the wide merged tables.
+A float column only becomes float32 if float32 keeps all of its digits.
+
+The catalogs are written atomically: to a temporary file first, which
+is moved to the output filename once complete, so a reader (or a
+background writer of FuncCatalogStore) never sees a partial file.
+
+The binary formats need pyarrow.
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# default format of the catalogs and intermediates written by the pipeline
+DEFAULT_FORMAT = 'parquet'
+
+FORMAT_EXT = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# dtype policy: first word of the column names of the coordinates (kept in float64) and of the IDs
+COORD_NAMES = ['ra', 'dec', 'alpha', 'delta', 'raj2000', 'dej2000', 'glon', 'glat']
+ID_NAMES    = ['id', 'number', 'seq']
+# text columns with at most this fraction of distinct values become categoricals
+CATEGORY_FRACTION = 0.5
+# significant digits kept by float32 in a round trip of decimal values
+FLOAT32_DIGITS = np.finfo(np.float32).precision
+# column of the row index written with index=True, as read back from a csv file
+INDEX_COLUMN = 'Unnamed: 0'
+
+
+def catalog_format(fn):
+    """
+    Purpose
+        Return the format ('csv', 'parquet' or 'feather') of a catalog from its extension.
+    """
+    ext = os.path.splitext(fn)[1].lower()
+    for fmt, fmt_ext in FORMAT_EXT.items():
+        if ext == fmt_ext:
+            return fmt
+    raise ValueError('Unknown catalog format of %s'%(fn))
+
+
+def with_format(fn, fmt):
+    """
+    Purpose
+        Return the filename with the extension of the given format.
+    """
+    return os.path.splitext(fn)[0] + FORMAT_EXT[fmt]
+
+
+def read_catalog(fn, columns=None, compact=False):
+    """
+    Purpose
+        Read a catalog in csv, parquet or feather format.
+    ---------------------
+    Input Parameter
+        fn               [str]: the filename of the catalog.
+        columns         [list]: optional, only read these columns (column projection).
+        compact         [bool]: optional, convert the columns to compact dtypes (see compact_dtypes).
+    ---------------------
+    Return
+        df         [DataFrame]: the catalog.
+    """
+    fmt = catalog_format(fn)
+    if columns is not None:
+        columns = list(columns)
+    if fmt == 'csv':
+        df = pd.read_csv(fn, usecols=columns)
+    elif fmt == 'parquet':
+        df = pd.read_parquet(fn, columns=columns)
+    elif fmt == 'feather':
+        df = pd.read_feather(fn, columns=columns)
+    if compact:
+        df = compact_dtypes(df)
+    return df
+
+
+def catalog_columns(fn):
+    """
+    Purpose
+        Return the column names of a catalog, without reading its rows.
+    """
+    fmt = catalog_format(fn)
+    if fmt == 'csv':
+        return list(pd.read_csv(fn, nrows=0).columns)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if fmt == 'parquet':
+        return list(pq.read_schema(fn).names)
+    with pa.memory_map(fn) as source:
+        return list(pa.ipc.open_file(source).schema.names)
+
+
+def write_catalog(df, fn, index=False):
+    """
+    Purpose
+        Write a catalog in csv, parquet or feather format.
+    ---------------------
+    Input Parameter
+        df         [DataFrame]: the catalog.
+        fn               [str]: the output filename.
+        index           [bool]: optional, write the row index.
+                                The csv files write it as their unnamed first column,
+                                which is read back as the INDEX_COLUMN column.
+                                The binary formats store it as the INDEX_COLUMN column,
+                                so a catalog has the same columns in every format.
+                                A catalog already holding the INDEX_COLUMN column
+                                (see index_to_column) writes that column as the index.
+    """
+    fmt = catalog_format(fn)
+    fn_tmp = temp_filename(fn)
+    try:
+        if fmt == 'csv':
+            if index and INDEX_COLUMN in df.columns:
+                df = df.set_index(INDEX_COLUMN).rename_axis(None)
+            df.to_csv(fn_tmp, index=index, header=True)
+        else:
+            if index and INDEX_COLUMN not in df.columns:
+                df = index_to_column(df)
+            if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+                df = df.reset_index(drop=True)
+            if fmt == 'parquet':
+                df.to_parquet(fn_tmp, index=False)
+            elif fmt == 'feather':
+                df.to_feather(fn_tmp)
+        os.replace(fn_tmp, fn)
+    finally:
+        if os.path.exists(fn_tmp):
+            os.remove(fn_tmp)
+
+
+def index_to_column(df):
+    """
+    Purpose
+        Return the catalog with its row index moved to the first column INDEX_COLUMN,
+        as it is read back from a csv file written with the index.
+    """
+    values = df.index.values
+    df = df.reset_index(drop=True)
+    df.insert(0, INDEX_COLUMN, values)
+    return df
+
+
+def temp_filename(fn):
+    # temporary filename next to fn, unique per process and thread
+    return '%s.tmp%d_%d'%(fn, os.getpid(), threading.get_ident())
+
+
+def export_csv(fn, fn_csv=None):
+    """
+    Purpose
+        Export a binary catalog to csv, as the optional final step of the pipeline.
+    """
+    if fn_csv is None:
+        fn_csv = with_format(fn, 'csv')
+    if fn_csv != fn:
+        write_catalog(read_catalog(fn), fn_csv)
+        print('Save csv catalog %s'%(fn_csv))
+
+
+def compact_dtypes(df):
+    """
+    Purpose
+        Convert the columns of a catalog to compact dtypes:
+        - coordinates (e.g. RA_450umLim, dec_3GHzlp) stay float64, so the crossmatch keeps its precision,
+        - integer-valued IDs (e.g. ID_450umLim, or digit strings) become integers,
+        - other floats (fluxes, errors) become float32 if it keeps every value: the values
+          have at most FLOAT32_DIGITS significant digits, or are float32 values already.
+          Other float columns (e.g. pixel positions or redshifts with more digits) stay float64,
+        - other integers get the smallest integer type,
+        - text labels with repeated values (e.g. radio_det) become categoricals.
+        Integer columns with missing values use the nullable integer types (e.g. Int32).
+    ---------------------
+    Input Parameter
+        df         [DataFrame]: the catalog.
+    ---------------------
+    Return
+        df         [DataFrame]: the catalog with compact dtypes, the input is not changed.
+    """
+    columns = [df.iloc[:, i] for i in range(df.shape[1])]
+    compact = [compact_column(col, values) for col, values in zip(df.columns, columns)]
+    if all(values is None for values in compact):
+        return df
+    columns = [values if new is None else new for values, new in zip(columns, compact)]
+    df_compact = pd.DataFrame(dict(zip(range(len(columns)), columns)), index=df.index)
+    df_compact.columns = df.columns
+    return df_compact
+
+
+def compact_column(col, values):
+    # the column values with a compact dtype, or None to keep them
+    words = str(col).lower().split('_')
+    is_coord = words[0] in COORD_NAMES and 'err' not in words
+    is_id = words[0] in ID_NAMES
+    kind = values.dtype.kind
+
+    if kind == 'f':
+        if is_coord:
+            return None
+        valid = values.dropna()
+        if is_id and np.isfinite(valid).all() and (valid == np.round(valid)).all():
+            return smallest_integer(values)
+        if values.dtype.itemsize <= 4:
+            return None
+        finite = np.abs(valid[np.isfinite(valid)].to_numpy())
+        finite = finite[finite > 0]
+        info = np.finfo(np.float32)
+        if len(finite) == 0 or (finite.max() <= info.max and finite.min() >= info.tiny and is_float32_safe(finite)):
+            return values.astype(np.float32)
+    elif kind in 'iu':
+        return smallest_integer(values)
+    elif kind == 'O' and len(values) > 0:
+        if pd.api.types.infer_dtype(values, skipna=True) != 'string':
+            return None
+        valid = values.dropna()
+        if is_id and valid.str.fullmatch(r'-?(0|[1-9][0-9]{0,17})').all():
+            return smallest_integer(pd.to_numeric(values))
+        if valid.nunique() <= CATEGORY_FRACTION * len(values):
+            return values.astype('category')
+    return None
+
+
+def is_float32_safe(finite):
+    """
+    Purpose
+        Whether float32 keeps the positive finite values: each value is a float32 value
+        already (it round-trips exactly), or has at most FLOAT32_DIGITS significant digits,
+        so float32 gives back the same decimal value. A value with more digits would lose
+        them, e.g. 1234.5678 (a pixel position) becomes 1234.5677.
+    """
+    is_exact = finite.astype(np.float32).astype(np.float64) == finite
+    values = finite[~is_exact]
+    if len(values) == 0:
+        return True
+    # the value in units of its last kept digit is an integer, within 1e-6 for the float64 rounding
+    digits = values * 10. ** (FLOAT32_DIGITS - 1 - np.floor(np.log10(values)))
+    return bool(np.all(np.abs(digits - np.round(digits)) <= 1e-6))
+
+
+def smallest_integer(values):
+    # integer values in the smallest integer type, nullable if any value is missing
+    valid = values.dropna()
+    low, high = (valid.min(), valid.max()) if len(valid) > 0 else (0, 0)
+    for dtype in [np.int8, np.int16, np.int32, np.int64]:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            break
+    else:
+        return None
+    if len(valid) < len(values):
+        dtype = 'Int%d'%(np.iinfo(dtype).bits)
+    if str(values.dtype) == str(pd.api.types.pandas_dtype(dtype)):
+        return None
+    return values.astype(dtype)
+
+
+def iter_catalog(fn, chunksize, columns=None):
+    """
+    Purpose
+        Read a catalog in chunks of rows, so the memory is bounded by the chunk size.
+    ---------------------
+    Input Parameter
+        fn               [str]: the filename of the catalog.
+        chunksize        [int]: the number of rows of each chunk.
+        columns         [list]: optional, only read these columns (column projection).
+    ---------------------
+    Return
+        chunks     [generator]: the DataFrame chunks, with the row index of the full catalog.
+    """
+    fmt = catalog_format(fn)
+    if columns is not None:
+        columns = list(columns)
+    if fmt == 'csv':
+        # the dtypes are inferred per chunk, so first scan the file for the
+        # columns that are text or float in any chunk, and read them as such
+        dtype = {}
+        for df in pd.read_csv(fn, usecols=columns, chunksize=chunksize):
+            for col in df.columns:
+                if df[col].dtype == object:
+                    dtype[col] = str
+                elif df[col].dtype.kind == 'f' and dtype.get(col) is not str:
+                    dtype[col] = float
+        for df in pd.read_csv(fn, usecols=columns, chunksize=chunksize, dtype=dtype):
+            yield df
+        return
+
+    import pyarrow.parquet as pq
+    import pyarrow.feather as pf
+    start = 0
+    if fmt == 'parquet':
+        batches = pq.ParquetFile(fn).iter_batches(batch_size=chunksize, columns=columns)
+    elif fmt == 'feather':
+        table = pf.read_table(fn, columns=columns, memory_map=True)
+        batches = table.to_batches(max_chunksize=chunksize)
+    for batch in batches:
+        df = batch.to_pandas()
+        df.index = pd.RangeIndex(start, start + len(df))
+        start += len(df)
+        yield df
+
+
+class CatalogWriter:
+    """
+    Purpose
+        Write a catalog chunk by chunk in csv, parquet or feather format.
+        The columns of the first chunk set the schema of the output.
+        The chunks go to a temporary file, which is moved to fn when the writer
+        is closed without error.
+    """
+    def __init__(self, fn):
+        self.fn     = fn
+        self.fn_tmp = temp_filename(fn)
+        self.fmt    = catalog_format(fn)
+        self.writer = None
+        self.schema = None
+        self.nrows  = 0
+
+    def write(self, df):
+        if self.fmt == 'csv':
+            df.to_csv(self.fn_tmp, mode='w' if self.writer is None else 'a',
+                      header=self.writer is None, index=False)
+            self.writer = True
+        else:
+            import pyarrow as pa
+            if self.writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self.schema = table.schema
+                if self.fmt == 'parquet':
+                    import pyarrow.parquet as pq
+                    self.writer = pq.ParquetWriter(self.fn_tmp, table.schema)
+                else:
+                    self.writer = pa.ipc.new_file(self.fn_tmp, table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            self.writer.write_table(table)
+        self.nrows += len(df)
+
+    def close(self, is_complete=True):
+        if self.fmt != 'csv' and self.writer is not None:
+            self.writer.close()
+        if self.writer is not None:
+            if is_complete:
+                os.replace(self.fn_tmp, self.fn)
+            elif os.path.exists(self.fn_tmp):
+                os.remove(self.fn_tmp)
+        self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(is_complete=exc_type is None)
@@ -0,0 +1,122 @@
+"""
+File: FuncCatalogIndex.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to cache the coordinate index of the catalogs on disk.
+
+The unit-vector coordinates are stored as a memory-mapped .npy sidecar next to
+the catalog, together with the serialized KD tree. The cache is keyed by the
+content hash of the catalog and the RA/Dec column names, and is only rebuilt
+when the catalog changes.
+"""
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
+
+# my own packing
+import FuncTableCrossmatch as tc
+import FuncCatalogIO as cio
+
+
+def load_index(fn, col_ra, col_dec, df=None):
+    """
+    Purpose
+        Load the CatalogIndex of a catalog from its sidecar files,
+        or build and save it if the catalog has changed.
+    ---------------------
+    Input Parameter
+        fn               [str]: the filename of the catalog.
+        col_ra           [str]: the column name of RA (in degrees).
+        col_dec          [str]: the column name of DEC (in degrees).
+        df         [DataFrame]: optional, the already loaded catalog,
+                                used instead of reading fn if the index has to be built.
+    ---------------------
+    Return
+        index [CatalogIndex]: the index of the unit vectors of the catalog.
+    """
+    fn_meta = index_filename(fn, col_ra, col_dec, '.json')
+    fn_xyz  = index_filename(fn, col_ra, col_dec, '.npy')
+    fn_tree = index_filename(fn, col_ra, col_dec, '.pkl')
+
+    meta = read_meta(fn_meta)
+    stat = os.stat(fn)
+    is_valid = meta is not None and os.path.exists(fn_xyz) and os.path.exists(fn_tree)
+    if is_valid and (meta['size'], meta['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+        # the file was touched, so compare the content hash
+        is_valid = meta['hash'] == file_hash(fn)
+
+    if is_valid:
+        try:
+            xyz = np.load(fn_xyz, mmap_mode='r')
+            with open(fn_tree, 'rb') as f:
+                tree, rows = pickle.load(f)
+            return tc.CatalogIndex(xyz, tree=tree, rows=rows)
+        except Exception as e:
+            # e.g. a tree pickled by another numpy or scipy version
+            print('Rebuild catalog index %s, the sidecar cannot be loaded (%s: %s)'%(fn_xyz, type(e).__name__, e))
+
+    # build the index
+    if df is None:
+        df = cio.read_catalog(fn, columns=[col_ra, col_dec])
+    index = tc.CatalogIndex.from_radec(df[[col_ra, col_dec]].values)
+
+    # save the sidecar files, the meta file goes last so a partial write is never used
+    with atomic_write(fn_xyz) as f:
+        np.save(f, index.data)
+    with atomic_write(fn_tree) as f:
+        pickle.dump((index.tree, index.rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+    meta = {'hash': file_hash(fn), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'col_ra': col_ra, 'col_dec': col_dec}
+    with atomic_write(fn_meta, mode='w') as f:
+        json.dump(meta, f, indent=1)
+    print('Save catalog index %s'%(fn_xyz))
+    return index
+
+
+def index_filename(fn, col_ra, col_dec, ext):
+    return '%s.index_%s_%s%s'%(fn, col_ra, col_dec, ext)
+
+
+def read_meta(fn_meta):
+    if not os.path.exists(fn_meta):
+        return None
+    with open(fn_meta) as f:
+        return json.load(f)
+
+
+def file_hash(fn, block_size=1<<24):
+    """
+    Purpose
+        Return the sha1 hex digest of the content of a file.
+    """
+    h = hashlib.sha1()
+    with open(fn, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class atomic_write:
+    """
+    Purpose
+        Context manager that writes to a temporary file and moves it to fn on success,
+        so concurrent readers never see a partially written file.
+    """
+    def __init__(self, fn, mode='wb'):
+        self.fn = fn
+        self.fn_tmp = '%s.tmp%d'%(fn, os.getpid())
+        self.mode = mode
+
+    def __enter__(self):
+        self.f = open(self.fn_tmp, self.mode)
+        return self.f
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.f.close()
+        if exc_type is None:
+            os.replace(self.fn_tmp, self.fn)
+        else:
+            os.remove(self.fn_tmp)
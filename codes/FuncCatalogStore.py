@@ -0,0 +1,226 @@
+"""
+File: FuncCatalogStore.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to keep the catalogs of a pipeline run in memory.
+
+The loaded DataFrames and coordinate indexes are kept by logical name
+(the catalog filename), so the stages exchange their results in memory
+instead of writing a file and parsing it back. The least recently used
+entries are evicted when the memory budget is exceeded, and catalogs
+that are not on disk yet are saved before they are evicted.
+
+With I/O workers, the disk I/O overlaps the crossmatches: the catalogs
+of the upcoming tasks are prefetched (read and parsed) by a background
+thread pool, and the catalogs are written by the same pool instead of
+blocking the task. The catalogs being written still count against the
+memory budget; when it is exceeded, the store waits for the oldest
+writes to finish (backpressure).
+"""
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# my own packing
+import FuncTableCrossmatch as tc
+import FuncCatalogIndex as ci
+import FuncCatalogIO as cio
+
+
+class CatalogStore:
+    """
+    Purpose
+        In-memory store of catalogs and coordinate indexes with an LRU memory budget.
+    ---------------------
+    Input Parameter
+        max_memory     [float]: optional, the memory budget in bytes.
+        persist         [bool]: optional, if True, write each catalog to disk when it is put.
+                                Otherwise, the catalogs are only written by flush()
+                                or when they are evicted.
+        compact         [bool]: optional, read the catalogs from disk with compact dtypes
+                                (see FuncCatalogIO.compact_dtypes).
+        io_workers       [int]: optional, the number of background I/O threads,
+                                which prefetch and write the catalogs. 0 does the I/O in the caller.
+    """
+    def __init__(self, max_memory=4e9, persist=False, compact=False, io_workers=0):
+        self.max_memory = max_memory
+        self.persist    = persist
+        self.compact    = compact
+        self.entries    = OrderedDict()     # key -> [value, nbytes]
+        self.dirty      = set()             # names of the catalogs not written to disk yet
+        self.with_index = set()             # names of the catalogs written with their row index
+        self.memory     = 0
+        self.executor   = ThreadPoolExecutor(max_workers=io_workers) if io_workers > 0 else None
+        self.reads      = {}                # name -> [future, file size] of the prefetched catalogs
+        self.writes     = OrderedDict()     # name -> [future, df, nbytes] of the catalogs being written
+        self.pending    = 0                 # memory of the catalogs being written
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def get(self, name, columns=None):
+        """
+        Purpose
+            Return the catalog, from memory or read from disk.
+            A shallow copy is returned, so adding columns does not change the stored catalog.
+        """
+        if name in self.entries:
+            self.entries.move_to_end(name)
+            df = self.entries[name][0]
+        elif name in self.reads:
+            df = self.reads.pop(name)[0].result()
+            self._add(name, df)
+        elif name in self.writes:
+            # being written in the background, keep it from memory
+            df = self.writes[name][1]
+            self.pending -= self.writes[name][2]
+            self.writes[name][2] = 0
+            self._add(name, df)
+        elif columns is not None:
+            # projected reads are not kept
+            return cio.read_catalog(name, columns=columns, compact=self.compact)
+        else:
+            df = cio.read_catalog(name, compact=self.compact)
+            self._add(name, df)
+        if columns is not None:
+            return df[list(columns)]
+        return df.copy(deep=False)
+
+    def put(self, name, df, persist=None, index=False):
+        """
+        Purpose
+            Store the catalog under name, which is also its filename on disk.
+        ---------------------
+        Input Parameter
+            persist     [bool]: optional, write the catalog to disk now.
+                                By default, the persist setting of the store.
+            index       [bool]: optional, write the row index (see FuncCatalogIO.write_catalog).
+        """
+        self._drop(name)
+        self._add(name, df)
+        if index:
+            self.with_index.add(name)
+        if persist or (persist is None and self.persist):
+            self._write(name, df, index=index)
+            self._evict()
+        else:
+            self.dirty.add(name)
+
+    def prefetch(self, names):
+        """
+        Purpose
+            Start reading the catalogs on disk in the background, so a later get() does not wait
+            for them. The catalogs in memory, the missing files and the catalogs that do not fit 
+            in the memory budget (estimated from the file sizes) are skipped.
+            Without I/O workers, nothing is done.
+        """
+        if self.executor is None:
+            return
+        for name in names:
+            if name in self.entries or name in self.reads or name in self.writes or not os.path.exists(name):
+                continue
+            size = os.path.getsize(name)
+            reading = sum(read[1] for read in self.reads.values())
+            if self.memory + self.pending + reading + size > self.max_memory:
+                continue
+            self.reads[name] = [self.executor.submit(cio.read_catalog, name, compact=self.compact), size]
+
+    def discard(self, name):
+        """
+        Purpose
+            Forget the catalog and its indexes, e.g. when the file is rewritten outside the store.
+        """
+        self._wait_write(name)
+        self._drop(name)
+
+    def get_index(self, name, col_ra, col_dec):
+        """
+        Purpose
+            Return the CatalogIndex of the RA/DEC columns of the catalog.
+            Catalogs on disk use the cached index sidecar (FuncCatalogIndex.load_index).
+        """
+        key = ('index', name, col_ra, col_dec)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+        if name in self.dirty:
+            df = self.get(name, columns=[col_ra, col_dec])
+            index = tc.CatalogIndex.from_radec(df[[col_ra, col_dec]].values)
+        else:
+            # the index sidecar is checked against the file on disk
+            self._wait_write(name)
+            df = self.entries[name][0] if name in self.entries else None
+            index = ci.load_index(name, col_ra, col_dec, df=df)
+        self._add(key, index, nbytes=index.data.nbytes + index.rows.nbytes)
+        return index
+
+    def flush(self, name=None):
+        """
+        Purpose
+            Write the catalogs that are not on disk yet (or only the given one),
+            and wait until they are on disk.
+        """
+        names = list(self.dirty) if name is None else [name]
+        for key in names:
+            if key in self.dirty:
+                self._write(key, self.entries[key][0], index=key in self.with_index)
+                self.dirty.discard(key)
+        names = list(self.writes) if name is None else [name]
+        for key in names:
+            self._wait_write(key)
+
+    def _write(self, name, df, index=False):
+        # write the catalog, in the background with I/O workers
+        if self.executor is None:
+            cio.write_catalog(df, name, index=index)
+            print('Save catalog %s'%(name))
+            return
+        # the writes of a file stay in order
+        self._wait_write(name)
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        self.writes[name] = [self.executor.submit(cio.write_catalog, df, name, index=index), df, nbytes]
+        self.pending += nbytes
+
+    def _wait_write(self, name):
+        # wait until the catalog being written is on disk, and raise its error if any
+        if name not in self.writes:
+            return
+        future, df, nbytes = self.writes.pop(name)
+        self.pending -= nbytes
+        future.result()
+        print('Save catalog %s'%(name))
+
+    def _add(self, key, value, nbytes=None):
+        if nbytes is None:
+            nbytes = int(value.memory_usage(index=True, deep=True).sum())
+        self.entries[key] = [value, nbytes]
+        self.memory += nbytes
+        self._evict()
+
+    def _drop(self, name):
+        # drop the catalog and its indexes
+        for key in list(self.entries):
+            if key == name or (isinstance(key, tuple) and key[1] == name):
+                self.memory -= self.entries.pop(key)[1]
+        self.dirty.discard(name)
+        self.with_index.discard(name)
+        if name in self.reads:
+            self.reads.pop(name)[0].cancel()
+
+    def _evict(self):
+        # evict the least recently used entries, but always keep the newest one,
+        # then wait for the oldest writes
+        for name in [name for name, write in self.writes.items() if write[0].done()]:
+            self._wait_write(name)
+        while self.memory + self.pending > self.max_memory:
+            if len(self.entries) > 1:
+                key = next(iter(self.entries))
+                if key in self.dirty:
+                    self._write(key, self.entries[key][0], index=key in self.with_index)
+                    self.dirty.discard(key)
+                self.memory -= self.entries.pop(key)[1]
+            elif self.writes:
+                self._wait_write(next(iter(self.writes)))
+            else:
+                break
@@ -0,0 +1,334 @@
+"""
+File: FuncConeSearch.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to answer cone searches and crossmatches against the
+COSMOS catalogs from a long-running local server, so an interactive
+session does not reload the catalogs and rebuild their trees per lookup.
+
+ConeSearchServer is an HTTP server on a local port. It keeps the
+coordinate indexes of the catalogs warm (built once, or loaded from the
+index sidecars of FuncCatalogIndex), and the columns asked for in a
+CatalogStore with a memory budget. A request holds a batch of positions,
+and the matches are returned as flat arrays (see crossmatch_angular with
+flat=True). Both the requests and the responses are npz, compact binary
+arrays without pickle. ConeSearchClient is the thin client of the
+notebooks, keeping one connection open to the server.
+
+Example:
+    python script_04_cone_server.py --catalog 3GHzlp --catalog irac
+
+    from FuncConeSearch import ConeSearchClient
+    client = ConeSearchClient()
+    df = client.cone_search('irac', [150.1, 150.2], [2.2, 2.3], radius=2)
+"""
+import io
+import json
+import threading
+import http.client
+import numpy as np
+import pandas as pd
+from urllib.parse import urlparse, parse_qs, urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# my own packing
+import FuncTableCrossmatch as tc
+from FuncCatalogStore import CatalogStore
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# first word of the column names of RA and DEC (see FuncCatalogIO.COORD_NAMES)
+RA_NAMES  = ['ra', 'alpha', 'raj2000']
+DEC_NAMES = ['dec', 'delta', 'dej2000']
+
+
+def coord_columns(columns):
+    """
+    Purpose
+        Return the RA and DEC column names of a catalog (e.g. RA_450umGao, Dec_450umGao),
+        the first columns whose name starts with a RA or DEC word and are not errors.
+    """
+    col_ra, col_dec = None, None
+    for col in columns:
+        words = str(col).lower().split('_')
+        if any(word.startswith('err') or word.endswith('err') for word in words):
+            continue
+        if col_ra is None and words[0] in RA_NAMES:
+            col_ra = col
+        elif col_dec is None and words[0] in DEC_NAMES:
+            col_dec = col
+    if col_ra is None or col_dec is None:
+        raise ValueError('No RA/DEC columns in %s'%(list(columns),))
+    return col_ra, col_dec
+
+
+def encode_arrays(arrays):
+    # npz bytes of a dict of arrays
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def decode_arrays(data):
+    # dict of arrays of npz bytes, without pickle
+    with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+        return {key: npz[key] for key in npz.files}
+
+
+def column_values(values):
+    # numpy values of a catalog column for npz: nullable integers become floats with NaN,
+    # and text or categorical columns become unicode strings
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biuf':
+        return values.to_numpy()
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return values.to_numpy(dtype=float, na_value=np.nan)
+    return values.astype(str).to_numpy(dtype=str)
+
+
+def parse_request(body, params):
+    """
+    Purpose
+        Read the positions (shape(N, 2), in degrees), the radius (in arcsec, a number or
+        an array of length N) and the columns of a request, and check them.
+    """
+    arrays = decode_arrays(body)
+    ra = np.asarray(arrays['ra'], dtype=float)
+    dec = np.asarray(arrays['dec'], dtype=float)
+    if ra.ndim != 1 or ra.shape != dec.shape:
+        raise ValueError('ra and dec must be 1D arrays of the same length, not %s and %s'%(ra.shape, dec.shape))
+    if 'radius' in arrays:
+        radius = np.asarray(arrays['radius'], dtype=float)
+        if radius.shape != ra.shape:
+            raise ValueError('radius must have the length of ra, not %s'%(radius.shape,))
+    else:
+        radius = float(params.get('radius', 1.))
+    # a NaN radius never matches, as in CatalogIndex
+    if np.any(np.asarray(radius) < 0) or np.any(np.isinf(radius)):
+        raise ValueError('radius must be positive and finite')
+    columns = [col for col in params.get('columns', '').split(',') if col]
+    return np.column_stack([ra, dec]), radius, columns
+
+
+class ConeSearchServer(ThreadingHTTPServer):
+    """
+    Purpose
+        Local HTTP server of cone searches and crossmatches against warm catalog indexes.
+        GET /catalogs lists the catalogs (json). POST /cone and POST /crossmatch take
+        the npz arrays 'ra' and 'dec' (in degrees), and optionally 'radius' (in arcsec, per
+        position), with the query parameters catalog, radius (in arcsec) and columns
+        (comma separated), and return npz arrays:
+        /cone: 'offset', 'ind', 'sep' of all the matches within radius, CSR-style,
+        /crossmatch: 'ind' (-1 if none), 'sep' and 'count' of the nearest match of each position,
+        followed by the requested columns of the matched rows.
+        Bad requests (e.g. unknown catalogs or columns, ra and dec of different lengths)
+        are answered with 400 and a json error.
+    ---------------------
+    Input Parameter
+        catalogs        [dict]: the catalogs served: name -> (filename, col_ra, col_dec).
+        address        [tuple]: optional, the (host, port) of the server.
+        max_memory     [float]: optional, the memory budget in bytes of the catalog columns.
+    """
+    daemon_threads = True
+
+    def __init__(self, catalogs, address=(DEFAULT_HOST, DEFAULT_PORT), max_memory=4e9):
+        super().__init__(address, ConeSearchHandler)
+        self.catalogs = dict(catalogs)
+        self.store    = CatalogStore(max_memory=max_memory, compact=True)
+        self.lock     = threading.Lock()     # the store is shared by the request threads
+        self.indexes  = {}
+
+    def warm(self):
+        """Load or build the index of every catalog, before serving."""
+        for name in self.catalogs:
+            index = self.index(name)
+            print('Load index of %s: %d sources'%(name, len(index)))
+
+    def index(self, name):
+        # the CatalogIndex of the catalog, kept for the lifetime of the server
+        if name not in self.catalogs:
+            raise KeyError('Unknown catalog %s'%(name))
+        with self.lock:
+            if name not in self.indexes:
+                fn, col_ra, col_dec = self.catalogs[name]
+                self.indexes[name] = self.store.get_index(fn, col_ra, col_dec)
+            return self.indexes[name]
+
+    def columns(self, name, columns, rows):
+        # the values of the columns at the rows of the catalog
+        if len(columns) == 0:
+            return {}
+        with self.lock:
+            df = self.store.get(self.catalogs[name][0])
+        missing = [col for col in columns if col not in df.columns]
+        if missing:
+            raise KeyError('Unknown columns %s of catalog %s'%(missing, name))
+        return {col: column_values(df[col].iloc[rows]) for col in columns}
+
+    def describe(self):
+        """The name, filename, RA/DEC columns and number of sources of the catalogs."""
+        return [{'name': name, 'filename': fn, 'col_ra': col_ra, 'col_dec': col_dec,
+                 'n_source': len(self.indexes[name]) if name in self.indexes else None}
+                for name, (fn, col_ra, col_dec) in self.catalogs.items()]
+
+    def query(self, kind, name, X, radius, columns=()):
+        """
+        Purpose
+            Answer a batch of positions X (shape(N, 2), in degrees) within radius (in arcsec,
+            a number or an array of length N): all the matches ('cone') or the nearest one ('crossmatch').
+        ---------------------
+        Return
+            arrays      [dict]: the response arrays (see ConeSearchServer).
+        """
+        index = self.index(name)
+        max_distance = np.asarray(radius, dtype=float) / 3600 if np.ndim(radius) > 0 else float(radius) / 3600
+        if kind == 'cone':
+            offset, ind, sep = tc.crossmatch_angular(X, index, max_distance=max_distance, return_dist=True, flat=True)
+            ind, sep = tc.sort_pairs(offset, ind, sep)
+            arrays = {'offset': offset, 'ind': ind, 'sep': sep}
+            rows = ind
+        elif kind == 'crossmatch':
+            offset, ind_match, sep_match, count = tc.crossmatch_angular_nearest(X, index, max_distance=max_distance)
+            has_match = np.diff(offset) > 0
+            ind = np.full(len(X), -1, dtype=np.intp)
+            sep = np.full(len(X), np.nan)
+            ind[has_match], sep[has_match] = ind_match, sep_match
+            arrays = {'ind': ind, 'sep': sep, 'count': count}
+            rows = np.maximum(ind, 0)
+        else:
+            raise KeyError('Unknown query %s'%(kind))
+        arrays.update({'col_' + col: values for col, values in self.columns(name, list(columns), rows).items()})
+        return arrays
+
+
+class ConeSearchHandler(BaseHTTPRequestHandler):
+    # keep-alive connections, so a client pays the connection once,
+    # and no Nagle delay between the headers and the body of a response
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/catalogs':
+            self.respond(200, json.dumps(self.server.describe()).encode(), 'application/json')
+        else:
+            self.respond_error(404, 'Unknown path %s'%(url.path))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            X, radius, columns = parse_request(body, params)
+        except Exception as e:
+            # anything wrong in the request is an error of the client
+            self.respond_error(400, 'Bad request, %s: %s'%(type(e).__name__, e))
+            return
+        try:
+            result = self.server.query(url.path.strip('/'), params.get('catalog'), X, radius, columns)
+        except (KeyError, ValueError) as e:
+            self.respond_error(400, str(e))
+            return
+        except Exception as e:
+            self.respond_error(500, '%s: %s'%(type(e).__name__, e))
+            return
+        self.respond(200, encode_arrays(result), 'application/octet-stream')
+
+    def respond(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def respond_error(self, status, message):
+        self.respond(status, json.dumps({'error': message}).encode(), 'application/json')
+
+    def log_message(self, format, *args):
+        # only the failed requests are logged
+        if len(args) > 1 and str(args[1]) != '200':
+            super().log_message(format, *args)
+
+
+class ConeSearchClient:
+    """
+    Purpose
+        Thin client of ConeSearchServer, keeping one connection to the server.
+    ---------------------
+    Input Parameter
+        host             [str]: optional, the host of the server.
+        port             [int]: optional, the port of the server.
+        timeout        [float]: optional, the timeout of a request, in seconds.
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=60.):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def catalogs(self):
+        """The catalogs of the server (DataFrame)."""
+        return pd.DataFrame(json.loads(self._request('GET', '/catalogs')))
+
+    def cone_search(self, catalog, ra, dec, radius=1., columns=None):
+        """
+        Purpose
+            Find all the sources of the catalog within radius of each position.
+        ---------------------
+        Input Parameter
+            catalog      [str]: the name of the catalog (e.g. 'irac', see catalogs()).
+            ra, dec    [array]: the positions, in degrees.
+            radius     [float]: optional, the radius in arcsec, or an array of the radius of each position.
+            columns     [list]: optional, the catalog columns to return.
+        ---------------------
+        Return
+            df     [DataFrame]: one row per match, sorted by position and separation:
+                                'Query' (the index of the position), 'Index' (the row in the catalog),
+                                'Separation' (in arcsec), followed by the columns.
+        """
+        arrays = self._query('cone', catalog, ra, dec, radius, columns)
+        df = pd.DataFrame({'Query': np.repeat(np.arange(len(arrays['offset']) - 1), np.diff(arrays['offset'])),
+                           'Index': arrays['ind'], 'Separation': arrays['sep']})
+        for key in arrays:
+            if key.startswith('col_'):
+                df[key[4:]] = arrays[key]
+        return df
+
+    def crossmatch(self, catalog, ra, dec, radius=1., columns=None):
+        """
+        Purpose
+            Find the nearest source of the catalog within radius of each position.
+        ---------------------
+        Return
+            df     [DataFrame]: one row per position: 'Index' (the row in the catalog, -1 if none),
+                                'Separation' (in arcsec), 'Count' (the number of sources within radius),
+                                followed by the columns (missing if no match).
+        """
+        arrays = self._query('crossmatch', catalog, ra, dec, radius, columns)
+        df = pd.DataFrame({'Index': arrays['ind'], 'Separation': arrays['sep'], 'Count': arrays['count']})
+        has_match = arrays['ind'] >= 0
+        for key in arrays:
+            if key.startswith('col_'):
+                df[key[4:]] = pd.Series(arrays[key]).where(has_match)
+        return df
+
+    def close(self):
+        self.connection.close()
+
+    def _query(self, kind, catalog, ra, dec, radius, columns):
+        arrays = {'ra': np.atleast_1d(np.asarray(ra, dtype=float)), 'dec': np.atleast_1d(np.asarray(dec, dtype=float))}
+        params = {'catalog': catalog}
+        if np.ndim(radius) > 0:
+            arrays['radius'] = np.asarray(radius, dtype=float)
+        else:
+            params['radius'] = repr(float(radius))
+        if columns:
+            params['columns'] = ','.join(columns)
+        return decode_arrays(self._request('POST', '/%s?%s'%(kind, urlencode(params)), encode_arrays(arrays)))
+
+    def _request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/octet-stream'} if body is not None else {}
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise RuntimeError('Cone search server error %d: %s'%(response.status, json.loads(data)['error']))
+        return data
@@ -0,0 +1,157 @@
+"""
+File: FuncCutout.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to cut the postage stamps of the matched sources
+out of the COSMOS images.
+
+Each image is opened once and memory-mapped, so only the pages under the
+stamps are read. All the positions are converted to pixels in one WCS
+call. The stamps inside the image are gathered from a zero-copy sliding
+window view of the image in one indexing step, and the stamps on the
+edge are padded with NaN. The stamps of a band are written in bulk to
+one FITS cube: the primary HDU holds the stamps, shape (N, size, size),
+the SOURCES table holds the source IDs, positions and pixel offsets, and
+the IMAGE_WCS header holds the WCS of the image. The bands are cut in
+parallel, one band per worker process.
+"""
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from astropy.io import fits
+from astropy.wcs import WCS
+from astropy.wcs.utils import proj_plane_pixel_scales
+from astropy.table import Table
+
+
+def open_image(fn, hdu=0):
+    """
+    Purpose
+        Open a FITS image memory-mapped.
+    ---------------------
+    Input Parameter
+        fn               [str]: the filename of the image.
+        hdu              [int]: optional, the HDU of the image.
+    ---------------------
+    Return
+        data         [ndarray]: the 2D image, a view of the memory-mapped file.
+                                The leading axes of size 1 (e.g. the frequency and
+                                Stokes axes of the radio images) are dropped.
+        wcs              [WCS]: the celestial WCS of the image.
+    """
+    with fits.open(fn, memmap=True) as hdul:
+        data = hdul[hdu].data
+        header = hdul[hdu].header
+    data = data.reshape(data.shape[-2:]) if data.ndim > 2 else data
+    return data, WCS(header).celestial
+
+
+def stamp_size(wcs, size):
+    # the odd number of pixels covering size (in arcsec)
+    scale = proj_plane_pixel_scales(wcs).mean() * 3600
+    n = int(np.ceil(size / scale))
+    return n + 1 - n % 2
+
+
+def cutout_stamps(data, x, y, size):
+    """
+    Purpose
+        Cut the stamps centered on the pixel positions (x, y) out of an image.
+    ---------------------
+    Input Parameter
+        data         [ndarray]: the 2D image, e.g. memory-mapped by open_image.
+        x, y         [ndarray]: the 0-based pixel positions of the stamp centers.
+        size             [int]: the stamp size in pixels (odd).
+    ---------------------
+    Return
+        stamps       [ndarray]: the stamps, shape (N, size, size), as float32.
+                                Pixels outside the image are NaN.
+        x0, y0       [ndarray]: the pixel of the lower-left corner of each stamp in the image.
+    """
+    half = size // 2
+    valid = np.isfinite(x) & np.isfinite(y)
+    x0 = np.full(len(x), -1, dtype=np.int64)
+    y0 = np.full(len(x), -1, dtype=np.int64)
+    x0[valid] = np.round(x[valid]).astype(np.int64) - half
+    y0[valid] = np.round(y[valid]).astype(np.int64) - half
+
+    ny, nx = data.shape
+    stamps = np.full((len(x), size, size), np.nan, dtype=np.float32)
+    is_inside = valid & (x0 >= 0) & (y0 >= 0) & (x0 + size <= nx) & (y0 + size <= ny)
+    if ny >= size and nx >= size and is_inside.any():
+        # all the windows of the image, without copying it
+        windows = np.lib.stride_tricks.sliding_window_view(data, (size, size))
+        stamps[is_inside] = windows[y0[is_inside], x0[is_inside]]
+
+    # stamps on the edge of the image
+    is_edge = valid & ~is_inside & (x0 + size > 0) & (y0 + size > 0) & (x0 < nx) & (y0 < ny)
+    for i in np.flatnonzero(is_edge):
+        xs, ys = max(x0[i], 0), max(y0[i], 0)
+        xe, ye = min(x0[i] + size, nx), min(y0[i] + size, ny)
+        stamps[i, ys - y0[i]:ye - y0[i], xs - x0[i]:xe - x0[i]] = data[ys:ye, xs:xe]
+    return stamps, x0, y0
+
+
+def cutout_band(band, fn_img, ra, dec, size, fn_out, ids=None, hdu=0):
+    """
+    Purpose
+        Cut the stamps of all the sources out of the image of one band,
+        and write them to one FITS cube.
+    ---------------------
+    Input Parameter
+        band             [str]: the name of the band, e.g. 'irac1'.
+        fn_img           [str]: the filename of the image.
+        ra, dec      [ndarray]: the positions of the sources, in degrees.
+        size           [float]: the stamp size, in arcsec.
+        fn_out           [str]: the filename of the output cube.
+        ids          [ndarray]: optional, the IDs of the sources. By default, their row numbers.
+        hdu              [int]: optional, the HDU of the image.
+    ---------------------
+    Return
+        n_stamp          [int]: the number of stamps with data.
+    """
+    data, wcs = open_image(fn_img, hdu=hdu)
+    n_pix = stamp_size(wcs, size)
+    x, y = wcs.all_world2pix(np.asarray(ra, dtype=float), np.asarray(dec, dtype=float), 0)
+    stamps, x0, y0 = cutout_stamps(data, x, y, n_pix)
+    has_data = np.isfinite(stamps).any(axis=(1, 2))
+
+    primary = fits.PrimaryHDU(stamps)
+    primary.header['BAND'] = band
+    primary.header['IMAGE'] = fn_img
+    primary.header['STAMPSZ'] = (n_pix, 'stamp size in pixels')
+    table = Table({'ID': np.arange(len(stamps)) if ids is None else np.asarray(ids),
+                   'RA': np.asarray(ra, dtype=float), 'DEC': np.asarray(dec, dtype=float),
+                   'X0': x0, 'Y0': y0, 'HAS_DATA': has_data})
+    # the WCS of the image, the WCS of a stamp is the same with CRPIX shifted by (-X0, -Y0)
+    wcs_hdu = fits.ImageHDU(header=wcs.to_header(), name='IMAGE_WCS')
+    fits.HDUList([primary, fits.BinTableHDU(table, name='SOURCES'), wcs_hdu]).writeto(fn_out, overwrite=True)
+    return int(has_data.sum())
+
+
+def make_cutouts(ra, dec, images, size, fn_out_fmt, ids=None, n_workers=None):
+    """
+    Purpose
+        Cut the stamps of the sources out of the images of several bands,
+        one band per worker process.
+    ---------------------
+    Input Parameter
+        ra, dec      [ndarray]: the positions of the sources, in degrees.
+        images          [dict]: the filename of the image of each band.
+        size           [float]: the stamp size, in arcsec.
+        fn_out_fmt       [str]: the filename of the output cubes, formatted with the band,
+                                e.g. 'cutout_%s.fits'.
+        ids          [ndarray]: optional, the IDs of the sources.
+        n_workers        [int]: optional, the number of worker processes.
+                                By default, the number of cores; 1 runs in this process.
+    ---------------------
+    Return
+        n_stamp         [dict]: the number of stamps with data of each band.
+    """
+    bands = list(images)
+    args = [(band, images[band], ra, dec, size, fn_out_fmt%(band), ids) for band in bands]
+    if n_workers == 1 or len(bands) == 1:
+        return {band: cutout_band(*arg) for band, arg in zip(bands, args)}
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {band: executor.submit(cutout_band, *arg) for band, arg in zip(bands, args)}
+        return {band: future.result() for band, future in futures.items()}
@@ -0,0 +1,152 @@
+"""
+File: FuncFalseMatch.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to estimate the false-match rate of a crossmatch
+as a function of the matching radius, by Monte Carlo of shifted catalogs.
+
+The first catalog is shifted on the sky by random offsets (a rotation of
+the sphere, so the field keeps its shape at any RA/Dec) and matched again
+against the second catalog. The counterparts found within a radius of the
+shifted sources are chance matches. The KD tree of the second catalog is
+built once. Each realization is one batched nearest-neighbour query,
+without merging the tables, and its nearest distances give the rate at
+every radius at once. The realizations are spread over a process pool.
+"""
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# my own packing
+import FuncTableCrossmatch as tc
+
+# the catalogs of the worker processes, set once per process by init_worker
+worker_data = {}
+
+
+def false_match_rate(X1, X2, radii, n_realization=100, min_shift=10., max_shift=60., seed=None,
+                     n_workers=None, n_batch=None):
+    """
+    Purpose
+        Estimate the false-match rate of X1 against X2 at each radius,
+        from n_realization random shifts of X1.
+    ---------------------
+    Input Parameter
+        X1             [array]: first dataset, shape(N1, 2), RA and DEC in degrees.
+        X2             [array]: second dataset, shape(N2, 2), RA and DEC in degrees,
+                                or its prebuilt CatalogIndex (e.g. FuncCatalogIndex.load_index).
+        radii           [list]: the matching radii, in arcsec.
+        n_realization    [int]: optional, the number of random shifts.
+        min_shift      [float]: optional, the smallest shift, in arcsec. It should be well above
+                                the positional errors, so the true counterparts are not found again.
+        max_shift      [float]: optional, the largest shift, in arcsec. It should be small compared
+                                with the field, so few shifted sources leave the coverage of X2.
+        seed             [int]: optional, the random seed. The result does not depend on n_workers.
+        n_workers        [int]: optional, the number of worker processes.
+                                By default, the number of cores; 1 runs in this process.
+        n_batch          [int]: optional, the number of realizations per task,
+                                which are stacked into one query of the tree.
+    ---------------------
+    Return
+        df         [DataFrame]: one row per radius:
+                                'Radius' (arcsec),
+                                'MatchRate' (fraction of X1 sources with a counterpart, unshifted),
+                                'FalseRate' (mean fraction of the shifted X1 sources with a counterpart),
+                                'FalseRateStd' (its standard deviation over the realizations),
+                                'Reliability' (1 - FalseRate / MatchRate).
+    """
+    radii = np.sort(np.atleast_1d(np.asarray(radii, dtype=float)))
+    Y1 = tc.radec_to_xyz(X1)
+    Y1 = Y1[np.isfinite(Y1).all(axis=1)]
+    index2 = X2 if isinstance(X2, tc.CatalogIndex) else tc.CatalogIndex.from_radec(X2)
+    if n_workers is None:
+        n_workers = os.cpu_count()
+
+    # the rotations of the realizations, drawn here so they do not depend on the workers
+    rng = np.random.default_rng(seed)
+    rotations = random_rotations(Y1, n_realization, min_shift / 3600, max_shift / 3600, rng)
+    if n_batch is None:
+        n_batch = max(1, int(np.ceil(n_realization / (4 * n_workers))))
+    batches = [rotations[i:i + n_batch] for i in range(0, n_realization, n_batch)]
+
+    max_y = tc.angle_to_chord(radii.max() / 3600)
+    if n_workers <= 1:
+        init_worker(Y1, index2, max_y)
+        results = [nearest_shifted(rotation) for rotation in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker,
+                                 initargs=(Y1, index2, max_y)) as executor:
+            results = list(executor.map(nearest_shifted, batches))
+    chord = np.concatenate(results, axis=0)                  # shape (n_realization, N1)
+
+    # fraction of the sources with a chance counterpart within each radius
+    radii_y = tc.angle_to_chord(radii / 3600)
+    rate = np.stack([(chord <= r).mean(axis=1) for r in radii_y], axis=1) if len(Y1) > 0 else \
+           np.zeros((n_realization, len(radii)))
+    chord_match, _ = index2.query_nearest(Y1, max_y)
+    match_rate = np.array([(chord_match <= r).mean() if len(Y1) > 0 else 0. for r in radii_y])
+
+    df = pd.DataFrame({'Radius': radii, 'MatchRate': match_rate,
+                       'FalseRate': rate.mean(axis=0), 'FalseRateStd': rate.std(axis=0)})
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['Reliability'] = 1 - df['FalseRate'] / df['MatchRate']
+    return df
+
+
+def random_rotations(Y, n, min_shift, max_shift, rng):
+    """
+    Purpose
+        Draw n rotations of the sphere, each moving the center of the unit vectors Y
+        by a random angle between min_shift and max_shift (in degrees) in a random direction.
+        The other sources of a field move by nearly the same angle.
+    ---------------------
+    Return
+        rotations    [ndarray]: the rotation matrices, shape(n, 3, 3).
+    """
+    center = Y.mean(axis=0) if len(Y) > 0 else np.array([1., 0., 0.])
+    center = center / np.linalg.norm(center)
+    # two unit vectors perpendicular to the center
+    east = np.cross([0., 0., 1.], center)
+    if np.linalg.norm(east) < 1e-12:
+        east = np.array([0., 1., 0.])
+    east = east / np.linalg.norm(east)
+    north = np.cross(center, east)
+
+    angle = np.deg2rad(np.sqrt(rng.uniform(min_shift**2, max_shift**2, n)))  # uniform in the annulus
+    direction = rng.uniform(0, 2 * np.pi, n)
+    axis = np.cos(direction)[:, None] * north - np.sin(direction)[:, None] * east
+    return axis_rotation(axis, angle)
+
+
+def axis_rotation(axis, angle):
+    # rotation matrices about the unit axes by the angles (in radians), Rodrigues' formula
+    K = np.zeros((len(axis), 3, 3))
+    K[:, 0, 1], K[:, 0, 2], K[:, 1, 2] = -axis[:, 2], axis[:, 1], -axis[:, 0]
+    K = K - K.transpose(0, 2, 1)
+    sin, cos = np.sin(angle)[:, None, None], np.cos(angle)[:, None, None]
+    return np.eye(3) + sin * K + (1 - cos) * K @ K
+
+
+def init_worker(Y1, index2, max_y):
+    # keep the catalogs and the tree in the worker process, sent once per process
+    worker_data['Y1'] = Y1
+    worker_data['index2'] = index2
+    worker_data['max_y'] = max_y
+
+
+def nearest_shifted(rotations):
+    """
+    Purpose
+        Nearest chord distance of each shifted source for a batch of rotations,
+        stacked into one query of the tree. Sources without a counterpart within
+        the largest radius get inf.
+    ---------------------
+    Return
+        chord        [ndarray]: shape(len(rotations), N1).
+    """
+    Y1 = worker_data['Y1']
+    Y_shift = np.einsum('rij,nj->rni', rotations, Y1).reshape(-1, 3)
+    chord, _ = worker_data['index2'].query_nearest(Y_shift, worker_data['max_y'])
+    return chord.reshape(len(rotations), len(Y1))
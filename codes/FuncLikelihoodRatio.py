@@ -0,0 +1,183 @@
+"""
+File: FuncLikelihoodRatio.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to identify the counterparts of a crossmatch by the
+likelihood ratio (Sutherland & Saunders 1992; Ciliegi et al. 2003),
+instead of the nearest candidate within the radius.
+
+The likelihood ratio of a candidate at separation r with magnitude m is
+    LR = q(m) f(r) / n(m),
+with f(r) the Gaussian distribution of the positional errors, n(m) the
+surface density of the background sources of magnitude m, and q(m) the
+magnitude distribution of the true counterparts. The reliability of a
+candidate is LR / (sum of the LR of the candidates of its source + 1 - Q),
+with Q the fraction of the sources with a counterpart.
+
+Everything works on the flat candidate pairs of crossmatch_angular:
+the local background density around each source is counted in an
+annulus with the KD tree of the target catalog, the magnitude
+distributions are histograms, and the LR, reliabilities and chance
+probabilities of all the pairs are computed in bulk.
+"""
+import numpy as np
+
+# my own packing
+import FuncTableCrossmatch as tc
+
+
+def likelihood_ratio(X1, X2, offset, ind, sep, radius, mag2=None, err1=0., err2=0., background_radius=60.,
+                     bins=20, Q=None, min_sigma=0.1):
+    """
+    Purpose
+        Compute the likelihood ratio, reliability and chance probability of the candidate pairs.
+    ---------------------
+    Input Parameter
+        X1             [array]: first dataset (the sources), shape(N1, 2), RA and DEC in degrees.
+        X2             [array]: second dataset (the targets), shape(N2, 2), RA and DEC in degrees,
+                                or its prebuilt CatalogIndex.
+        offset       [ndarray]: the CSR offsets of the candidates of each source, length N1+1.
+        ind          [ndarray]: the flat indices of the candidates in X2.
+        sep          [ndarray]: the separation of each pair, in arcsec.
+        radius         [float]: the search radius of the candidates, in arcsec.
+        mag2         [ndarray]: optional, the magnitude of each X2 target, length N2 (NaN if unknown).
+                                By default, the LR only depends on the positions.
+        err1, err2     [array]: optional, the 1-sigma positional errors (in arcsec) of each
+                                source and target, or a number. They are added in quadrature.
+        background_radius [float]: optional, the outer radius of the annulus (between radius
+                                and background_radius, in arcsec) of the local background density.
+        bins        [int/list]: optional, the magnitude bins of the histograms (as np.histogram).
+        Q              [float]: optional, the fraction of the sources with a counterpart.
+                                By default, it is estimated from the magnitude distributions.
+        min_sigma      [float]: optional, the smallest positional error of a pair, in arcsec.
+    ---------------------
+    Return
+        columns         [dict]: the per-pair arrays 'LR', 'Reliability' and 'P_chance'
+                                (the Poisson probability of a background source as bright
+                                within the separation, Downes et al. 1986).
+        Q              [float]: the fraction of the sources with a counterpart.
+    """
+    Y1 = tc.radec_to_xyz(X1)
+    index2 = X2 if isinstance(X2, tc.CatalogIndex) else tc.CatalogIndex.from_radec(X2)
+    n1 = len(Y1)
+    row = np.repeat(np.arange(n1), np.diff(offset))
+    sep = np.asarray(sep, dtype=float)
+
+    # local background density around each source, per arcsec^2
+    density = background_density(index2, Y1, radius, background_radius)
+    is_source = np.isfinite(Y1).all(axis=1)
+
+    # magnitude distributions of the background, n(m), and of the true counterparts, q(m)
+    if mag2 is None:
+        # one magnitude for all, so the ratio q(m) / n(m) is Q
+        mag2 = np.zeros(len(index2))
+    mag2 = np.asarray(mag2, dtype=float)
+    n_bg, q, Q = magnitude_distributions(mag2, ind, density[is_source], radius, bins, Q)
+    edges, p_bg = n_bg
+
+    # the pair terms, all at once
+    mag = mag2[ind]
+    has_mag = np.isfinite(mag)
+    ratio = np.full(len(ind), Q)
+    k = np.clip(np.searchsorted(edges, mag[has_mag], side='right') - 1, 0, len(p_bg) - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio[has_mag] = np.where(p_bg[k] > 0, q[k] / p_bg[k], 0.)
+    sigma2 = np.maximum(pair_values(err1, row, n1) ** 2 + pair_values(err2, ind, len(index2)) ** 2, min_sigma ** 2)
+    f = np.exp(-sep ** 2 / (2 * sigma2)) / (2 * np.pi * sigma2)
+    LR = ratio * f / density[row]
+
+    sum_lr = np.bincount(row, weights=LR, minlength=n1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reliability = np.where(LR > 0, LR / (sum_lr[row] + 1 - Q), 0.)
+
+    # fraction of the targets at least as bright as the candidate
+    mag_sorted = np.sort(mag2[np.isfinite(mag2)])
+    fraction = np.ones(len(ind))
+    if len(mag_sorted) > 0:
+        fraction[has_mag] = np.searchsorted(mag_sorted, mag[has_mag], side='right') / len(mag_sorted)
+    p_chance = 1 - np.exp(-np.pi * sep ** 2 * density[row] * fraction)
+    return {'LR': LR, 'Reliability': reliability, 'P_chance': p_chance}, Q
+
+
+def background_density(index2, Y1, radius, background_radius):
+    """
+    Purpose
+        Surface density (per arcsec^2) of the targets around each source, counted in the
+        annulus between radius and background_radius, so the counterpart is not counted.
+        At least one target is counted, so the density is never zero.
+    """
+    r_in = tc.angle_to_chord(radius / 3600)
+    r_out = tc.angle_to_chord(background_radius / 3600)
+    count = index2.count(Y1, r_out) - index2.count(Y1, r_in)
+    area = np.pi * (background_radius ** 2 - radius ** 2)
+    return np.maximum(count, 1) / area
+
+
+def magnitude_distributions(mag2, ind, density, radius, bins=20, Q=None):
+    """
+    Purpose
+        Histograms of the magnitude distributions:
+        the background n(m) from all the targets, and the true counterparts q(m) from the
+        candidates within radius after subtracting the expected background candidates.
+    ---------------------
+    Input Parameter
+        mag2         [ndarray]: the magnitude of each target.
+        ind          [ndarray]: the flat indices of the candidates.
+        density      [ndarray]: the background density (per arcsec^2) around each source.
+        radius         [float]: the search radius, in arcsec.
+        bins        [int/list]: optional, the magnitude bins.
+        Q              [float]: optional, the fraction of the sources with a counterpart.
+    ---------------------
+    Return
+        n_bg           [tuple]: the bin edges and the normalized background distribution (per mag).
+        q            [ndarray]: the distribution of the true counterparts (per mag), integrating to Q.
+        Q              [float]: the fraction of the sources with a counterpart.
+    """
+    finite = mag2[np.isfinite(mag2)]
+    edges = np.histogram_bin_edges(finite, bins=bins) if len(finite) > 0 else np.array([0., 1.])
+    width = np.diff(edges)
+    n_all = np.histogram(finite, bins=edges)[0].astype(float)
+    p_bg = n_all / max(n_all.sum(), 1) / width
+
+    mag = mag2[ind]
+    n_total = np.histogram(mag[np.isfinite(mag)], bins=edges)[0]
+    # background candidates expected within radius of all the sources
+    n_expected = p_bg * width * np.sum(density) * np.pi * radius ** 2
+    n_real = np.clip(n_total - n_expected, 0, None)
+    if Q is None:
+        Q = min(n_real.sum() / max(len(density), 1), 1.)
+    q = n_real / n_real.sum() * Q / width if n_real.sum() > 0 else np.zeros(len(width))
+    return (edges, p_bg), q, Q
+
+
+def pair_values(values, ind, n):
+    # the per-row values (or a number) at the rows ind of the pairs, missing values as 0
+    values = np.broadcast_to(np.asarray(values, dtype=float), (n,))
+    return np.nan_to_num(values[ind])
+
+
+def best_reliability(offset, ind, sep, columns, min_reliability=0.):
+    """
+    Purpose
+        Keep the most reliable candidate of each source, as an alternative to
+        tc.nearest_pairs. Ties keep the nearest candidate.
+    ---------------------
+    Input Parameter
+        offset, ind, sep [ndarray]: the CSR-style arrays of the candidate pairs.
+        columns     [dict]: the per-pair arrays of likelihood_ratio.
+        min_reliability [float]: optional, the smallest reliability of a kept counterpart.
+    ---------------------
+    Return
+        offset, ind, sep [ndarray]: the CSR-style arrays with at most one match per source.
+        columns     [dict]: the per-pair arrays of the kept pairs.
+    """
+    n1 = len(offset) - 1
+    row = np.repeat(np.arange(n1), np.diff(offset))
+    reliability = columns['Reliability']
+    order = np.lexsort((sep, -reliability, row))
+    first = order[np.unique(row[order], return_index=True)[1]]
+    first = first[reliability[first] >= min_reliability] if min_reliability > 0 else first
+    offset_best = np.zeros(n1 + 1, dtype=np.intp)
+    np.cumsum(np.bincount(row[first], minlength=n1), out=offset_best[1:])
+    return offset_best, ind[first], sep[first], {col: values[first] for col, values in columns.items()}
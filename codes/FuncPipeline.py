@@ -0,0 +1,335 @@
+"""
+File: FuncPipeline.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to run the crossmatch stages as a DAG of tasks.
+
+Each task declares the files it reads (inputs) and writes (outputs).
+The dependencies follow the declaration order of the tasks, so the DAG
+gives the same result as running the tasks one after another:
+a task waits for the last task writing any of its inputs or outputs,
+and a task rewriting a file waits for the tasks reading the previous version.
+Ready tasks are run concurrently on a process pool. A serial run can
+instead share an in-memory CatalogStore between the tasks; while a task
+runs, the store prefetches the inputs of the next tasks in the background.
+
+With a build manifest, only the stale tasks are rerun: the tasks whose
+parameters changed, whose outputs are missing, whose source input files
+changed, or whose upstream tasks are rerun.
+"""
+import os
+import json
+import time
+import hashlib
+import inspect
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# my own packing
+import FuncCatalogIndex as ci
+
+
+# keyword arguments that only change how a task runs, not its outputs,
+# so they are left out of the task signature (e.g. a rerun with another chunksize)
+RUNTIME_KWARGS = ['chunksize', 'match_workers', 'n_workers', 'io_workers', 'store']
+
+
+class Task:
+    """
+    Purpose
+        One call of func(*args, **kwargs) in the pipeline.
+    ---------------------
+    Input Parameter
+        func        [function]: the function of the task, defined at the module level.
+        args           [tuple]: the positional arguments of func.
+        kwargs          [dict]: the keyword arguments of func.
+        inputs          [list]: the files read by the task.
+        outputs         [list]: the files written by the task.
+        name             [str]: optional, the name of the task.
+                                By default, func name and the first output filename.
+        stage            [str]: optional, the stage that the task belongs to.
+    """
+    def __init__(self, func, args=(), kwargs=None, inputs=(), outputs=(), name=None, stage=None):
+        self.func    = func
+        self.args    = tuple(args)
+        self.kwargs  = dict(kwargs or {})
+        self.inputs  = [fn for fn in inputs if fn is not None]
+        self.outputs = [fn for fn in outputs if fn is not None]
+        self.stage   = stage
+        if name is None:
+            name = func.__name__
+            if len(self.outputs) > 0:
+                name += ':' + os.path.splitext(os.path.basename(self.outputs[0]))[0]
+        self.name = name
+
+    def __repr__(self):
+        return 'Task(%s)'%(self.name)
+
+    def run(self, store=None):
+        kwargs = self.kwargs
+        if store is not None and 'store' in inspect.signature(self.func).parameters:
+            kwargs = dict(kwargs, store=store)
+        return self.func(*self.args, **kwargs)
+
+    def signature(self):
+        """
+        Hash of the function name and the arguments, e.g. radius, join type and columns,
+        except the runtime settings of RUNTIME_KWARGS.
+        """
+        kwargs = sorted((key, value) for key, value in self.kwargs.items() if key not in RUNTIME_KWARGS)
+        text = repr((self.func.__name__, self.args, kwargs))
+        return hashlib.sha1(text.encode()).hexdigest()
+
+
+def run_task(task, store=None):
+    # module-level function, so it can be sent to the worker processes
+    time_start = time.time()
+    task.run(store=store)
+    return time.time() - time_start
+
+
+class Pipeline:
+    """
+    Purpose
+        Collect the tasks of the pipeline and run them following their dependencies.
+    ---------------------
+    Input Parameter
+        store   [CatalogStore]: optional, the in-memory catalog store passed to the tasks
+                                taking a store argument, in a serial run.
+                                It is flushed to disk at the end of the run.
+        defaults        [dict]: optional, keyword arguments given to every task whose
+                                function takes them, unless the task sets them (e.g. chunksize).
+                                None values are skipped.
+        prefetch         [int]: optional, the number of upcoming tasks whose inputs are
+                                prefetched by the store (see CatalogStore.prefetch).
+    """
+    def __init__(self, store=None, defaults=None, prefetch=2):
+        self.tasks    = []
+        self.stage    = None
+        self.store    = store
+        self.defaults = dict(defaults or {})
+        self.prefetch = prefetch
+
+    def set_stage(self, stage):
+        """Set the stage of the tasks added afterwards."""
+        self.stage = stage
+
+    def add(self, func, *args, inputs=(), outputs=(), name=None, **kwargs):
+        """
+        Purpose
+            Add the task func(*args, **kwargs), which reads inputs and writes outputs.
+        """
+        params = inspect.signature(func).parameters
+        for key, value in self.defaults.items():
+            if value is not None and key in params and key not in kwargs:
+                kwargs[key] = value
+        task = Task(func, args, kwargs, inputs=inputs, outputs=outputs, name=name, stage=self.stage)
+        self.tasks.append(task)
+        return task
+
+    def dependencies(self):
+        """
+        Purpose
+            Build the DAG from the declared inputs and outputs.
+        ---------------------
+        Return
+            deps        [list]: deps[i] is the set of the task indices that task i waits for.
+        """
+        last_writer = {}    # file -> index of the last task writing it
+        readers = {}        # file -> indices of the tasks reading it since the last write
+        deps = []
+        for i, task in enumerate(self.tasks):
+            dep = set()
+            for fn in task.inputs:
+                if fn in last_writer:
+                    dep.add(last_writer[fn])
+            for fn in task.outputs:
+                if fn in last_writer:
+                    dep.add(last_writer[fn])
+                dep |= readers.get(fn, set())
+            dep.discard(i)
+            deps.append(dep)
+
+            for fn in task.inputs:
+                readers.setdefault(fn, set()).add(i)
+            for fn in task.outputs:
+                last_writer[fn] = i
+                readers[fn] = set()
+        return deps
+
+    def sources(self):
+        """
+        Purpose
+            Return source[i], the inputs of task i that no earlier task writes,
+            i.e. the catalogs coming from outside the pipeline.
+        """
+        written = set()
+        sources = []
+        for task in self.tasks:
+            sources.append([fn for fn in task.inputs if fn not in written])
+            written.update(task.outputs)
+        return sources
+
+    def upcoming_inputs(self, selected, n):
+        """
+        Purpose
+            Return the inputs of the task selected[n] and of the next prefetch tasks,
+            except the files that a task running before their reader rewrites.
+        """
+        written = set()
+        inputs = []
+        for i in selected[n:n + 1 + self.prefetch]:
+            inputs += [fn for fn in self.tasks[i].inputs if fn not in written and fn not in inputs]
+            written.update(self.tasks[i].outputs)
+        return inputs
+
+    def stale(self, manifest, force=False, only=None):
+        """
+        Purpose
+            Select the tasks to run.
+        ---------------------
+        Input Parameter
+            manifest    [dict]: the build manifest of the previous runs.
+            force       [bool]: optional, run all the tasks.
+            only        [list]: optional, only run (and force) the tasks of these stages or names,
+                                and the tasks depending on them, which would otherwise keep
+                                the results of their old outputs.
+        ---------------------
+        Return
+            is_stale    [list]: is_stale[i] is True if task i has to be run.
+        """
+        if force:
+            return [True] * len(self.tasks)
+
+        deps = self.dependencies()
+        if only:
+            is_stale = []
+            for i, task in enumerate(self.tasks):
+                is_stale.append(task.stage in only or task.name in only or any(is_stale[j] for j in deps[i]))
+            return is_stale
+
+        sources = self.sources()
+        is_stale = []
+        for i, task in enumerate(self.tasks):
+            entry = manifest['tasks'].get(task.name)
+            stale = entry is None or entry['signature'] != task.signature()
+            stale = stale or any(not os.path.exists(fn) for fn in task.outputs)
+            stale = stale or any(is_stale[j] for j in deps[i])
+            for fn in sources[i]:
+                if stale:
+                    break
+                state = manifest['files'].get(fn)
+                stale = state is None or file_state(fn, state)['hash'] != state['hash']
+            is_stale.append(stale)
+        return is_stale
+
+    def run(self, n_workers=1, fn_manifest=None, force=False, only=None):
+        """
+        Purpose
+            Run the tasks.
+            With n_workers > 1, the ready tasks are run concurrently on a process pool.
+        ---------------------
+        Input Parameter
+            n_workers    [int]: optional, the number of worker processes.
+            fn_manifest  [str]: optional, the build manifest (json). If given, only the
+                                stale tasks are run and the manifest is updated afterwards.
+            force       [bool]: optional, run all the tasks.
+            only        [list]: optional, only run the tasks of these stages or names,
+                                and the tasks depending on them.
+        """
+        manifest = read_manifest(fn_manifest)
+        if fn_manifest is not None or force or only:
+            is_stale = self.stale(manifest, force=force, only=only)
+        else:
+            is_stale = [True] * len(self.tasks)
+        selected = [i for i in range(len(self.tasks)) if is_stale[i]]
+        print('Run %d of %d tasks'%(len(selected), len(self.tasks)))
+
+        done = []
+        def record(i, time_task):
+            done.append((i, time_task))
+
+        try:
+            if n_workers is None or n_workers <= 1:
+                for n, i in enumerate(selected):
+                    if self.store is not None:
+                        self.store.prefetch(self.upcoming_inputs(selected, n))
+                    print('Run task %s'%(self.tasks[i].name))
+                    record(i, run_task(self.tasks[i], store=self.store))
+            else:
+                self.run_pool(selected, n_workers, record)
+        finally:
+            if self.store is not None:
+                self.store.flush()
+            if fn_manifest is not None:
+                # the source files are hashed once they are on disk
+                sources = self.sources()
+                for i, time_task in done:
+                    task = self.tasks[i]
+                    manifest['tasks'][task.name] = {'signature': task.signature(), 'outputs': task.outputs,
+                                                    'stage': task.stage, 'time': time_task}
+                    for fn in sources[i]:
+                        manifest['files'][fn] = file_state(fn, manifest['files'].get(fn))
+                write_manifest(manifest, fn_manifest)
+
+    def run_pool(self, selected, n_workers, record):
+        # run the selected tasks on a process pool, following their dependencies
+        deps = self.dependencies()
+        selected_set = set(selected)
+        remaining = {i: deps[i] & selected_set for i in selected}
+        dependents = {i: [] for i in selected}
+        for i in selected:
+            for j in remaining[i]:
+                dependents[j].append(i)
+
+        ready = [i for i in selected if len(remaining[i]) == 0]
+        running = {}
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            while ready or running:
+                for i in ready:
+                    print('Submit task %s'%(self.tasks[i].name))
+                    running[executor.submit(run_task, self.tasks[i])] = i
+                ready = []
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    try:
+                        time_task = future.result()
+                    except Exception:
+                        for f in running:
+                            f.cancel()
+                        print('Task %s failed'%(self.tasks[i].name))
+                        raise
+                    print('Finish task %s in %.1f s'%(self.tasks[i].name, time_task))
+                    record(i, time_task)
+                    for j in dependents[i]:
+                        remaining[j].discard(i)
+                        if len(remaining[j]) == 0:
+                            ready.append(j)
+
+
+def read_manifest(fn_manifest):
+    if fn_manifest is None or not os.path.exists(fn_manifest):
+        return {'tasks': {}, 'files': {}}
+    with open(fn_manifest) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, fn_manifest):
+    fn_tmp = fn_manifest + '.tmp'
+    with open(fn_tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(fn_tmp, fn_manifest)
+
+
+def file_state(fn, state=None):
+    """
+    Purpose
+        Return the content hash, size and mtime of a file.
+        The hash of state is reused if the size and mtime did not change.
+    """
+    stat = os.stat(fn)
+    if state is not None and (state['size'], state['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+        return state
+    return {'hash': ci.file_hash(fn), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
@@ -0,0 +1,316 @@
+"""
+File: FuncProfile.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to time the stages of the crossmatch pipeline.
+
+A stage is one call of a profiled function (e.g. do_merge_radec). Inside a
+stage, the phases (reading, index, query, one-to-one, merge, writing) are
+timed with the phase context manager around the library calls, and the
+row/column counts are added with record. The library modules themselves
+(e.g. FuncTableCrossmatch) have no profiling hooks. At the end of the stage, one json line with the phase
+times, the counts and the peak resident memory of the stage (see PeakMemory)
+is appended to the run report.
+A stage can also be run under cProfile.
+
+The profiling is off by default, and then the hooks do nothing. It is turned
+on with enable, which also turns it on in the worker processes started
+afterwards (through environment variables).
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+import inspect
+import threading
+import functools
+import contextlib
+import pandas as pd
+
+ENV_REPORT   = 'IRRC_PROFILE_REPORT'
+ENV_CPROFILE = 'IRRC_PROFILE_CPROFILE'
+
+# the stage being profiled in this process, and its open phases
+current = None
+phase_stack = []
+
+
+def enable(fn_report, cprofile=None):
+    """
+    Purpose
+        Turn on the profiling of this process and of the worker processes started afterwards.
+    ---------------------
+    Input Parameter
+        fn_report        [str]: the run report, one json line per stage is appended.
+        cprofile        [list]: optional, run the stages with these names or outputs under cProfile.
+                                The statistics are saved to <fn_report>.<stage>.prof.
+    """
+    os.environ[ENV_REPORT] = fn_report
+    if cprofile:
+        os.environ[ENV_CPROFILE] = ','.join(cprofile)
+    else:
+        os.environ.pop(ENV_CPROFILE, None)
+
+def disable():
+    os.environ.pop(ENV_REPORT, None)
+    os.environ.pop(ENV_CPROFILE, None)
+
+def is_enabled():
+    return ENV_REPORT in os.environ
+
+
+@contextlib.contextmanager
+def stage(name, output=None):
+    """
+    Purpose
+        Profile a stage, and append its json line to the run report.
+        Inside another stage, it is timed as a phase of that stage.
+    ---------------------
+    Input Parameter
+        name             [str]: the name of the stage, e.g. the function name.
+        output           [str]: optional, the output file of the stage.
+    """
+    global current
+    if not is_enabled():
+        yield
+        return
+    if current is not None:
+        with phase(name):
+            yield
+        return
+
+    label = os.path.splitext(os.path.basename(output))[0] if output else None
+    selected = os.environ.get(ENV_CPROFILE, '').split(',')
+    profiler = cProfile.Profile() if (name in selected or label in selected) else None
+
+    current = {'stage': name, 'output': label, 'pid': os.getpid(), 'start': time.time(),
+               'phases': {}, 'counts': {}}
+    phase_stack[:] = []
+    memory = PeakMemory().start()
+    time_start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record_stage, current = current, None
+        record_stage['time'] = time.perf_counter() - time_start
+        memory.stop()
+        record_stage['peak_rss_mb'] = memory.peak / 2**20
+        record_stage['delta_rss_mb'] = memory.delta / 2**20 if memory.delta is not None else None
+        record_stage['rss_method'] = memory.method
+        fn_report = os.environ[ENV_REPORT]
+        with open(fn_report, 'a') as f:
+            f.write(json.dumps(record_stage) + '\n')
+        if profiler is not None:
+            profiler.dump_stats('%s.%s.prof'%(fn_report, label or name))
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Purpose
+        Time a phase of the current stage. Nested phases are named by their path,
+        e.g. 'match/query', and the times of repeated phases (e.g. per chunk) are added up.
+    """
+    if current is None:
+        yield
+        return
+    phase_stack.append(name)
+    key = '/'.join(phase_stack)
+    time_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = current['phases']
+        phases[key] = phases.get(key, 0.) + time.perf_counter() - time_start
+        phase_stack.pop()
+
+def record(**counts):
+    """
+    Purpose
+        Add counts to the current stage, e.g. record(rows_f1=len(df1), cols_f1=df1.shape[1]).
+        Repeated counts (e.g. per chunk) are added up.
+    """
+    if current is None:
+        return
+    for key, value in counts.items():
+        current['counts'][key] = current['counts'].get(key, 0) + int(value)
+
+def record_df(name, df):
+    # rows and columns of a catalog
+    if current is not None and df is not None:
+        record(**{'rows_' + name: df.shape[0], 'cols_' + name: df.shape[1]})
+
+
+def timed_iter(name, iterable):
+    """
+    Purpose
+        Iterate over iterable, timing each next() as the phase name (e.g. reading a chunk).
+    """
+    iterator = iter(iterable)
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+# arguments holding the output file of a profiled function
+OUTPUT_ARGS = ['fn_bestmatch', 'fn_allmatch', 'fn_innerjoin', 'fn_match', 'fn_union', 'fn_out']
+
+def profiled(func):
+    """
+    Purpose
+        Decorator running each call of func as a stage.
+        The output of the stage is the first given argument among OUTPUT_ARGS.
+    """
+    params = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not is_enabled():
+            return func(*args, **kwargs)
+        bound = params.bind_partial(*args, **kwargs).arguments
+        output = next((bound[key] for key in OUTPUT_ARGS if bound.get(key) is not None), None)
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        with stage(func.__name__, output=output):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class PeakMemory:
+    """
+    Purpose
+        Measure the peak resident memory of the process between start and stop,
+        instead of the high-water mark of the whole process (ru_maxrss), which
+        repeats the peak of the largest stage in all the later stages of a serial run.
+        The method depends on the platform:
+        - 'hwm': on Linux, the high-water mark of the process is reset at start
+          (/proc/self/clear_refs) and read at stop (VmHWM), so every peak is counted.
+          The reset is for the whole process, so the measures must not be nested.
+        - 'sample': if the reset is not allowed, a thread samples the resident memory
+          every interval seconds, which can miss the peaks shorter than interval.
+        - 'process': without /proc (e.g. macOS), the high-water mark of the process.
+    ---------------------
+    Input Parameter
+        interval       [float]: optional, the sampling interval in seconds of 'sample'.
+    ---------------------
+    Attribute
+        peak             [int]: the peak resident memory in bytes.
+        delta            [int]: the peak above the resident memory at start, in bytes
+                                (None for 'process').
+        method           [str]: the method of the measure.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = self.delta = self.method = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.rss_start = current_rss()
+        self.thread = None
+        if self.rss_start is None:
+            self.method = 'process'
+        elif reset_peak_rss():
+            self.method = 'hwm'
+        else:
+            self.method = 'sample'
+            self.samples = [self.rss_start]
+            self.is_done = threading.Event()
+            self.thread = threading.Thread(target=self._sample, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.method == 'hwm':
+            self.peak = peak_rss()
+        elif self.method == 'sample':
+            self.is_done.set()
+            self.thread.join()
+            self.peak = max(max(self.samples), current_rss())
+        else:
+            self.peak = max_rss()
+        self.delta = max(self.peak - self.rss_start, 0) if self.rss_start is not None else None
+        return self
+
+    def _sample(self):
+        while not self.is_done.wait(self.interval):
+            self.samples.append(current_rss())
+
+
+def current_rss():
+    # resident memory of the process in bytes, None without /proc
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+def reset_peak_rss():
+    # reset the high-water mark of the resident memory (Linux), return whether it worked
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss():
+    # high-water mark of the resident memory in bytes since the last reset_peak_rss (Linux)
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return max_rss()
+
+def max_rss():
+    # peak resident memory of the whole process in bytes
+    import resource
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+def read_report(fn_report):
+    """
+    Purpose
+        Read the run report as a DataFrame, one row per stage,
+        with a column per phase ('phase:<name>') and per count.
+    """
+    rows = []
+    with open(fn_report) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                row = {key: entry.get(key) for key in ['stage', 'output', 'pid', 'start', 'time', 'peak_rss_mb',
+                                                       'delta_rss_mb']}
+                row.update({'phase:' + key: value for key, value in entry['phases'].items()})
+                row.update(entry['counts'])
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+def summary(fn_report):
+    """
+    Purpose
+        Summary table of the run report: the total time of each stage and of its top-level phases,
+        and the largest peak memory and increase of the memory of its calls.
+    """
+    df = read_report(fn_report)
+    if len(df) == 0:
+        return df
+    phase_cols = [col for col in df.columns if col.startswith('phase:') and '/' not in col]
+    agg = {'calls': ('time', 'size'), 'time': ('time', 'sum'), 'peak_rss_mb': ('peak_rss_mb', 'max'),
+           'delta_rss_mb': ('delta_rss_mb', 'max')}
+    agg.update({col[len('phase:'):]: (col, 'sum') for col in phase_cols})
+    table = df.groupby('stage').agg(**agg)
+    return table.sort_values('time', ascending=False)
@@ -2,17 +2,21 @@
 File: FuncTableCrossmatch.py
 Name: Chia-Lin Ko
 Create Date: Jun 09, 2021
-Last Modified Date: Jun 11, 2021
+Last Modified Date: Oct 18, 2026
 ------------------------
 This program aims to crossmatch tables.
 
 Modified from Zhen-Kai Gao's script
 Modified from astroML.crossmatch.crossmatch
 """
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 from scipy.spatial import cKDTree
-from scipy.spatial.distance import cdist
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 def crossmatch(X1, X2, max_distance=np.inf):
     """
@@ -26,6 +30,7 @@ def crossmatch(X1, X2, max_distance=np.inf):
         X2             [array]: second dataset, shape(N2, D2), D1 should be the same as D2.
         max_distance   [float]: optional, maximum radius of search.
                                 If no point is within the given radius, then inf will be returned.
+                                It can also be an array of the radius of each X1 row, length N1.
     ---------------------
     Return
         ind         [ndarrays]: The index of the closest point in X2 to each point in X1
@@ -33,20 +38,105 @@ def crossmatch(X1, X2, max_distance=np.inf):
                                 Locations with no match are indicated by ind[i] = []
     """
     X1 = np.asarray(X1, dtype=float)
-    X2 = np.asarray(X2, dtype=float)
+    index2 = X2 if isinstance(X2, CatalogIndex) else CatalogIndex(X2)
 
     N1, D1 = X1.shape
-    N2, D2 = X2.shape
+    N2, D2 = index2.data.shape
     if D1 != D2:
         raise ValueError('Arrays must have the same second dimension')
 
-    kdt = cKDTree(X2)
-    ind = kdt.query_ball_point(X1, r=max_distance)
+    ind = index2.query_ball(X1, max_distance)
     
     return ind
 
 
-def crossmatch_angular(X1, X2, max_distance=np.inf, return_dist=False):
+class CatalogIndex:
+    """
+    Purpose
+        KD tree over the finite rows of a dataset, which can be built once and 
+        reused by crossmatch, crossmatch_angular and crossmatch_angular_nearest.
+        Rows with non-finite coordinates (e.g. from an outer join) never match.
+        The radius r of the queries is a number, or an array with the radius of 
+        each query row (rows with a non-finite radius never match).
+    ---------------------
+    Input Parameter
+        data           [array]: dataset, shape(N, D).
+                                For angular matches, the unit vectors from radec_to_xyz.
+        tree         [cKDTree]: optional, prebuilt tree over data[rows].
+        rows         [ndarray]: optional, the index of the finite rows of data.
+    """
+    def __init__(self, data, tree=None, rows=None):
+        data = np.asarray(data, dtype=float)
+        if rows is None:
+            rows = np.flatnonzero(np.isfinite(data).all(axis=1))
+        if tree is None:
+            tree = cKDTree(data[rows])
+        self.data = data
+        self.rows = rows
+        self.tree = tree
+
+    @classmethod
+    def from_radec(cls, X):
+        """Build the index of RA/DEC (in degrees) on the unit sphere."""
+        return cls(radec_to_xyz(X))
+
+    def __len__(self):
+        return len(self.data)
+
+    def query_ball(self, Y, r):
+        """
+        Return the index lists of the points within r of each row of Y, 
+        as cKDTree.query_ball_point.
+        """
+        valid, r = self._valid(Y, r)
+        ind = np.empty(len(Y), dtype='object')
+        for i in np.flatnonzero(~valid):
+            ind[i] = []
+        ind_valid = self.tree.query_ball_point(Y[valid], r=r)
+        # one list per element, since a list of equally long lists would become a 2D array
+        is_remap = len(self.rows) < len(self.data)
+        for i, ind_i in zip(np.flatnonzero(valid), ind_valid):
+            ind[i] = self.rows[ind_i].tolist() if is_remap else ind_i
+        return ind
+
+    def query_nearest(self, Y, r):
+        """
+        Return the distance and index of the nearest point within r of each row of Y.
+        Rows without a match are indicated by dist = inf and ind = -1.
+        """
+        dist = np.full(len(Y), np.inf)
+        ind = np.full(len(Y), -1, dtype=np.intp)
+        valid, r = self._valid(Y, r)
+        valid = np.flatnonzero(valid)
+        if len(valid) == 0 or len(self.rows) == 0:
+            return dist, ind
+        # same inclusive boundary as query_ball_point
+        d, i = self.tree.query(Y[valid], k=1, distance_upper_bound=np.nextafter(np.max(r), np.inf))
+        is_match = d <= r
+        dist[valid[is_match]] = d[is_match]
+        ind[valid[is_match]] = self.rows[i[is_match]]
+        return dist, ind
+
+    def count(self, Y, r):
+        """
+        Return the number of points within r of each row of Y.
+        """
+        count = np.zeros(len(Y), dtype=np.intp)
+        valid, r = self._valid(Y, r)
+        count[valid] = self.tree.query_ball_point(Y[valid], r=r, return_length=True)
+        return count
+
+    def _valid(self, Y, r):
+        # the query rows with finite coordinates and radius, and their radius
+        valid = np.isfinite(Y).all(axis=1)
+        if np.ndim(r) > 0:
+            r = np.asarray(r, dtype=float)
+            valid &= np.isfinite(r)
+            r = r[valid]
+        return valid, r
+
+
+def crossmatch_angular(X1, X2, max_distance=np.inf, return_dist=False, flat=False, n_workers=None):
     """
     Purpose
         Cross-match angular values between dataset X1 and X2.
@@ -62,53 +152,510 @@ def crossmatch_angular(X1, X2, max_distance=np.inf, return_dist=False):
         X2             [array]: second dataset, shape(N2, 2).
                                 X2[:, 0] is the RA in degrees.
                                 X2[:, 1] is the DEC in degrees.
+                                It can also be a prebuilt CatalogIndex of the unit vectors
+                                (see CatalogIndex.from_radec and FuncCatalogIndex.load_index).
         max_distance   [float]: optional, maximum radius of search, measured in degrees.
                                 If no point is within the given radius, then inf will be returned.
+                                It can also be an array of the radius of each X1 source (length N1),
+                                e.g. from the positional errors (see error_radius), which is
+                                still run as one query of the tree.
+                                It can also be a list of radii: the catalogs are then queried 
+                                once at the largest radius, and the pairs of each smaller radius 
+                                are filtered from it (see filter_radius).
         return_dist     [bool]: optional, If True, return the distance array,
                                 otherwise only return the index array (default)/
+        flat            [bool]: optional, If True, return flat CSR-style numeric arrays
+                                (offset, ind, (sep)) instead of per-source lists.
+                                The matches of X1[i] are ind[offset[i]:offset[i+1]],
+                                and sep is the separation of each pair in arcsec.
+        n_workers        [int]: optional, if > 1, match Dec zones of the sky concurrently
+                                on a process pool (see crossmatch_zones).
+                                The result is the same as the serial match.
     ---------------------
     Return
         ind, (dist) [ndarrays]: the index and angular distance of each pair.
                                 Locations with no match are indicated by dist[i] = inf, ind[i] = []
+        offset, ind, (sep)
+                    [ndarrays]: if flat is True, the CSR offsets (length N1+1),
+                                the flat matched indices and separations (in arcsec).
+        results         [list]: if max_distance is a list, the above result of each radius.
     """
-    # Convert the RA, Dec, and max_distance from deg to rad
-    X1 = np.deg2rad(X1)
-    X2 = np.deg2rad(X2)
-    max_distance = np.deg2rad(max_distance)
+    if isinstance(max_distance, (list, tuple)):
+        if flat:
+            offset, ind_flat, dist_flat = crossmatch_angular(X1, X2, np.max(max_distance), 
+                                                             return_dist=True, flat=True, n_workers=n_workers)
+            scale = 3600.   # the flat separations are in arcsec
+        else:
+            ind, dist = crossmatch_angular(X1, X2, np.max(max_distance), return_dist=True, n_workers=n_workers)
+            offset, ind_flat = ravel_ball(ind)
+            dist_flat = np.concatenate([d for i, d in zip(ind, dist) if len(i) > 0] + [np.zeros(0)])
+            scale = 1.
+        results = []
+        for radius in max_distance:
+            offset_r, ind_r, dist_r = filter_radius(offset, ind_flat, dist_flat, radius * scale)
+            if flat:
+                results.append((offset_r, ind_r, dist_r) if return_dist else (offset_r, ind_r))
+            else:
+                results.append(unravel_ball(offset_r, ind_r, dist_r, return_dist))
+        return results
 
     # Convert 2D RA/DEC to 3D cartesian coordinates
-    Y1 = np.transpose(np.vstack([np.cos(X1[:, 0]) * np.cos(X1[:, 1]),
-                                 np.sin(X1[:, 0]) * np.cos(X1[:, 1]),
-                                 np.sin(X1[:, 1])]))
-    Y2 = np.transpose(np.vstack([np.cos(X2[:, 0]) * np.cos(X2[:, 1]),
-                                 np.sin(X2[:, 0]) * np.cos(X2[:, 1]),
-                                 np.sin(X2[:, 1])]))
+    Y1 = radec_to_xyz(X1)
+    index2 = X2 if isinstance(X2, CatalogIndex) else CatalogIndex.from_radec(X2)
+    Y2 = index2.data
+    check_radius(max_distance, len(Y1))
 
     # Law of cosines to compute 3D distance
-    max_y = np.sqrt(2 - 2 * np.cos(max_distance))
-    ind = crossmatch(Y1, Y2, max_y)
-    
-    # Calculate distances
-    if return_dist:
-        def get_dist(y1, y2):
-            if len(y2) == 0:
-                dist = np.array([np.inf])
-            else:
-                y1 = np.broadcast_to(y1, y2.shape)
-                dist = np.diag(cdist(y1, y2))
-            return dist
-        dist = [get_dist(v, Y2[ind[i]]) for i, v in enumerate(Y1)]
-        dist = np.array(dist, dtype='object')
-
-        # Convert distances back to angles using the law of tangents
-        not_inf = np.vectorize(lambda x: ~np.isinf(x).any())(dist)
-        def convert_dist(d):
-            x = 0.5 * d
-            return (180. / np.pi * 2 * np.arctan2(x, np.sqrt(np.maximum(0, 1 - x ** 2))))
-        dist[not_inf] = np.array([convert_dist(i) for i in dist[not_inf]], dtype='object')        
-        return ind, dist    
+    max_y = angle_to_chord(max_distance)
+    if is_parallel(n_workers, max_distance):
+        offset, ind_flat, chord, _ = crossmatch_zones(Y1, Y2, max_distance, n_workers=n_workers)
+        if not (flat or return_dist):
+            return unravel_ball(offset, ind_flat)
     else:
+        ind = crossmatch(Y1, index2, max_y)
+        if not (flat or return_dist):
+            return ind
+
+        # Calculate distances of all pairs in bulk
+        offset, ind_flat = ravel_ball(ind)
+        chord = pair_chord(Y1, Y2, offset, ind_flat)
+    dist_flat = chord_to_angle(chord)
+
+    if flat:
+        if return_dist:
+            return offset, ind_flat, dist_flat * 3600.  # deg to arcsec
+        return offset, ind_flat
+
+    # Per-source distance arrays, kept for the list-based interface
+    return unravel_ball(offset, ind_flat, dist_flat, return_dist=True)
+
+
+def unravel_ball(offset, ind_flat, dist_flat=None, return_dist=False):
+    """
+    Purpose
+        Convert CSR-style arrays back into the per-source lists of crossmatch_angular.
+    ---------------------
+    Return
+        ind, (dist) [ndarrays]: the index lists and distance arrays of each source.
+                                Locations with no match are indicated by dist[i] = inf, ind[i] = []
+    """
+    n = len(offset) - 1
+    ind = np.empty(n, dtype='object')
+    for i in range(n):
+        ind[i] = ind_flat[offset[i]:offset[i+1]].tolist()
+    if not return_dist:
         return ind
+    dist = np.empty(n, dtype='object')
+    for i in range(n):
+        d = dist_flat[offset[i]:offset[i+1]]
+        dist[i] = d if len(d) > 0 else np.array([np.inf])
+    return ind, dist
+
+
+def filter_radius(offset, ind, sep, max_sep):
+    """
+    Purpose
+        Keep the pairs within a smaller radius, from the pairs of a match at a larger radius.
+        The order of the pairs is kept, so sorted pairs (sort_pairs) stay sorted.
+    ---------------------
+    Input Parameter
+        offset       [ndarray]: the CSR offsets, length N1+1.
+        ind          [ndarray]: the flat matched indices.
+        sep          [ndarray]: the separation of each pair.
+        max_sep        [float]: the smaller radius, in the same unit as sep,
+                                or an array of the radius of each pair.
+    ---------------------
+    Return
+        offset, ind, sep [ndarray]: the CSR-style arrays of the pairs within max_sep.
+    """
+    is_keep = sep <= max_sep
+    row = np.repeat(np.arange(len(offset) - 1), np.diff(offset))
+    count = np.bincount(row[is_keep], minlength=len(offset) - 1)
+    offset_keep = np.zeros(len(offset), dtype=np.intp)
+    np.cumsum(count, out=offset_keep[1:])
+    return offset_keep, ind[is_keep], sep[is_keep]
+
+
+def error_radius(err1, err2=0., n_sigma=3., min_distance=0., max_distance=np.inf):
+    """
+    Purpose
+        Matching radius from the positional errors of both sources of a pair,
+        n_sigma * sqrt(err1**2 + err2**2), clipped between a floor and a cap.
+        Missing errors count as zero, so the radius is then the floor.
+    ---------------------
+    Input Parameter
+        err1           [array]: the positional error of the first sources.
+        err2           [array]: optional, the positional error of the second sources,
+                                broadcast against err1.
+        n_sigma        [float]: optional, the radius in units of the combined error.
+        min_distance   [float]: optional, the floor of the radius.
+        max_distance   [float]: optional, the cap of the radius.
+    ---------------------
+    Return
+        radius       [ndarray]: the radius of each pair, in the unit of the errors.
+    """
+    err1 = np.nan_to_num(np.asarray(err1, dtype=float))
+    err2 = np.nan_to_num(np.asarray(err2, dtype=float))
+    return np.clip(n_sigma * np.hypot(err1, err2), min_distance, max_distance)
+
+
+def crossmatch_angular_error(X1, X2, err1, err2, n_sigma=3., min_distance=0., max_distance=np.inf, 
+                             n_workers=None):
+    """
+    Purpose
+        Cross-match X1 and X2 with the radius of each pair from the positional errors of 
+        both sources (see error_radius).
+        The tree is queried once, with the radius of each X1 source at the largest X2 error,
+        and the pairs are then filtered by their own radius.
+    ---------------------
+    Input Parameter
+        X1             [array]: first dataset, shape(N1, 2), RA and DEC in degrees.
+        X2             [array]: second dataset, shape(N2, 2), RA and DEC in degrees,
+                                or its prebuilt CatalogIndex.
+        err1           [array]: the positional error of the X1 sources, in degrees, length N1.
+        err2           [array]: the positional error of the X2 sources, in degrees, length N2.
+        n_sigma        [float]: optional, the radius in units of the combined error.
+        min_distance   [float]: optional, the floor of the radius, in degrees.
+        max_distance   [float]: optional, the cap of the radius, in degrees.
+        n_workers        [int]: optional, if > 1, match Dec zones of the sky concurrently.
+    ---------------------
+    Return
+        offset, ind, sep
+                    [ndarrays]: the CSR offsets (length N1+1), the flat matched indices
+                                and separations (in arcsec), as crossmatch_angular(..., flat=True).
+    """
+    err1 = np.broadcast_to(np.asarray(err1, dtype=float), (len(X1),))
+    err2 = np.asarray(err2, dtype=float)
+    err2_max = np.nan_to_num(err2).max() if np.size(err2) > 0 else 0.
+    radius1 = error_radius(err1, err2_max, n_sigma, min_distance, max_distance)
+    offset, ind, sep = crossmatch_angular(X1, X2, radius1, return_dist=True, flat=True, n_workers=n_workers)
+
+    row = np.repeat(np.arange(len(X1)), np.diff(offset))
+    err2_pair = err2[ind] if np.ndim(err2) > 0 else err2
+    radius_pair = error_radius(err1[row], err2_pair, n_sigma, min_distance, max_distance)
+    return filter_radius(offset, ind, sep, radius_pair * 3600)  # deg to arcsec
+
+
+def radec_to_xyz(X):
+    """
+    Purpose
+        Project RA/DEC (in degrees) onto unit vectors of the 3D sphere.
+    ---------------------
+    Input Parameter
+        X              [array]: dataset, shape(N, 2).
+                                X[:, 0] is the RA in degrees.
+                                X[:, 1] is the DEC in degrees.
+    ---------------------
+    Return
+        Y              [array]: the 3D cartesian coordinates, shape(N, 3).
+    """
+    X = np.deg2rad(np.asarray(X, dtype=float))
+    cos_dec = np.cos(X[:, 1])
+    return np.column_stack([np.cos(X[:, 0]) * cos_dec,
+                            np.sin(X[:, 0]) * cos_dec,
+                            np.sin(X[:, 1])])
+
+
+def angle_to_chord(angle):
+    """
+    Purpose
+        Convert angular distances (in degrees) to 3D chord lengths on the unit sphere,
+        using the law of cosines.
+    """
+    return np.sqrt(2 - 2 * np.cos(np.deg2rad(angle)))
+
+
+def chord_to_angle(chord):
+    """
+    Purpose
+        Convert 3D chord lengths on the unit sphere back to angular distances (in degrees),
+        using the law of tangents.
+    """
+    x = 0.5 * np.asarray(chord, dtype=float)
+    return 180. / np.pi * 2 * np.arctan2(x, np.sqrt(np.maximum(0, 1 - x ** 2)))
+
+
+def crossmatch_angular_nearest(X1, X2, max_distance=np.inf, n_workers=None):
+    """
+    Purpose
+        Find the nearest neighbour in X2 within max_distance for each source in X1,
+        together with the number of candidates within max_distance.
+        The result is in the same CSR-style layout as crossmatch_angular(..., flat=True),
+        with at most one match per source.
+    ---------------------
+    Input Parameter
+        X1             [array]: first dataset, shape(N1, 2), RA and DEC in degrees.
+        X2             [array]: second dataset, shape(N2, 2), RA and DEC in degrees,
+                                or its prebuilt CatalogIndex.
+        max_distance   [float]: optional, maximum radius of search, measured in degrees,
+                                or an array of the radius of each X1 source (length N1).
+        n_workers        [int]: optional, if > 1, match Dec zones of the sky concurrently
+                                on a process pool (see crossmatch_zones).
+    ---------------------
+    Return
+        offset       [ndarray]: the CSR offsets, length N1+1.
+        ind          [ndarray]: the index of the nearest X2 source of each matched X1 source.
+        sep          [ndarray]: the separation (in arcsec) of each match.
+        count        [ndarray]: the number of X2 sources within max_distance, length N1.
+    """
+    Y1 = radec_to_xyz(X1)
+    index2 = X2 if isinstance(X2, CatalogIndex) else CatalogIndex.from_radec(X2)
+    check_radius(max_distance, len(Y1))
+    return nearest_xyz(Y1, index2, max_distance, n_workers=n_workers)
+
+
+def nearest_xyz(Y1, index2, max_distance=np.inf, n_workers=None):
+    """
+    Purpose
+        crossmatch_angular_nearest of the unit vectors Y1 (from radec_to_xyz) 
+        against the CatalogIndex index2.
+    """
+    max_y = angle_to_chord(max_distance)
+
+    if is_parallel(n_workers, max_distance):
+        offset, ind, chord, count = crossmatch_zones(Y1, index2.data, max_distance, 
+                                                     nearest=True, n_workers=n_workers)
+        return offset, ind, chord_to_angle(chord) * 3600, count
+
+    chord, near = index2.query_nearest(Y1, max_y)
+    is_match = near >= 0
+    count = index2.count(Y1, max_y)
+
+    offset = np.zeros(len(Y1) + 1, dtype=np.intp)
+    np.cumsum(is_match, out=offset[1:])
+    ind = near[is_match]
+    sep = chord_to_angle(chord[is_match]) * 3600  # deg to arcsec
+    return offset, ind, sep, count
+
+
+def check_radius(max_distance, n1):
+    # a radius array has the radius of each source
+    if np.ndim(max_distance) > 0 and np.shape(max_distance) != (n1,):
+        raise ValueError('The radius array must have one radius per source, got shape %s for %d sources'
+                         %(np.shape(max_distance), n1))
+
+
+def is_parallel(n_workers, max_distance):
+    # the zones need a finite radius, smaller than the zones themselves
+    return n_workers is not None and n_workers > 1 and np.max(max_distance) < 1
+
+
+def crossmatch_zones(Y1, Y2, max_distance, nearest=False, n_workers=None, n_zones=None):
+    """
+    Purpose
+        Cross-match the unit vectors Y1 and Y2 zone by zone on a process pool.
+        The sky is split into Dec zones with the same number of Y1 sources,
+        and each zone is matched against the Y2 sources within the zone
+        padded by max_distance, so no pair across the zone boundaries is lost.
+    ---------------------
+    Input Parameter
+        Y1             [array]: first dataset, unit vectors of shape(N1, 3).
+        Y2             [array]: second dataset, unit vectors of shape(N2, 3).
+        max_distance   [float]: maximum radius of search, measured in degrees,
+                                or an array of the radius of each Y1 source.
+        nearest         [bool]: optional, If True, only keep the nearest match of each source,
+                                as crossmatch_angular_nearest.
+        n_workers        [int]: optional, the number of worker processes.
+                                By default, the number of cores.
+        n_zones          [int]: optional, the number of Dec zones. By default, 4 * n_workers.
+    ---------------------
+    Return
+        offset       [ndarray]: the CSR offsets, length N1+1.
+        ind          [ndarray]: the flat matched indices of Y2, in the order of the serial match.
+        chord        [ndarray]: the chord distance of each pair.
+        count        [ndarray]: if nearest is True, the number of Y2 sources within
+                                max_distance of each Y1 source, otherwise None.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    if n_zones is None:
+        n_zones = 4 * n_workers
+    max_y = angle_to_chord(max_distance)
+    dec1 = np.rad2deg(np.arcsin(np.clip(Y1[:, 2], -1, 1)))
+    dec2 = np.rad2deg(np.arcsin(np.clip(Y2[:, 2], -1, 1)))
+
+    # zones with the same number of Y1 sources, padded by the radius (and the rounding error)
+    valid1 = np.flatnonzero(np.isfinite(Y1).all(axis=1))
+    order = valid1[np.argsort(dec1[valid1], kind='stable')]
+    pad = np.max(max_distance) + 1e-9
+    rows1_lst, rows2_lst = [], []
+    for rows1 in np.array_split(order, n_zones):
+        if len(rows1) == 0:
+            continue
+        dec_min, dec_max = dec1[rows1[0]], dec1[rows1[-1]]
+        rows1_lst.append(np.sort(rows1))
+        rows2_lst.append(np.flatnonzero((dec2 >= dec_min - pad) & (dec2 <= dec_max + pad)))
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(crossmatch_zone, 
+                                    [Y1[rows1] for rows1 in rows1_lst], 
+                                    [Y2[rows2] for rows2 in rows2_lst],
+                                    [max_y[rows1] for rows1 in rows1_lst] if np.ndim(max_y) > 0 else itertools.repeat(max_y), 
+                                    itertools.repeat(nearest)))
+
+    # merge the pairs of the zones back into the order of Y1
+    n_match = np.zeros(len(Y1), dtype=np.intp)
+    count = np.zeros(len(Y1), dtype=np.intp) if nearest else None
+    for rows1, (n_match_zone, _, _, count_zone) in zip(rows1_lst, results):
+        n_match[rows1] = n_match_zone
+        if nearest:
+            count[rows1] = count_zone
+    offset = np.zeros(len(Y1) + 1, dtype=np.intp)
+    np.cumsum(n_match, out=offset[1:])
+    ind = np.empty(offset[-1], dtype=np.intp)
+    chord = np.empty(offset[-1])
+    for rows1, rows2, (n_match_zone, ind_zone, chord_zone, _) in zip(rows1_lst, rows2_lst, results):
+        start_zone = np.cumsum(n_match_zone) - n_match_zone
+        pos = np.repeat(offset[rows1] - start_zone, n_match_zone) + np.arange(len(ind_zone))
+        ind[pos] = rows2[ind_zone]
+        chord[pos] = chord_zone
+    return offset, ind, chord, count
+
+
+def crossmatch_zone(Y1, Y2, max_y, nearest=False):
+    # match one zone, module-level function so it can be sent to the worker processes
+    index2 = CatalogIndex(Y2)
+    if nearest:
+        chord, near = index2.query_nearest(Y1, max_y)
+        is_match = near >= 0
+        return is_match.astype(np.intp), near[is_match], chord[is_match], index2.count(Y1, max_y)
+    offset, ind = ravel_ball(index2.query_ball(Y1, max_y))
+    return np.diff(offset), ind, pair_chord(Y1, Y2, offset, ind), None
+
+
+def sort_pairs(offset, ind, sep):
+    """
+    Purpose
+        Sort the matches of each source by separation (nearest first).
+    ---------------------
+    Return
+        ind, sep     [ndarray]: the flat matched indices and separations, sorted within each source.
+    """
+    row = np.repeat(np.arange(len(offset) - 1), np.diff(offset))
+    order = np.lexsort((sep, row))
+    return ind[order], sep[order]
+
+
+def nearest_pairs(offset, ind, sep):
+    """
+    Purpose
+        Keep only the first match of each source, 
+        which is the nearest one if the pairs are sorted by sort_pairs.
+    ---------------------
+    Return
+        offset, ind, sep [ndarray]: the CSR-style arrays with at most one match per source.
+    """
+    has_match = np.diff(offset) > 0
+    first = offset[:-1][has_match]
+    offset_best = np.zeros(len(offset), dtype=np.intp)
+    np.cumsum(has_match, out=offset_best[1:])
+    return offset_best, ind[first], sep[first]
+
+
+def one_to_one(offset, ind, sep, method='greedy'):
+    """
+    Purpose
+        Resolve the matches to one-to-one pairs, so that a source of either dataset
+        is the best match of at most one source of the other.
+        With method 'greedy', the pairs are assigned nearest first over the whole pair list:
+        a pair is kept if neither of its sources is in a nearer kept pair.
+        It is one pass over the pairs sorted by separation, O(P log P) for P pairs.
+        With method 'mutual', only the pairs of mutual nearest neighbours are kept.
+    ---------------------
+    Input Parameter
+        offset   [ndarray]: the CSR offsets, length N1+1.
+        ind      [ndarray]: the flat matched indices of the second dataset.
+        sep      [ndarray]: the separation of each pair.
+        method       [str]: optional, 'greedy' (default) or 'mutual'.
+    ---------------------
+    Return
+        offset, ind, sep [ndarray]: the CSR-style arrays with at most one match per source,
+                                    and each index of the second dataset at most once.
+    """
+    if method not in ['greedy', 'mutual']:
+        raise ValueError('Unknown one-to-one method %s'%(method))
+    n1 = len(offset) - 1
+    row = np.repeat(np.arange(n1), np.diff(offset))
+
+    # pairs sorted by separation, the ties by the rows of both datasets
+    order = np.lexsort((ind, row, sep))
+    row_sorted, col_sorted = row[order], ind[order]
+    if method == 'greedy':
+        is_keep = greedy_pairs(row_sorted, col_sorted)
+    else:
+        is_keep = mutual_pairs(row_sorted, col_sorted)
+
+    keep = np.sort(order[is_keep])
+    offset_keep = np.zeros(n1 + 1, dtype=np.intp)
+    np.cumsum(np.bincount(row[keep], minlength=n1), out=offset_keep[1:])
+    return offset_keep, ind[keep], sep[keep]
+
+
+def greedy_pairs(row_sorted, col_sorted):
+    # keep each pair (in the sorted order) whose sources are both still unused,
+    # with bytearray masks, which are faster than numpy arrays element by element
+    n1 = int(row_sorted.max()) + 1 if len(row_sorted) > 0 else 0
+    n2 = int(col_sorted.max()) + 1 if len(col_sorted) > 0 else 0
+    is_used1 = bytearray(n1)
+    is_used2 = bytearray(n2)
+    keep = []
+    for k, (i, j) in enumerate(zip(row_sorted.tolist(), col_sorted.tolist())):
+        if not (is_used1[i] or is_used2[j]):
+            is_used1[i] = is_used2[j] = 1
+            keep.append(k)
+    is_keep = np.zeros(len(row_sorted), dtype=bool)
+    is_keep[keep] = True
+    return is_keep
+
+
+def mutual_pairs(row_sorted, col_sorted):
+    # keep the pairs that are the nearest (first sorted) pair of both of their sources
+    first1 = np.unique(row_sorted, return_index=True)[1]
+    first2 = np.unique(col_sorted, return_index=True)[1]
+    is_keep = np.zeros(len(row_sorted), dtype=bool)
+    is_keep[first1] = True
+    is_first2 = np.zeros(len(row_sorted), dtype=bool)
+    is_first2[first2] = True
+    return is_keep & is_first2
+
+
+def slice_rows(offset, ind, sep, start, stop):
+    """
+    Purpose
+        Return the CSR-style arrays of the sources start to stop (e.g. a chunk of rows).
+    """
+    lo, hi = offset[start], offset[stop]
+    return offset[start:stop + 1] - lo, ind[lo:hi], sep[lo:hi]
+
+
+def ravel_ball(ind):
+    """
+    Purpose
+        Flatten the per-source index lists returned by crossmatch into CSR-style arrays.
+    ---------------------
+    Input Parameter
+        ind         [ndarrays]: the index lists of each source, length N1.
+    ---------------------
+    Return
+        offset       [ndarray]: the CSR offsets, length N1+1.
+                                The matches of source i are ind_flat[offset[i]:offset[i+1]].
+        ind_flat     [ndarray]: the flat matched indices.
+    """
+    count = np.fromiter(map(len, ind), dtype=np.intp, count=len(ind))
+    offset = np.zeros(len(ind) + 1, dtype=np.intp)
+    np.cumsum(count, out=offset[1:])
+    ind_flat = np.fromiter(itertools.chain.from_iterable(ind), dtype=np.intp, count=offset[-1])
+    return offset, ind_flat
+
+
+def pair_chord(Y1, Y2, offset, ind_flat):
+    """
+    Purpose
+        Compute the 3D chord length of every (Y1, Y2) pair given in CSR-style arrays.
+    """
+    row = np.repeat(np.arange(len(offset) - 1), np.diff(offset))
+    diff = Y1[row] - Y2[ind_flat]
+    return np.sqrt(np.einsum('ij,ij->i', diff, diff))
 
 
 def ravel_list(lst):
@@ -142,48 +689,294 @@ def merge_df(df1, df2, ind, dist=None):
                             If the row number of merged dataset is different from the row number of df1, 
                             then thes new column 'Count' will be added to the returned merged dataset.
     """
-    
-    # Left ind for merge
-    rep = [max(len(i), 1) for i in ind]
-    left_ind = np.repeat(np.arange(len(df1)), rep)    
-    # Right ind for merge
-    df2 = df2.copy()
-    df2.loc[df2.index.max() + 1] = None
-    right_ind = ravel_list([i if len(i) > 0 else [df2.index.max()] for i in ind])    
-    # Merge
-    mdf = pd.merge(left=df1.iloc[left_ind].reset_index(drop=True), 
-                   right=df2.iloc[right_ind].reset_index(drop=True),
-                   left_index=True, right_index=True, suffixes=['_1', '_2'])   
-    if 'Unnamed: 0' in mdf.columns:
-        mdf.drop(mdf.columns[mdf.columns.str.contains('unnamed',case = False)],axis = 1, inplace = True)
+    offset, ind_flat = ravel_ball(ind)
+    sep = None
+    if dist is not None:
+        has_match = np.diff(offset) > 0
+        sep = [np.asarray(d, dtype=float) for d in itertools.compress(dist, has_match)]
+        sep = np.concatenate(sep) * 3600 if len(sep) > 0 else np.empty(0)  # deg to arcsec
+    return merge_flat(df1, df2, offset, ind_flat, sep)
+
+
+def merge_flat(df1, df2, offset, ind, sep=None, count=None, add_count=None, pair_columns=None):
+    """
+    Purpose
+        Merge the dataframe df1 and df2 from the flat CSR-style arrays
+        returned by crossmatch_angular(..., flat=True).
+        Join type is All from df1. 
+        Match selection is All matches.
+    ---------------------
+    Input Parameter
+        df1    [DataFrame]: first dataset.
+        df2    [DataFrame]: second dataset.
+        offset   [ndarray]: the CSR offsets, length len(df1)+1.
+        ind      [ndarray]: the flat matched indices of df2.
+        sep      [ndarray]: (optional), the separation (in arcsec) of each pair.
+                            If given, then the new column 'Separation' (in arcsec) will be 
+                            added to the returned merged dataset.
+        count    [ndarray]: (optional), the number of candidates of each df1 source.
+                            By default, it is the number of matches given by offset.
+        add_count   [bool]: (optional), if True, always add the column 'Count',
+                            e.g. so the chunks of a streamed catalog have the same columns.
+        pair_columns [dict]: (optional), more columns with a value per pair
+                            (e.g. the 'LR' and 'Reliability' of FuncLikelihoodRatio),
+                            added after 'Separation'.
+    ---------------------
+    Return
+        mfd    [DataFrame]: the merge dataset. 
+                            Unmatched rows of df1 are filled with missing values.
+                            If any df1 source has more than one candidate,
+                            then thes new column 'Count' will be added to the returned merged dataset.
+    """
+    left_ind, right_ind = pair_indexers(offset, ind)
+    mdf = join_rows(df1, df2, left_ind, right_ind)
 
     # Column: Separation 
-    if dist is not None:    
-        dist = dist*3600  # deg to arcsec
-        sep = ravel_list([set_low_values_to_zero(i, tol=1e-9) for i in dist])
-        # if 'Separation' in mdf.columns:
-        #     sep_id      = mdf.columns.str.contains('Separation', case = False).sum()
-        #     column_sep  = 'Separation' + '_%s'%(sep_id)
-        # else:
-        column_sep  = 'Separation'
-        mdf[column_sep] = sep
-        mdf[column_sep].replace(np.inf, np.nan, inplace=True)
-        mdf.sort_values(by=[mdf.columns[0], column_sep])
-        
+    if sep is not None:
+        column_sep = 'Separation'
+        sep_all = np.full(len(right_ind), np.nan)
+        sep_all[right_ind >= 0] = set_low_values_to_zero(np.array(sep, dtype=float), tol=1e-9)
+        mdf[column_sep] = sep_all
+
+    # Columns of the pairs
+    for column, values in (pair_columns or {}).items():
+        values_all = np.full(len(right_ind), np.nan)
+        values_all[right_ind >= 0] = values
+        mdf[column] = values_all
+
     # Column: Count 
-    if df1.shape[0] != mdf.shape[0]:
-        rep0 = [max(len(i), 0) for i in ind]
-        count = np.repeat(rep0, rep)
-        # if 'Count' in mdf.columns:
-        #     count_id      = mdf.columns.str.contains('Count', case = False).sum()
-        #     column_count  = 'Count' + '_%s'%(count_id)
-        # else:
-        column_count  = 'Count'
-        mdf[column_count] = count
+    if count is None:
+        count = np.diff(offset)
+    if add_count or (add_count is None and (count > 1).any()):
+        column_count = 'Count'
+        mdf[column_count] = count[left_ind].astype(np.int32)
 
     return mdf
 
 
+def crossmatch_multi(df_ref, col_ra, col_dec, specs, how='left', n_workers=None):
+    """
+    Purpose
+        Best-match one reference catalog against several catalogs in a single pass.
+        The reference coordinates are converted to unit vectors once, every
+        catalog index is queried with them, and the best matches are gathered 
+        into one wide table.
+    ---------------------
+    Input Parameter
+        df_ref     [DataFrame]: the reference catalog.
+        col_ra           [str]: the column name of RA (in degrees) of the reference catalog.
+        col_dec          [str]: the column name of DEC (in degrees) of the reference catalog.
+        specs           [list]: (df, col_ra, col_dec, radius, suffix) of each catalog,
+                                with the radius in arcsec. An optional sixth item is the 
+                                prebuilt CatalogIndex of the catalog (e.g. FuncCatalogIndex.load_index).
+        how              [str]: optional, 'left' keeps all the reference sources (default),
+                                'inner' only keeps the sources matched in every catalog.
+        n_workers        [int]: optional, the number of worker processes of each match
+                                (see crossmatch_zones).
+    ---------------------
+    Return
+        mdf        [DataFrame]: the reference catalog followed by the best-match columns of each
+                                catalog, and its 'Separation_<suffix>' (in arcsec) and 
+                                'Count_<suffix>' (number of candidates) columns.
+                                Column names already in the table get '_<suffix>' appended.
+    """
+    df_ref = drop_unnamed(df_ref)
+    Y1 = radec_to_xyz(df_ref[[col_ra, col_dec]].values)
+
+    names = list(df_ref.columns)
+    columns = [df_ref.iloc[:, i].values for i in range(df_ref.shape[1])]
+    is_keep = np.ones(len(df_ref), dtype=bool)
+    for spec in specs:
+        df, ra, dec, radius, suffix = spec[:5]
+        index = spec[5] if len(spec) > 5 else CatalogIndex.from_radec(df[[ra, dec]].values)
+        offset, ind, sep, count = nearest_xyz(Y1, index, radius / 3600, n_workers=n_workers)
+        has_match = np.diff(offset) > 0
+        right_ind = np.full(len(df_ref), -1, dtype=np.intp)
+        right_ind[has_match] = ind
+        sep_all = np.full(len(df_ref), np.nan)
+        sep_all[has_match] = set_low_values_to_zero(np.array(sep, dtype=float), tol=1e-9)
+        is_keep &= has_match
+
+        df = drop_unnamed(df)
+        used = set(names)
+        names += [c + '_' + suffix if c in used else c for c in df.columns]
+        names += ['Separation_' + suffix, 'Count_' + suffix]
+        columns += take_rows(df, right_ind) + [sep_all, count.astype(np.int32)]
+
+    mdf = pd.DataFrame(dict(zip(range(len(columns)), columns)), index=pd.RangeIndex(len(df_ref)))
+    mdf.columns = names
+    if how == 'inner':
+        mdf = mdf[is_keep].reset_index(drop=True)
+    return mdf
+
+
+def catalog_union(specs, radius):
+    """
+    Purpose
+        Merge overlapping catalogs (e.g. several 24um catalogs) into one deduplicated
+        master catalog. The positions of all the catalogs go into one KD tree, and a single
+        pair search finds the duplicates within radius, within and across the catalogs.
+        The duplicates are grouped by connected components, so a chain of duplicates
+        (A-B, B-C) is kept as one source even if A and C are farther apart than radius.
+    ---------------------
+    Input Parameter
+        specs           [list]: (df, col_ra, col_dec, name) of each catalog, by priority.
+                                The position of a master source is the one of its 
+                                first member in the highest-priority catalog.
+        radius         [float]: the duplicate radius, in arcsec.
+    ---------------------
+    Return
+        mdf        [DataFrame]: one row per master source, in the order of the catalogs:
+                                'ID_union', 'ra_union', 'dec_union' (degrees),
+                                'catalog_union' (name of the catalog of the position),
+                                'n_union' (number of members),
+                                'n_<name>' (number of members from each catalog),
+                                followed by the columns of each catalog, from its member 
+                                nearest to the master position, and its 'Separation_<name>' 
+                                (in arcsec). Column names already in the table get '_<name>' appended.
+    """
+    X = np.concatenate([df[[ra, dec]].values.astype(float) for df, ra, dec, name in specs] + [np.zeros((0, 2))])
+    cat = np.concatenate([np.full(len(spec[0]), k) for k, spec in enumerate(specs)] + [np.zeros(0, dtype=int)])
+    row = np.concatenate([np.arange(len(spec[0])) for spec in specs] + [np.zeros(0, dtype=int)])
+    n = len(X)
+
+    # one pair search over all the catalogs, and the groups of duplicates
+    index = CatalogIndex.from_radec(X)
+    pairs = index.tree.query_pairs(angle_to_chord(radius / 3600), output_type='ndarray')
+    pairs = index.rows[pairs].reshape(-1, 2)
+    graph = coo_matrix((np.ones(len(pairs), dtype=bool), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    n_group, group = connected_components(graph, directed=False)
+    # the groups are labelled in the order of their first member
+    first = np.unique(group, return_index=True)[1]
+
+    names = [spec[3] for spec in specs]
+    mdf = pd.DataFrame({'ID_union': np.arange(n_group), 'ra_union': X[first, 0], 'dec_union': X[first, 1],
+                        'catalog_union': pd.Categorical.from_codes(cat[first], categories=names),
+                        'n_union': np.bincount(group, minlength=n_group)})
+    Y = index.data
+    Y_union = Y[first]
+    columns = []
+    for k, (df, ra, dec, name) in enumerate(specs):
+        member = np.flatnonzero(cat == k)
+        mdf['n_' + name] = np.bincount(group[member], minlength=n_group)
+
+        # the member nearest to the master position
+        chord = np.sqrt(((Y[member] - Y_union[group[member]]) ** 2).sum(axis=1))
+        order = np.lexsort((chord, group[member]))
+        group_k, first_k = np.unique(group[member][order], return_index=True)
+        right_ind = np.full(n_group, -1, dtype=np.intp)
+        right_ind[group_k] = row[member][order][first_k]
+        sep = np.full(n_group, np.nan)
+        sep[group_k] = set_low_values_to_zero(chord_to_angle(chord[order][first_k]) * 3600, tol=1e-9)
+        columns.append((drop_unnamed(df), right_ind, sep, name))
+
+    names = list(mdf.columns)
+    values = [mdf[col].values for col in names]
+    for df, right_ind, sep, name in columns:
+        used = set(names)
+        names += [c + '_' + name if c in used else c for c in df.columns] + ['Separation_' + name]
+        values += take_rows(df, right_ind) + [sep]
+    mdf = pd.DataFrame(dict(zip(range(len(values)), values)), index=pd.RangeIndex(n_group))
+    mdf.columns = names
+    return mdf
+
+
+def pair_indexers(offset, ind):
+    """
+    Purpose
+        Build the positional row indexers of an all-match join from CSR-style arrays.
+    ---------------------
+    Input Parameter
+        offset   [ndarray]: the CSR offsets, length N1+1.
+        ind      [ndarray]: the flat matched indices.
+    ---------------------
+    Return
+        left_ind  [ndarray]: the row of the first dataset for each output row.
+        right_ind [ndarray]: the row of the second dataset for each output row,
+                             -1 for the unmatched rows.
+    """
+    count = np.diff(offset)
+    rep = np.maximum(count, 1)
+    left_ind = np.repeat(np.arange(len(count)), rep)
+    right_ind = np.full(len(left_ind), -1, dtype=np.intp)
+    right_ind[np.repeat(count > 0, rep)] = ind
+    return left_ind, right_ind
+
+
+def merge_indexers(key1, key2, how='inner'):
+    """
+    Purpose
+        Build the positional row indexers of a merge on key values, 
+        in the same row order as pd.merge, without gathering the other columns.
+    ---------------------
+    Input Parameter
+        key1     [Series]: the key values of the first dataset.
+        key2     [Series]: the key values of the second dataset.
+        how         [str]: optional, the join type of pd.merge ('inner', 'left', 'right' or 'outer').
+    ---------------------
+    Return
+        left_ind  [ndarray]: the row of the first dataset for each output row, -1 if none.
+        right_ind [ndarray]: the row of the second dataset for each output row, -1 if none.
+        key       [ndarray]: the key of each output row, from either dataset.
+    """
+    left = pd.DataFrame({'key': np.asarray(key1), 'left_ind': np.arange(len(key1))})
+    right = pd.DataFrame({'key': np.asarray(key2), 'right_ind': np.arange(len(key2))})
+    mdf = left.merge(right, on='key', how=how)
+    left_ind = mdf['left_ind'].fillna(-1).values.astype(np.intp)
+    right_ind = mdf['right_ind'].fillna(-1).values.astype(np.intp)
+    return left_ind, right_ind, mdf['key'].values
+
+
+def take_rows(df, indexer):
+    """
+    Purpose
+        Gather the rows of df by position, one column at a time.
+        Rows with indexer -1 are filled with missing values (NaN, or <NA> for 
+        integer and boolean columns) instead of appending a sentinel row.
+        Integer columns keep their width (e.g. int16 becomes Int16).
+    ---------------------
+    Return
+        columns     [list]: the gathered column arrays, in the order of df.columns.
+    """
+    allow_fill = bool((indexer < 0).any())
+    columns = []
+    for i in range(df.shape[1]):
+        values = df.iloc[:, i].values
+        if allow_fill and isinstance(values, np.ndarray):
+            if values.dtype.kind in 'iu':
+                values = pd.array(values, dtype=values.dtype.name.replace('int', 'Int').replace('uInt', 'UInt'))
+            elif values.dtype.kind == 'b':
+                values = pd.array(values, dtype='boolean')
+        if isinstance(values, np.ndarray):
+            columns.append(pd.api.extensions.take(values, indexer, allow_fill=allow_fill))
+        else:
+            columns.append(values.take(indexer, allow_fill=allow_fill))
+    return columns
+
+
+def join_rows(df1, df2, left_ind, right_ind, suffixes=('_1', '_2')):
+    """
+    Purpose
+        Join df1 and df2 side by side with one gather per side.
+        Column names shared by both datasets get the suffixes, as in pd.merge.
+    """
+    df1 = drop_unnamed(df1)
+    df2 = drop_unnamed(df2)
+    overlap = set(df1.columns) & set(df2.columns)
+    names = [c + suffixes[0] if c in overlap else c for c in df1.columns] + \
+            [c + suffixes[1] if c in overlap else c for c in df2.columns]
+    columns = take_rows(df1, left_ind) + take_rows(df2, right_ind)
+    mdf = pd.DataFrame(dict(zip(range(len(columns)), columns)), index=pd.RangeIndex(len(left_ind)))
+    mdf.columns = names
+    return mdf
+
+
+def drop_unnamed(df):
+    if df.columns.str.contains('unnamed', case=False).any():
+        df = df.loc[:, ~df.columns.str.contains('unnamed', case=False)]
+    return df
+
+
 def best_match(mdf, column):
     mdf = mdf.drop_duplicates(subset=[column], keep='first').reset_index(drop=True)
     return mdf
@@ -0,0 +1,284 @@
+"""
+File: bench_crossmatch.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to benchmark the crossmatch functions on synthetic catalogs.
+
+The catalogs have a controlled size, source density, clustering and match
+radius, in a COSMOS-like field, across RA=0/360 and next to the pole.
+Each stage (crossmatch, crossmatch_angular, merge_df, do_merge_radec) is run
+in a fresh process, and its run time, throughput and peak memory are saved
+to json. The peak memory only covers the matched section, not the making
+of the synthetic catalogs (see FuncProfile.PeakMemory). Two json files can be compared to find the regressions between
+versions of FuncTableCrossmatch.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+import scipy
+from concurrent.futures import ProcessPoolExecutor
+
+# my own packing
+from path import PATH_BENCHMARK
+import FuncTableCrossmatch as tc
+import FuncCatalogIO as cio
+import FuncCatalogIndex as ci
+import FuncProfile as fp
+
+# field centers (RA, DEC) in degrees
+FIELDS = {'cosmos': (150.1, 2.2), 'ra_wrap': (0., 0.), 'pole': (0., 89.9)}
+
+STAGES = ['crossmatch', 'crossmatch_angular', 'merge_df', 'do_merge_radec']
+
+
+def main(sizes, fields=('cosmos',), stages=STAGES, density=1e5, cluster=0., radius=2.,
+         match_fraction=0.5, repeat=3, fn_out=None, fn_compare=None, tolerance=0.2):
+
+    # create the directory if not exist
+    isExist = os.path.exists(PATH_BENCHMARK)
+    if fn_out is None and not isExist:
+        os.makedirs(PATH_BENCHMARK)
+        print(f'Create new directory: {PATH_BENCHMARK}')
+
+    results = []
+    for field in fields:
+        for stage in stages:
+            for n in sizes:
+                param = dict(stage=stage, n=int(n), field=field, density=density, cluster=cluster,
+                             radius=radius, match_fraction=match_fraction, repeat=repeat)
+                # fresh process, so the peak memory is the one of this stage
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(run_stage, **param).result()
+                results.append(result)
+                print('%-20s %-8s n=%-9d %8.3f s %12.0f src/s %8.1f MB'%(
+                      stage, field, n, result['time'], result['throughput'], result['peak_memory_mb']))
+
+    report = {'meta': bench_meta(), 'results': results}
+    if fn_out is None:
+        fn_out = PATH_BENCHMARK + 'bench_crossmatch_%s.json'%(time.strftime('%Y%m%d_%H%M%S'))
+    with open(fn_out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('Save benchmark %s'%(fn_out))
+
+    if fn_compare is not None:
+        n_regression = compare(fn_compare, fn_out, tolerance=tolerance)
+        if n_regression > 0:
+            sys.exit(1)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the crossmatch on synthetic catalogs.')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1e3, 1e4, 1e5, 1e6],
+                        help='number of sources of each catalog (up to 1e7)')
+    parser.add_argument('--fields', nargs='+', default=['cosmos'], choices=list(FIELDS),
+                        help='fields of the synthetic catalogs')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES,
+                        help='stages to benchmark')
+    parser.add_argument('--density', type=float, default=1e5,
+                        help='source density per square degree')
+    parser.add_argument('--cluster', type=float, default=0.,
+                        help='fraction of the sources in clusters')
+    parser.add_argument('--radius', type=float, default=2.,
+                        help='match radius in arcsec')
+    parser.add_argument('--match-fraction', type=float, default=0.5,
+                        help='fraction of the sources with a counterpart in the other catalog')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs of each stage, the fastest one is kept')
+    parser.add_argument('--out', default=None,
+                        help='output json (default: PATH_BENCHMARK/bench_crossmatch_<time>.json)')
+    parser.add_argument('--compare', default=None, metavar='JSON',
+                        help='earlier benchmark json to compare with, exit with 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown or memory growth in the comparison')
+    return parser.parse_args()
+
+#-----------------------------------------------------------
+# Functions for synthetic catalogs
+def make_catalog(n, field='cosmos', density=1e5, cluster=0., seed=0):
+    """
+    Purpose
+        Make a synthetic RA/DEC catalog in a square field of n/density square degrees.
+    ---------------------
+    Input Parameter
+        n                [int]: the number of sources.
+        field            [str]: optional, the field center, a key of FIELDS.
+        density        [float]: optional, the source density per square degree.
+        cluster        [float]: optional, the fraction of the sources in clusters
+                                of 10 arcsec and 20 sources on average.
+        seed             [int]: optional, the random seed.
+    ---------------------
+    Return
+        X              [array]: shape(n, 2), RA and DEC in degrees.
+    """
+    rng = np.random.default_rng(seed)
+    half = 0.5 * np.sqrt(n / density)
+    n_cluster = int(n * cluster)
+    xi = rng.uniform(-half, half, n)
+    eta = rng.uniform(-half, half, n)
+    if n_cluster > 0:
+        n_center = max(n_cluster // 20, 1)
+        center = rng.integers(0, n_center, n_cluster)
+        xi[:n_cluster] = rng.uniform(-half, half, n_center)[center] + rng.normal(0, 10/3600, n_cluster)
+        eta[:n_cluster] = rng.uniform(-half, half, n_center)[center] + rng.normal(0, 10/3600, n_cluster)
+    return tangent_to_radec(xi, eta, *FIELDS[field])
+
+def make_counterpart(X, radius, match_fraction=0.5, seed=1):
+    """
+    Purpose
+        Make the second catalog: a fraction of the sources of X moved by less than radius
+        (in arcsec), and random sources of the same field for the rest.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(X)
+    n_match = int(n * match_fraction)
+    Y = X[rng.permutation(n)].copy()
+    # offsets within radius, in the tangent plane of each source
+    r = radius / 3600 * np.sqrt(rng.uniform(0, 1, n_match)) * 0.99
+    theta = rng.uniform(0, 2 * np.pi, n_match)
+    Y[:n_match] = offset_radec(Y[:n_match], r * np.cos(theta), r * np.sin(theta))
+    # the rest is shuffled within the field, so it is unrelated to X
+    Y[n_match:] = X[rng.permutation(n)[:n - n_match]]
+    Y[n_match:] = offset_radec(Y[n_match:], rng.normal(0, 60/3600, n - n_match), rng.normal(0, 60/3600, n - n_match))
+    return Y
+
+def tangent_to_radec(xi, eta, ra0, dec0):
+    # inverse gnomonic projection of the tangent plane offsets (in degrees) around (ra0, dec0)
+    xi, eta = np.deg2rad(xi), np.deg2rad(eta)
+    ra0, dec0 = np.deg2rad(ra0), np.deg2rad(dec0)
+    denom = np.cos(dec0) - eta * np.sin(dec0)
+    ra = ra0 + np.arctan2(xi, denom)
+    dec = np.arctan2(np.sin(dec0) + eta * np.cos(dec0), np.hypot(xi, denom))
+    return np.c_[np.rad2deg(ra) % 360, np.rad2deg(dec)]
+
+def offset_radec(X, dxi, deta):
+    # move each source by the tangent plane offsets (in degrees)
+    out = np.empty_like(X)
+    xi, eta = np.deg2rad(dxi), np.deg2rad(deta)
+    ra0, dec0 = np.deg2rad(X[:, 0]), np.deg2rad(X[:, 1])
+    denom = np.cos(dec0) - eta * np.sin(dec0)
+    out[:, 0] = np.rad2deg(ra0 + np.arctan2(xi, denom)) % 360
+    out[:, 1] = np.rad2deg(np.arctan2(np.sin(dec0) + eta * np.cos(dec0), np.hypot(xi, denom)))
+    return out
+
+#-----------------------------------------------------------
+# Functions for the benchmark
+def run_stage(stage, n, field='cosmos', density=1e5, cluster=0., radius=2., match_fraction=0.5, repeat=3):
+    """
+    Purpose
+        Run one stage on synthetic catalogs of n sources, and measure it.
+        It is run in a worker process, so earlier stages do not add to its memory.
+    ---------------------
+    Return
+        result          [dict]: the parameters, the fastest run time (s), the throughput
+                                (sources of the first catalog per second), the peak memory (MB)
+                                of the timed runs and its increase above the memory at their start
+                                (the catalogs already made), and the number of pairs.
+    """
+    X1 = make_catalog(n, field=field, density=density, cluster=cluster, seed=0)
+    X2 = make_counterpart(X1, radius, match_fraction=match_fraction, seed=1)
+    df1 = pd.DataFrame({'ID_1': np.arange(n), 'RA_1': X1[:, 0], 'DEC_1': X1[:, 1], 'flux_1': np.ones(n)})
+    df2 = pd.DataFrame({'ID_2': np.arange(n), 'RA_2': X2[:, 0], 'DEC_2': X2[:, 1], 'flux_2': np.ones(n)})
+
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        if stage == 'crossmatch':
+            Y1, Y2 = tc.radec_to_xyz(X1), tc.radec_to_xyz(X2)
+            max_y = tc.angle_to_chord(radius / 3600)
+            func = lambda: tc.crossmatch(Y1, Y2, max_y)
+            n_pair = lambda ind: int(sum(map(len, ind)))
+        elif stage == 'crossmatch_angular':
+            func = lambda: tc.crossmatch_angular(X1, X2, radius / 3600, return_dist=True, flat=True)
+            n_pair = lambda out: len(out[1])
+        elif stage == 'merge_df':
+            ind, dist = tc.crossmatch_angular(X1, X2, radius / 3600, return_dist=True)
+            func = lambda: tc.merge_df(df1, df2, ind, dist)
+            n_pair = lambda mdf: int(mdf['Separation'].notna().sum())
+        elif stage == 'do_merge_radec':
+            import script_01_make_crossmatch as s1
+            fn1 = os.path.join(dir_tmp, 'cat1.parquet')
+            fn2 = os.path.join(dir_tmp, 'cat2.parquet')
+            fn_bm = os.path.join(dir_tmp, 'match.parquet')
+            cio.write_catalog(df1, fn1)
+            cio.write_catalog(df2, fn2)
+            input_dict = {'cat1': [fn1, 'RA_1', 'DEC_1'], 'cat2': [fn2, 'RA_2', 'DEC_2']}
+            with contextlib.redirect_stdout(io.StringIO()):
+                ci.load_index(fn2, 'RA_2', 'DEC_2')     # the cached index, as in a rerun
+            func = lambda: s1.do_merge_radec(input_dict, 'cat1', 'cat2', radius=radius, fn_bestmatch=fn_bm)
+            n_pair = lambda out: int(cio.read_catalog(fn_bm, columns=['Separation'])['Separation'].notna().sum())
+        else:
+            raise ValueError('Unknown stage %s'%(stage))
+
+        # only the matched section, the catalogs are made before
+        time_best = np.inf
+        with fp.PeakMemory() as memory:
+            for i in range(repeat):
+                time_start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    out = func()
+                time_best = min(time_best, time.perf_counter() - time_start)
+        n_pair = n_pair(out)
+        # without /proc, only the peak of the whole process is known
+        memory_stage = memory.delta if memory.delta is not None else memory.peak
+
+    return dict(stage=stage, n=n, field=field, density=density, cluster=cluster, radius=radius,
+                match_fraction=match_fraction, time=time_best, throughput=n / time_best,
+                peak_memory_mb=memory.peak / 2**20, stage_memory_mb=memory_stage / 2**20,
+                memory_method=memory.method, n_pair=n_pair)
+
+def bench_meta():
+    # versions and host, to know what the results were measured on
+    fn_tc = tc.__file__
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'host': socket.gethostname(),
+            'n_cpu': os.cpu_count(), 'python': sys.version.split()[0], 'numpy': np.__version__,
+            'scipy': scipy.__version__, 'pandas': pd.__version__, 'FuncTableCrossmatch': ci.file_hash(fn_tc)}
+
+def compare(fn_old, fn_new, tolerance=0.2):
+    """
+    Purpose
+        Compare two benchmark json files, stage by stage.
+    ---------------------
+    Input Parameter
+        fn_old           [str]: the reference benchmark.
+        fn_new           [str]: the new benchmark.
+        tolerance      [float]: optional, the allowed relative increase of the run time
+                                and of the stage memory.
+    ---------------------
+    Return
+        n_regression     [int]: the number of the stages slower or larger than allowed.
+    """
+    keys = ['stage', 'n', 'field', 'density', 'cluster', 'radius', 'match_fraction']
+    with open(fn_old) as f:
+        old = {tuple(r[k] for k in keys): r for r in json.load(f)['results']}
+    with open(fn_new) as f:
+        new = json.load(f)['results']
+
+    n_regression = 0
+    print('%-20s %-8s %-9s %10s %10s'%('stage', 'field', 'n', 'time', 'memory'))
+    for r in new:
+        r_old = old.get(tuple(r[k] for k in keys))
+        if r_old is None:
+            continue
+        ratio_time = r['time'] / r_old['time']
+        ratio_memory = (r['stage_memory_mb'] + 1) / (r_old['stage_memory_mb'] + 1)
+        is_regression = ratio_time > 1 + tolerance or ratio_memory > 1 + tolerance
+        if r['n_pair'] != r_old['n_pair']:
+            print('Different number of pairs in %s n=%d: %d and %d'%(r['stage'], r['n'], r_old['n_pair'], r['n_pair']))
+            is_regression = True
+        n_regression += is_regression
+        print('%-20s %-8s %-9d %9.2fx %9.2fx %s'%(r['stage'], r['field'], r['n'], ratio_time, ratio_memory,
+              'REGRESSION' if is_regression else ''))
+    return n_regression
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(sizes=args.sizes, fields=args.fields, stages=args.stages, density=args.density, cluster=args.cluster,
+         radius=args.radius, match_fraction=args.match_fraction, repeat=args.repeat, fn_out=args.out,
+         fn_compare=args.compare, tolerance=args.tolerance)
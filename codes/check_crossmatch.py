@@ -0,0 +1,555 @@
+"""
+File: check_crossmatch.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to check the crossmatch functions on small catalogs with
+known answers, e.g. the edge cases of the reference catalogs with NaN rows
+(the outer-join outputs like VLA_3GHzlpAGN).
+
+Each check raises an AssertionError on a wrong result, and the script exits
+with 1 if any check fails.
+"""
+import os
+import io
+import sys
+import json
+import argparse
+import tempfile
+import threading
+import traceback
+import contextlib
+import numpy as np
+import pandas as pd
+
+# my own packing
+import FuncTableCrossmatch as tc
+import FuncCatalogIO as cio
+import FuncCatalogIndex as ci
+import FuncLikelihoodRatio as lr
+import FuncConeSearch as cs
+import FuncFalseMatch as fm
+
+
+def main(checks=None, all_checks=None):
+    # run the checks (names) of all_checks (by default, CHECKS of this script)
+    all_checks = CHECKS if all_checks is None else all_checks
+    checks = all_checks if not checks else {name: all_checks[name] for name in checks}
+    n_fail = 0
+    for name, func in checks.items():
+        try:
+            func()
+            print('%-24s ok'%(name))
+        except Exception:
+            n_fail += 1
+            print('%-24s FAIL'%(name))
+            traceback.print_exc()
+    if n_fail > 0:
+        sys.exit(1)
+
+def parse_args(all_checks=None, description='Check the crossmatch functions on small catalogs.'):
+    all_checks = CHECKS if all_checks is None else all_checks
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('checks', nargs='*',
+                        help='checks to run, among %s (default: all)'%(', '.join(all_checks)))
+    args = parser.parse_args()
+    unknown = [name for name in args.checks if name not in all_checks]
+    if unknown:
+        parser.error('unknown checks %s'%(unknown))
+    return args
+
+#-----------------------------------------------------------
+# Functions for the checks
+def nan_catalog():
+    # reference catalog with a NaN row between two sources 1 degree apart
+    return np.array([[150., 2.], [np.nan, np.nan], [151., 2.]])
+
+def nan_cases():
+    """
+    Purpose
+        The query catalogs of the NaN reference catalog and their expected matches within 1 arcsec:
+        a single query, no matches, the same number of matches for each query, and a NaN query.
+    """
+    return {'single':  (np.array([[150., 2.]]),             [[0]]),
+            'none':    (np.array([[140., 2.], [141., 2.]]), [[], []]),
+            'uniform': (np.array([[150., 2.], [151., 2.]]), [[0], [2]]),
+            'nan':     (np.array([[150., 2.], [np.nan, 2.]]), [[0], []]),
+            'empty':   (np.zeros((0, 2)),                   [])}
+
+def check_nan_reference(index=None):
+    """
+    Purpose
+        Match the NaN reference catalog (or its CatalogIndex) in list mode, in flat mode,
+        with a list of radii and by the nearest match, and compare with the expected matches.
+    """
+    X2 = nan_catalog() if index is None else index
+    for case, (X1, expected) in nan_cases().items():
+        ind, dist = tc.crossmatch_angular(X1, X2, 1/3600, return_dist=True)
+        assert [list(i) for i in ind] == expected, (case, ind)
+        assert all(np.all(np.isinf(d)) for i, d in zip(expected, dist) if len(i) == 0), (case, dist)
+
+        offset, ind_flat, sep = tc.crossmatch_angular(X1, X2, 1/3600, return_dist=True, flat=True)
+        assert [ind_flat[offset[k]:offset[k+1]].tolist() for k in range(len(X1))] == expected, (case, offset, ind_flat)
+        assert len(sep) == len(ind_flat) and np.all(sep < 1e-6), (case, sep)
+
+        for ind_r in tc.crossmatch_angular(X1, X2, [1/3600, 0.5/3600]):
+            assert [list(i) for i in ind_r] == expected, (case, ind_r)
+
+        offset, ind_best, sep_best, count = tc.crossmatch_angular_nearest(X1, X2, 1/3600)
+        assert ind_best.tolist() == [i[0] for i in expected if len(i) > 0], (case, ind_best)
+        assert count.tolist() == [len(i) for i in expected], (case, count)
+
+def check_query_ball():
+    # the matches of the NaN reference catalog, without and with a prebuilt index
+    check_nan_reference()
+    check_nan_reference(tc.CatalogIndex.from_radec(nan_catalog()))
+
+def check_cached_index():
+    # the matches and counts of the NaN reference catalog with the index built and
+    # saved by load_index, and with the index loaded back from its sidecar files
+    X2 = nan_catalog()
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        fn = os.path.join(dir_tmp, 'nan.parquet')
+        cio.write_catalog(pd.DataFrame({'ra': X2[:, 0], 'dec': X2[:, 1]}), fn)
+        for i in range(2):
+            with contextlib.redirect_stdout(io.StringIO()):
+                index = ci.load_index(fn, 'ra', 'dec')
+            check_nan_reference(index)
+            for case, (X1, expected) in nan_cases().items():
+                Y1 = tc.radec_to_xyz(X1)
+                count = index.count(Y1, tc.angle_to_chord(1/3600))
+                assert count.tolist() == [len(i) for i in expected], (case, count)
+                density = lr.background_density(index, Y1, 1., 3600. * 1.5)
+                assert len(density) == len(X1) and np.all(density > 0), (case, density)
+
+def check_cone_server():
+    """
+    Purpose
+        Query a cone search server of the NaN reference catalog (on a free local port)
+        with the NaN cases, one position at a time and all at once, and check that the
+        bad requests are answered with 400 instead of failing in the server.
+    """
+    X2 = nan_catalog()
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        fn = os.path.join(dir_tmp, 'nan.parquet')
+        cio.write_catalog(pd.DataFrame({'ra': X2[:, 0], 'dec': X2[:, 1], 'flux': [1., 2., 3.]}), fn)
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = cs.ConeSearchServer({'nan': (fn, 'ra', 'dec')}, address=('127.0.0.1', 0))
+            server.warm()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        client = cs.ConeSearchClient(port=server.server_address[1])
+        try:
+            for case, (X1, expected) in nan_cases().items():
+                queries = [(X1, expected)] + [(X1[[k]], [expected[k]]) for k in range(len(X1))]
+                for X, expected_X in queries:
+                    df = client.cone_search('nan', X[:, 0], X[:, 1], radius=1., columns=['flux'])
+                    assert [df['Index'][df['Query'] == k].tolist() for k in range(len(X))] == expected_X, (case, df)
+                    assert df['flux'].tolist() == [1. + i for ind in expected_X for i in ind], (case, df)
+                    df = client.crossmatch('nan', X[:, 0], X[:, 1], radius=1.)
+                    assert df['Index'].tolist() == [ind[0] if ind else -1 for ind in expected_X], (case, df)
+
+            # bad requests, the server logs them on stderr
+            with contextlib.redirect_stderr(io.StringIO()):
+                bad = [(client.cone_search, ('nan', [150.], [2., 2.])),
+                       (client.cone_search, ('nan', [150.], [2.], [1., 2.])),
+                       (client.cone_search, ('nan', [150.], [2.], -1.)),
+                       (client.cone_search, ('nan', [150.], [2.], np.inf)),
+                       (client.cone_search, ('unknown', [150.], [2.])),
+                       (client.crossmatch, ('nan', [150.], [2.], 1., ['unknown']))]
+                for func, args in bad:
+                    try:
+                        func(*args)
+                    except RuntimeError as e:
+                        assert 'error 400' in str(e), (args, e)
+                    else:
+                        raise AssertionError('No error of %s'%(args,))
+                client.connection.request('POST', '/cone?catalog=nan', body=b'not npz')
+                response = client.connection.getresponse()
+                assert response.status == 400, (response.status, json.loads(response.read()))
+                response.read()
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+
+def random_catalogs(seed, n1=60, n2=50, size=30.):
+    # two random catalogs in a small field of size arcsec around (150, 2)
+    rng = np.random.default_rng(seed)
+    X1 = np.column_stack([150. + rng.uniform(0, size, n1)/3600, 2. + rng.uniform(0, size, n1)/3600])
+    X2 = np.column_stack([150. + rng.uniform(0, size, n2)/3600, 2. + rng.uniform(0, size, n2)/3600])
+    return X1, X2
+
+def separation_matrix(X1, X2):
+    # the brute-force separations (arcsec) of all the pairs, as a dense matrix
+    chord = np.linalg.norm(tc.radec_to_xyz(X1)[:, None, :] - tc.radec_to_xyz(X2)[None, :, :], axis=2)
+    return np.degrees(2. * np.arcsin(chord / 2.)) * 3600.
+
+def brute_one_to_one(sep, radius, method):
+    # the one-to-one pairs (i, j) within radius from the dense separation matrix
+    sep = np.where(sep <= radius, sep, np.inf)
+    if method == 'mutual':
+        best1, best2 = np.argmin(sep, axis=1), np.argmin(sep, axis=0)
+        return {(i, j) for i, j in enumerate(best1) if np.isfinite(sep[i, j]) and best2[j] == i}
+    pairs = set()
+    sep = sep.copy()
+    while np.isfinite(sep).any():
+        i, j = np.unravel_index(np.argmin(sep), sep.shape)
+        pairs.add((i, j))
+        sep[i, :] = sep[:, j] = np.inf
+    return pairs
+
+def check_one_to_one():
+    """
+    Purpose
+        Compare the greedy and mutual one-to-one pairs with the brute-force ones of the
+        dense separation matrix on random catalogs, and resolve a long chain of sources
+        where each kept pair only frees the next one.
+    """
+    for seed in range(5):
+        X1, X2 = random_catalogs(seed)
+        sep_matrix = separation_matrix(X1, X2)
+        for radius in [2., 5.]:
+            offset, ind, sep = tc.crossmatch_angular(X1, X2, radius/3600, return_dist=True, flat=True)
+            for method in ['greedy', 'mutual']:
+                offset_1, ind_1, sep_1 = tc.one_to_one(offset, ind, sep, method=method)
+                row_1 = np.repeat(np.arange(len(X1)), np.diff(offset_1))
+                pairs = set(zip(row_1.tolist(), ind_1.tolist()))
+                assert pairs == brute_one_to_one(sep_matrix, radius, method), (seed, radius, method)
+                assert np.allclose(sep_1, sep_matrix[row_1, ind_1], atol=1e-6), (seed, radius, method)
+
+    # chain X1[0] - X2[0] - X1[1] - X2[1] - ... with the gaps shrinking along the chain
+    n = 20000
+    gap = 1. - 0.5 * np.arange(2 * n - 1) / (2 * n)
+    pos = np.concatenate([[0.], np.cumsum(gap)]) / 3600
+    X1 = np.column_stack([150. + pos[0::2], np.full(n, 2.)])
+    X2 = np.column_stack([150. + pos[1::2], np.full(n, 2.)])
+    offset, ind, sep = tc.crossmatch_angular(X1, X2, 1.1/3600, return_dist=True, flat=True)
+    offset_1, ind_1, sep_1 = tc.one_to_one(offset, ind, sep)
+    assert ind_1.tolist() == list(range(n)) and np.all(np.diff(offset_1) == 1), ind_1
+
+
+def brute_pairs(sep, radius):
+    # the pairs (i, j) within radius (arcsec, or an array per row) from the dense separation matrix
+    radius = np.broadcast_to(np.asarray(radius, dtype=float).reshape(-1, 1), (sep.shape[0], 1))
+    return set(zip(*[k.tolist() for k in np.nonzero(sep <= radius)]))
+
+def flat_pairs(offset, ind):
+    # the pairs (i, j) of the CSR-style arrays
+    row = np.repeat(np.arange(len(offset) - 1), np.diff(offset))
+    return set(zip(row.tolist(), ind.tolist()))
+
+def check_zones():
+    """
+    Purpose
+        Match random catalogs across RA = 0 and many Dec zones on a process pool, and compare
+        the pairs, the separations, the nearest matches and their counts with the serial match
+        and with the brute-force ones of the dense separation matrix, also with a radius per source.
+    """
+    rng = np.random.default_rng(2)
+    X1 = np.column_stack([rng.uniform(-0.05, 0.05, 400) % 360, rng.uniform(-30.05, -29.95, 400)])
+    X2 = np.column_stack([rng.uniform(-0.05, 0.05, 300) % 360, rng.uniform(-30.05, -29.95, 300)])
+    X1[5] = np.nan
+    sep_matrix = separation_matrix(X1, X2)
+    radius_lst = [10., rng.uniform(2., 20., len(X1))]
+    for radius in radius_lst:
+        offset, ind, sep = tc.crossmatch_angular(X1, X2, radius/3600, return_dist=True, flat=True, n_workers=3)
+        offset_s, ind_s, sep_s = tc.crossmatch_angular(X1, X2, radius/3600, return_dist=True, flat=True)
+        assert np.array_equal(offset, offset_s) and np.array_equal(ind, ind_s), radius
+        assert np.allclose(sep, sep_s, rtol=0, atol=1e-9), radius
+        pairs = flat_pairs(offset, ind)
+        # pairs at the radius within the rounding error may go either way
+        brute = brute_pairs(sep_matrix, radius)
+        edge = brute ^ brute_pairs(sep_matrix, np.asarray(radius) + 1e-6)
+        assert pairs ^ brute <= edge, sorted(pairs ^ brute)[:5]
+        assert len(pairs) > len(X1) // 2, len(pairs)
+
+    offset, ind, sep, count = tc.crossmatch_angular_nearest(X1, X2, 10/3600, n_workers=3)
+    offset_s, ind_s, sep_s, count_s = tc.crossmatch_angular_nearest(X1, X2, 10/3600)
+    assert np.array_equal(offset, offset_s) and np.array_equal(ind, ind_s) and np.array_equal(count, count_s)
+    has_match = np.diff(offset) > 0
+    is_near = np.nan_to_num(sep_matrix, nan=np.inf) <= 10.
+    assert np.array_equal(count, is_near.sum(axis=1)), count
+    assert np.array_equal(has_match, count > 0)
+    assert np.array_equal(ind, np.argmin(np.nan_to_num(sep_matrix, nan=np.inf), axis=1)[has_match])
+
+
+def check_multi():
+    """
+    Purpose
+        Best-match a random reference catalog against two catalogs in one pass (one with a
+        prebuilt index), and compare the matched rows, separations and candidate counts with 
+        the brute-force nearest sources of the dense separation matrices, for both joins.
+    """
+    X1, X2 = random_catalogs(3)
+    X3 = random_catalogs(4, n2=80)[1]
+    df_ref = pd.DataFrame({'ra': X1[:, 0], 'dec': X1[:, 1], 'flux': np.arange(len(X1), dtype=float)})
+    df2 = pd.DataFrame({'ra': X2[:, 0], 'dec': X2[:, 1], 'flux': np.arange(len(X2)) + 1000.})
+    df3 = pd.DataFrame({'ra3': X3[:, 0], 'dec3': X3[:, 1], 'id3': np.arange(len(X3))})
+    specs = [(df2, 'ra', 'dec', 3., 'b'), (df3, 'ra3', 'dec3', 4., 'c', tc.CatalogIndex.from_radec(X3))]
+    mdf = tc.crossmatch_multi(df_ref, 'ra', 'dec', specs)
+    assert list(mdf.columns) == ['ra', 'dec', 'flux', 'ra_b', 'dec_b', 'flux_b', 'Separation_b', 'Count_b',
+                                 'ra3', 'dec3', 'id3', 'Separation_c', 'Count_c'], list(mdf.columns)
+    assert len(mdf) == len(df_ref) and np.array_equal(mdf['flux'], df_ref['flux'])
+
+    is_keep = np.ones(len(X1), dtype=bool)
+    for X, (radius, suffix, col) in [(X2, (3., 'b', 'flux_b')), (X3, (4., 'c', 'id3'))]:
+        sep_matrix = separation_matrix(X1, X)
+        best = np.argmin(sep_matrix, axis=1)
+        has_match = sep_matrix[np.arange(len(X1)), best] <= radius
+        is_keep &= has_match
+        assert np.array_equal(mdf['Separation_' + suffix].notna(), has_match), suffix
+        assert np.allclose(mdf['Separation_' + suffix][has_match], sep_matrix[has_match, best[has_match]], atol=1e-6)
+        assert np.array_equal(mdf['Count_' + suffix], (sep_matrix <= radius).sum(axis=1)), suffix
+        expected = (best[has_match] + 1000.) if suffix == 'b' else best[has_match]
+        assert np.array_equal(mdf[col][has_match], expected), suffix
+        assert mdf[col][~has_match].isna().all(), suffix
+
+    mdf_inner = tc.crossmatch_multi(df_ref, 'ra', 'dec', specs, how='inner')
+    pd.testing.assert_frame_equal(mdf_inner, mdf[is_keep].reset_index(drop=True), check_dtype=False)
+    assert 0 < len(mdf_inner) < len(mdf), len(mdf_inner)
+
+
+def check_error_radius():
+    """
+    Purpose
+        Match random catalogs with the radius of each pair from the positional errors of both
+        sources (some missing), with a floor and a cap, serially and on a process pool, and 
+        compare the pairs with the brute-force ones of the dense separation matrix.
+    """
+    X1, X2 = random_catalogs(5, n1=120, n2=100)
+    rng = np.random.default_rng(5)
+    err1, err2 = rng.uniform(0.1, 1.5, len(X1)), rng.uniform(0.1, 1.5, len(X2))
+    err1[:10] = np.nan
+    sep_matrix = separation_matrix(X1, X2)
+    n_sigma, min_radius, max_radius = 3., 1., 5.
+    radius_matrix = np.clip(n_sigma * np.hypot(np.nan_to_num(err1)[:, None], err2[None, :]), min_radius, max_radius)
+    brute = set(zip(*[k.tolist() for k in np.nonzero(sep_matrix <= radius_matrix)]))
+    assert 0 < len(brute) and any(radius_matrix[i, j] < max_radius for i, j in brute), len(brute)
+
+    for n_workers in [None, 3]:
+        offset, ind, sep = tc.crossmatch_angular_error(X1, X2, err1/3600, err2/3600, n_sigma, min_radius/3600, 
+                                                       max_radius/3600, n_workers=n_workers)
+        row = np.repeat(np.arange(len(X1)), np.diff(offset))
+        assert flat_pairs(offset, ind) == brute, n_workers
+        assert np.allclose(sep, sep_matrix[row, ind], atol=1e-6), n_workers
+        assert np.allclose(tc.error_radius(err1[row], err2[ind], n_sigma, min_radius, max_radius), 
+                           radius_matrix[row, ind]), n_workers
+
+
+def check_false_match():
+    """
+    Purpose
+        Estimate the false-match rate of random catalogs (one source missing) serially and on
+        a process pool, and compare the rates with the brute-force nearest separations of the
+        sources shifted by the same rotations, which move the field center within the shift range.
+    """
+    X1, X2 = random_catalogs(6, n1=80, n2=300, size=200.)
+    X1[7] = np.nan
+    radii, n_realization, min_shift, max_shift = [1., 3., 6.], 12, 10., 60.
+    df = fm.false_match_rate(X1, X2, radii, n_realization=n_realization, min_shift=min_shift,
+                             max_shift=max_shift, seed=6, n_workers=1)
+    df_pool = fm.false_match_rate(X1, X2, radii, n_realization=n_realization, min_shift=min_shift,
+                                  max_shift=max_shift, seed=6, n_workers=3, n_batch=5)
+    pd.testing.assert_frame_equal(df, df_pool)
+
+    # the same rotations as false_match_rate, from the same seed
+    X1_valid = X1[np.isfinite(X1).all(axis=1)]
+    Y1 = tc.radec_to_xyz(X1_valid)
+    rotations = fm.random_rotations(Y1, n_realization, min_shift/3600, max_shift/3600, np.random.default_rng(6))
+    assert np.allclose(rotations @ rotations.transpose(0, 2, 1), np.eye(3)), 'not a rotation'
+    center = Y1.mean(axis=0) / np.linalg.norm(Y1.mean(axis=0))
+    shift = np.degrees(np.arccos(np.clip(rotations @ center @ center, -1, 1))) * 3600
+    assert np.all((shift >= min_shift - 1e-3) & (shift <= max_shift + 1e-3)), shift
+
+    Y2 = tc.radec_to_xyz(X2)
+    rate = []
+    for rotation in rotations:
+        chord = np.linalg.norm((Y1 @ rotation.T)[:, None, :] - Y2[None, :, :], axis=2).min(axis=1)
+        sep = np.degrees(2. * np.arcsin(chord / 2.)) * 3600
+        rate.append([(sep <= radius).mean() for radius in radii])
+    rate = np.array(rate)
+    match = separation_matrix(X1_valid, X2).min(axis=1)
+    match_rate = np.array([(match <= radius).mean() for radius in radii])
+    assert np.array_equal(df['Radius'], radii)
+    assert np.allclose(df['MatchRate'], match_rate) and np.allclose(df['FalseRate'], rate.mean(axis=0))
+    assert np.allclose(df['FalseRateStd'], rate.std(axis=0))
+    assert np.allclose(df['Reliability'], 1 - rate.mean(axis=0) / match_rate)
+    assert df['FalseRate'].iloc[-1] > 0, df
+
+
+def brute_groups(sep, radius):
+    # the connected groups of the sources within radius, by flood fill of the dense separation matrix,
+    # labelled in the order of their first member
+    group = np.full(len(sep), -1)
+    n_group = 0
+    for i in range(len(sep)):
+        if group[i] >= 0:
+            continue
+        stack = [i]
+        group[i] = n_group
+        while stack:
+            for j in np.flatnonzero((sep[stack.pop()] <= radius) & (group < 0)):
+                group[j] = n_group
+                stack.append(j)
+        n_group += 1
+    return group
+
+def check_union():
+    """
+    Purpose
+        Merge three random catalogs with duplicates (some in chains, some within one catalog)
+        into their union, and compare the groups, the member counts, the master positions and
+        the nearest members of each catalog with the brute-force groups of the dense
+        separation matrix.
+    """
+    rng = np.random.default_rng(9)
+    X_all = random_catalogs(9, n1=40, n2=40, size=60.)
+    X_all = [X_all[0], X_all[1], X_all[0][:25] + rng.normal(0, 0.5, (25, 2)) / 3600]
+    names = ['a', 'b', 'c']
+    dfs = [pd.DataFrame({'ra': X[:, 0], 'dec': X[:, 1], 'flux': np.arange(len(X)) + 100. * k})
+           for k, X in enumerate(X_all)]
+    radius = 3.
+    mdf = tc.catalog_union([(df, 'ra', 'dec', name) for df, name in zip(dfs, names)], radius)
+
+    X = np.concatenate(X_all)
+    cat = np.concatenate([np.full(len(X_k), k) for k, X_k in enumerate(X_all)])
+    row = np.concatenate([np.arange(len(X_k)) for X_k in X_all])
+    sep_matrix = separation_matrix(X, X)
+    group = brute_groups(sep_matrix, radius)
+    n_group = group.max() + 1
+    first = np.array([np.flatnonzero(group == g)[0] for g in range(n_group)])
+    assert len(mdf) == n_group and np.array_equal(mdf['ID_union'], np.arange(n_group)), len(mdf)
+    assert np.array_equal(mdf['ra_union'], X[first, 0]) and np.array_equal(mdf['dec_union'], X[first, 1])
+    assert list(mdf['catalog_union']) == [names[k] for k in cat[first]]
+    assert np.array_equal(mdf['n_union'], np.bincount(group)), mdf['n_union']
+    # a chain of duplicates, and duplicates within one catalog
+    assert any(sep_matrix[np.ix_(group == g, group == g)].max() > radius for g in range(n_group))
+    assert any(np.bincount(group[cat == k]).max() > 1 for k in range(3))
+
+    assert list(mdf.columns[:8]) == ['ID_union', 'ra_union', 'dec_union', 'catalog_union', 'n_union',
+                                     'n_a', 'n_b', 'n_c'], list(mdf.columns)
+    for k, name in enumerate(names):
+        suffix = '' if k == 0 else '_' + name
+        assert np.array_equal(mdf['n_' + name], np.bincount(group[cat == k], minlength=n_group)), name
+        for g in range(n_group):
+            member = np.flatnonzero((group == g) & (cat == k))
+            if len(member) == 0:
+                assert np.isnan(mdf['flux' + suffix][g]) and np.isnan(mdf['Separation_' + name][g])
+                continue
+            sep = sep_matrix[first[g], member]
+            nearest = member[np.argmin(sep)]
+            assert mdf['flux' + suffix][g] == dfs[k]['flux'][row[nearest]], (name, g)
+            assert abs(mdf['Separation_' + name][g] - sep.min()) < 1e-6, (name, g)
+
+
+def brute_likelihood_ratio(sep_matrix, radius, mag2, err1, err2, background_radius, bins, min_sigma):
+    # the per-pair LR, reliability and chance probability of the pairs within radius,
+    # following the formulas of FuncLikelihoodRatio one source and one pair at a time
+    is_source = np.isfinite(sep_matrix).any(axis=1)
+    area = np.pi * (background_radius ** 2 - radius ** 2)
+    density = np.array([max(np.sum((s > radius) & (s <= background_radius)), 1) / area for s in sep_matrix])
+
+    finite = mag2[np.isfinite(mag2)]
+    edges = np.histogram_bin_edges(finite, bins=bins)
+    width = np.diff(edges)
+    def mag_bin(m):
+        return min(int(np.sum(edges <= m)) - 1, len(width) - 1)
+    p_bg = np.array([np.sum([mag_bin(m) == k for m in finite]) for k in range(len(width))]) / len(finite) / width
+
+    pairs = sorted(brute_pairs(sep_matrix, radius))
+    n_total = np.zeros(len(width))
+    for i, j in pairs:
+        if np.isfinite(mag2[j]):
+            n_total[mag_bin(mag2[j])] += 1
+    n_real = np.clip(n_total - p_bg * width * density[is_source].sum() * np.pi * radius ** 2, 0, None)
+    Q = min(n_real.sum() / is_source.sum(), 1.)
+    q = n_real / n_real.sum() * Q / width
+
+    LR, p_chance = {}, {}
+    for i, j in pairs:
+        if np.isfinite(mag2[j]):
+            k = mag_bin(mag2[j])
+            ratio = q[k] / p_bg[k] if p_bg[k] > 0 else 0.
+            fraction = np.mean(finite <= mag2[j])
+        else:
+            ratio, fraction = Q, 1.
+        sigma2 = max(np.nan_to_num(err1[i]) ** 2 + np.nan_to_num(err2[j]) ** 2, min_sigma ** 2)
+        f = np.exp(-sep_matrix[i, j] ** 2 / (2 * sigma2)) / (2 * np.pi * sigma2)
+        LR[i, j] = ratio * f / density[i]
+        p_chance[i, j] = 1 - np.exp(-np.pi * sep_matrix[i, j] ** 2 * density[i] * fraction)
+    sum_lr = {i: sum(LR[p] for p in pairs if p[0] == i) for i, j in pairs}
+    reliability = {(i, j): LR[i, j] / (sum_lr[i] + 1 - Q) if LR[i, j] > 0 else 0. for i, j in pairs}
+    return LR, reliability, p_chance, Q
+
+def check_likelihood_ratio():
+    """
+    Purpose
+        Compute the likelihood ratios of the candidates of a random catalog (one source missing)
+        among random targets with counterparts, magnitudes (some missing) and positional errors
+        (some missing), and compare the LR, reliabilities, chance probabilities, Q and the most
+        reliable candidates with the brute-force ones computed pair by pair.
+    """
+    rng = np.random.default_rng(10)
+    X1, X2 = random_catalogs(10, n1=60, n2=600, size=240.)
+    X2[:40] = X1[:40] + rng.normal(0, 0.4, (40, 2)) / 3600
+    X1[45] = np.nan
+    mag2 = rng.uniform(18., 25., len(X2))
+    mag2[:40] -= 3.
+    mag2[50:60] = np.nan
+    err1 = rng.uniform(0.1, 0.6, len(X1))
+    err1[:5] = np.nan
+    err2 = np.full(len(X2), 0.3)
+    radius, background_radius, bins, min_sigma = 4., 30., 8, 0.1
+    sep_matrix = separation_matrix(X1, X2)
+    LR_b, reliability_b, p_chance_b, Q_b = brute_likelihood_ratio(sep_matrix, radius, mag2, err1, err2,
+                                                                  background_radius, bins, min_sigma)
+
+    offset, ind, sep = tc.crossmatch_angular(X1, X2, radius/3600, return_dist=True, flat=True)
+    row = np.repeat(np.arange(len(X1)), np.diff(offset))
+    assert flat_pairs(offset, ind) == set(LR_b)
+    columns, Q = lr.likelihood_ratio(X1, tc.CatalogIndex.from_radec(X2), offset, ind, sep, radius, mag2=mag2,
+                                     err1=err1, err2=0.3, background_radius=background_radius, bins=bins,
+                                     min_sigma=min_sigma)
+    assert np.isclose(Q, Q_b) and 0 < Q < 1, (Q, Q_b)
+    for col, brute in [('LR', LR_b), ('Reliability', reliability_b), ('P_chance', p_chance_b)]:
+        assert np.allclose(columns[col], [brute[p] for p in zip(row.tolist(), ind.tolist())], rtol=1e-6, atol=0), col
+
+    # the most reliable candidate of each source, ties to the nearest
+    n_best = []
+    for min_reliability in [0., 0.5]:
+        offset_1, ind_1, sep_1, columns_1 = lr.best_reliability(offset, ind, sep, columns, min_reliability)
+        best = {}
+        for (i, j), value in reliability_b.items():
+            if value >= min_reliability and (i not in best or (value, -sep_matrix[i, j]) > best[i][1]):
+                best[i] = (j, (value, -sep_matrix[i, j]))
+        row_1 = np.repeat(np.arange(len(X1)), np.diff(offset_1))
+        assert flat_pairs(offset_1, ind_1) == {(i, j) for i, (j, _) in best.items()}, min_reliability
+        assert np.allclose(columns_1['Reliability'], [reliability_b[p] for p in zip(row_1.tolist(), ind_1.tolist())])
+        assert np.allclose(sep_1, sep_matrix[row_1, ind_1], atol=1e-6), min_reliability
+        n_best.append(len(ind_1))
+    assert n_best[0] > n_best[1] > 0, n_best
+    # all tied, the nearest candidates
+    offset_1, ind_1, sep_1, _ = lr.best_reliability(offset, ind, sep, {'Reliability': np.zeros(len(ind))})
+    has_match = np.diff(offset) > 0
+    assert np.array_equal(ind_1, np.argmin(np.nan_to_num(sep_matrix, nan=np.inf), axis=1)[has_match])
+
+    # without magnitudes, the ratio q(m) / n(m) is Q
+    columns, Q = lr.likelihood_ratio(X1, X2, offset, ind, sep, radius, Q=0.7, background_radius=background_radius)
+    sigma2 = min_sigma ** 2
+    density = np.array([max(np.sum((s > radius) & (s <= background_radius)), 1) for s in sep_matrix]) / \
+              (np.pi * (background_radius ** 2 - radius ** 2))
+    LR = 0.7 * np.exp(-sep ** 2 / (2 * sigma2)) / (2 * np.pi * sigma2) / density[row]
+    assert Q == 0.7 and np.allclose(columns['LR'], LR, rtol=1e-6, atol=0)
+
+
+CHECKS = {'query_ball': check_query_ball, 'cached_index': check_cached_index, 'cone_server': check_cone_server,
+          'one_to_one': check_one_to_one, 'zones': check_zones,
+          'multi': check_multi, 'error_radius': check_error_radius, 'false_match': check_false_match,
+          'union': check_union, 'likelihood_ratio': check_likelihood_ratio}
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(checks=args.checks)
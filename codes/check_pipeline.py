@@ -0,0 +1,328 @@
+"""
+File: check_pipeline.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to check the pipeline pieces around the crossmatch on
+small catalogs with known answers: the catalog I/O in every format, the
+compact dtypes, the streamed (chunked) radec crossmatch against the in-memory one, the
+task DAG of FuncPipeline on toy tasks writing text files, and the cutouts of small images.
+
+The checks are run as in check_crossmatch.py, and the script exits
+with 1 if any check fails.
+"""
+import os
+import io
+import tempfile
+import contextlib
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+from astropy.wcs import WCS
+
+# my own packing
+import FuncCatalogIO as cio
+import FuncPipeline as fpl
+import FuncCutout as fc
+import script_01_make_crossmatch as s1
+from check_crossmatch import main, parse_args, random_catalogs
+
+
+#-----------------------------------------------------------
+# Functions for the checks
+def check_index_column():
+    """
+    Purpose
+        Write a catalog with its row index in every format, and check that it is read back
+        with the same 'Unnamed: 0' column, and that its csv copy has the unnamed index column.
+    """
+    df = pd.DataFrame({'ra': [150., 151., 152.], 'flux': [1., 2., 3.]}, index=[3, 5, 8])
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        for fmt, ext in cio.FORMAT_EXT.items():
+            fn = os.path.join(dir_tmp, 'index' + ext)
+            cio.write_catalog(df, fn, index=True)
+            df_read = cio.read_catalog(fn)
+            assert list(df_read.columns) == [cio.INDEX_COLUMN, 'ra', 'flux'], (fmt, df_read.columns)
+            assert df_read[cio.INDEX_COLUMN].tolist() == [3, 5, 8], (fmt, df_read)
+
+            # the csv copy of the catalog read back
+            fn_csv = os.path.join(dir_tmp, 'index_%s.csv'%(fmt))
+            cio.write_catalog(df_read, fn_csv, index=True)
+            with open(fn_csv) as f:
+                assert f.readline() == ',ra,flux\n', fmt
+            pd.testing.assert_frame_equal(cio.read_catalog(fn_csv), df_read, check_dtype=False)
+
+            # without the index
+            cio.write_catalog(df, fn)
+            assert list(cio.read_catalog(fn).columns) == ['ra', 'flux'], fmt
+
+
+def check_compact_dtypes():
+    """
+    Purpose
+        Check the compact dtype of each kind of column, that the compact catalog gives back
+        the same values (also through a csv file), and that compacting it again changes nothing.
+    """
+    n = 8
+    df = pd.DataFrame({'RA_a':      np.linspace(150., 150.123456789, n),      # coordinate
+                       'ra_err_a':  np.full(n, 0.25),                         # error, not a coordinate
+                       'flux_a':    np.r_[0.123456, 12.5, 3e-5, 1e20, 0., np.nan, -7.5, 1.],
+                       'xpix_a':    np.r_[1234.5678, np.ones(n - 1)],         # 8 significant digits
+                       'z_a':       np.r_[1e-50, np.ones(n - 1)],             # below the float32 range
+                       'ID_a':      np.r_[1., 2., np.nan, np.arange(3., n)],
+                       'id_b':      ['12', '345', '12', '7', '-3', '8', '9', '10'],
+                       'seq_b':     ['001', '002', '001', '002', '001', '002', '001', '002'],
+                       'n_a':       np.r_[0, 300, np.zeros(n - 2, dtype=int)],
+                       'label_a':   ['3', '3 & 1.4', '3', '3', '1.4', '3', '3', '3'],
+                       'name_a':    ['s%d'%(i) for i in range(n)]})
+    expected = {'RA_a': 'float64', 'ra_err_a': 'float32', 'flux_a': 'float32', 'xpix_a': 'float64', 
+                'z_a': 'float64', 'ID_a': 'Int8', 'id_b': 'int16', 'seq_b': 'category', 'n_a': 'int16', 
+                'label_a': 'category', 'name_a': 'object'}
+    df_compact = cio.compact_dtypes(df)
+    assert {col: str(dtype) for col, dtype in df_compact.dtypes.items()} == expected, df_compact.dtypes
+    assert cio.compact_dtypes(df_compact) is df_compact
+
+    # the same values, the float32 ones as decimals
+    for col in ['ra_err_a', 'flux_a']:
+        decimal = np.array([float(str(value)) for value in df_compact[col].to_numpy()])
+        assert np.array_equal(decimal, df[col], equal_nan=True), col
+    assert np.array_equal(df_compact['ID_a'].astype(float), df['ID_a'], equal_nan=True)
+    assert df_compact['id_b'].tolist() == [int(value) for value in df['id_b']]
+    for col in ['RA_a', 'xpix_a', 'z_a', 'n_a', 'seq_b', 'label_a', 'name_a']:
+        assert df_compact[col].tolist() == df[col].tolist(), col
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        fn = os.path.join(dir_tmp, 'compact.csv')
+        cio.write_catalog(df_compact, fn)
+        df_read = cio.read_catalog(fn)
+        # the float32 values are written as their decimals, the float64 values are
+        # parsed back by pandas within the rounding error
+        for col in ['ra_err_a', 'flux_a']:
+            assert np.array_equal(df_read[col], df[col], equal_nan=True), col
+        for col in ['RA_a', 'xpix_a', 'z_a']:
+            assert np.allclose(df_read[col], df[col], rtol=1e-15, atol=0), col
+
+def check_streaming():
+    """
+    Purpose
+        Match two random catalogs with do_merge_radec in memory and streamed in chunks
+        (for a single radius, a list of radii and the one-to-one strategy), in every format,
+        and check that the outputs are the same, with the same dtypes once loaded with compact
+        dtypes as in the pipeline (a chunk alone cannot decide the compact dtype of a column).
+        Also check that the chunks written by CatalogWriter give the catalog of write_catalog.
+    """
+    X1, X2 = random_catalogs(0, n1=200, n2=150, size=60.)
+    rng = np.random.default_rng(1)
+    df1 = pd.DataFrame({'ra1': X1[:, 0], 'dec1': X1[:, 1], 'id1': np.arange(len(X1)), 'flux1': rng.random(len(X1))})
+    df2 = pd.DataFrame({'ra2': X2[:, 0], 'dec2': X2[:, 1], 'name2': ['s%d'%(i) for i in range(len(X2))]})
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        for fmt, ext in cio.FORMAT_EXT.items():
+            input_dict = {'f1': [os.path.join(dir_tmp, 'f1' + ext), 'ra1', 'dec1'],
+                          'f2': [os.path.join(dir_tmp, 'f2' + ext), 'ra2', 'dec2']}
+            cio.write_catalog(df1, input_dict['f1'][0])
+            cio.write_catalog(df2, input_dict['f2'][0])
+            for radius, strategy in [(3, 'best'), ([2, 4], 'best'), (4, 'greedy')]:
+                outputs = []
+                for chunksize in [None, 7]:
+                    fn = {key: [os.path.join(dir_tmp, '%s_%s_%s%s'%(key, r, chunksize, ext)) for r in np.atleast_1d(radius)]
+                          for key in ['fn_allmatch', 'fn_bestmatch', 'fn_innerjoin']}
+                    if not isinstance(radius, list):
+                        fn = {key: fn_lst[0] for key, fn_lst in fn.items()}
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        s1.do_merge_radec(input_dict, 'f1', 'f2', radius=radius, chunksize=chunksize, 
+                                          strategy=strategy, **fn)
+                    outputs.append([cio.read_catalog(fn_out, compact=True) for fn_lst in fn.values() for fn_out in np.atleast_1d(fn_lst)])
+                for df_memory, df_stream in zip(*outputs):
+                    assert len(df_memory) > 0, (fmt, radius, strategy)
+                    pd.testing.assert_frame_equal(df_memory, df_stream, obj='%s %s %s'%(fmt, radius, strategy))
+
+            # CatalogWriter in chunks
+            fn_chunk = os.path.join(dir_tmp, 'chunk' + ext)
+            with cio.CatalogWriter(fn_chunk) as writer:
+                for start in range(0, len(df2), 40):
+                    writer.write(df2.iloc[start:start + 40])
+            pd.testing.assert_frame_equal(cio.read_catalog(fn_chunk), df2, obj=fmt)
+
+def concat_files(fn_out, fn_in_lst, tag='', upper=False, chunksize=None):
+    # toy task: write the joined contents of the input files and the tag, or in upper case
+    text = ''
+    for fn in fn_in_lst:
+        with open(fn) as f:
+            text += f.read()
+    with open(fn_out, 'w') as f:
+        f.write((text + tag).upper() if upper else text + tag)
+
+def toy_pipeline(dir_tmp, tag='x', chunksize=None):
+    """
+    Purpose
+        Pipeline of toy tasks on the files src1 and src2 of dir_tmp:
+        0 (stage a): src1 -> a, 1 (stage a): a -> b, 2 (stage b): a + src2 -> c, 
+        3 (stage c): src2 -> d, 4 (stage c): a -> a in upper case, rewriting a after its readers
+        (as the tasks of script_01 rewriting a catalog in place, it gives the same file if rerun).
+    """
+    fn = {key: os.path.join(dir_tmp, key + '.txt') for key in ['src1', 'src2', 'a', 'b', 'c', 'd']}
+    pipe = fpl.Pipeline(defaults={'chunksize': chunksize})
+    for stage, fn_in_lst, fn_out, tag_task in [('a', ['src1'], 'a', tag), ('a', ['a'], 'b', ''), 
+                                               ('b', ['a', 'src2'], 'c', ''), ('c', ['src2'], 'd', ''),
+                                               ('c', ['a'], 'a', None)]:
+        pipe.set_stage(stage)
+        fn_in_lst = [fn[key] for key in fn_in_lst]
+        kwargs = {'tag': tag_task} if tag_task is not None else {'upper': True}
+        pipe.add(concat_files, fn[fn_out], fn_in_lst, inputs=fn_in_lst, outputs=[fn[fn_out]], **kwargs,
+                 name='concat_files:%s%d'%(fn_out, len(pipe.tasks)))
+    return pipe, fn
+
+def read_files(fn):
+    contents = {}
+    for key, fn_key in fn.items():
+        with open(fn_key) as f:
+            contents[key] = f.read()
+    return contents
+
+def write_sources(fn, text1='1', text2='2'):
+    for key, text in [('src1', text1), ('src2', text2)]:
+        with open(fn[key], 'w') as f:
+            f.write(text)
+
+def check_dag():
+    """
+    Purpose
+        Check the dependencies of the toy pipeline (read after write, rewrite after read),
+        and that a run on a process pool writes the same files as a serial run.
+    """
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        pipe, fn = toy_pipeline(dir_tmp)
+        assert pipe.dependencies() == [set(), {0}, {0}, set(), {0, 1, 2}], pipe.dependencies()
+        write_sources(fn)
+        contents = []
+        for n_workers in [1, 3]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                pipe.run(n_workers=n_workers)
+            contents.append(read_files(fn))
+        assert contents[0] == contents[1], contents
+        assert contents[0]['c'] == '1x2' and contents[0]['a'] == '1X', contents[0]
+
+def check_manifest():
+    """
+    Purpose
+        Check the stale tasks of the toy pipeline with a build manifest: after a changed 
+        source file, a changed parameter, a missing output, a changed runtime setting, 
+        and with only a stage or a task name.
+    """
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        fn_manifest = os.path.join(dir_tmp, 'manifest.json')
+        pipe, fn = toy_pipeline(dir_tmp)
+        write_sources(fn)
+
+        def stale(pipe, **kwargs):
+            return [i for i, is_stale in enumerate(pipe.stale(fpl.read_manifest(fn_manifest), **kwargs)) if is_stale]
+        def run(pipe):
+            with contextlib.redirect_stdout(io.StringIO()):
+                pipe.run(fn_manifest=fn_manifest)
+
+        assert stale(pipe) == [0, 1, 2, 3, 4]
+        run(pipe)
+        assert stale(pipe) == []
+
+        # source file, the content is hashed, so touching it is not enough
+        write_sources(fn, text2='2')
+        assert stale(pipe) == []
+        write_sources(fn, text2='3')
+        assert stale(pipe) == [2, 3, 4], stale(pipe)
+        run(pipe)
+        assert read_files(fn)['d'] == '3' and read_files(fn)['a'] == '1X' and stale(pipe) == []
+
+        # parameter of the first task, and the tasks using its output
+        pipe_tag, _ = toy_pipeline(dir_tmp, tag='y')
+        assert stale(pipe_tag) == [0, 1, 2, 4], stale(pipe_tag)
+
+        # missing output
+        os.remove(fn['d'])
+        assert stale(pipe) == [3], stale(pipe)
+        run(pipe)
+
+        # runtime settings are not part of the signature
+        pipe_chunk, _ = toy_pipeline(dir_tmp, chunksize=100)
+        assert stale(pipe_chunk) == [], stale(pipe_chunk)
+
+        # only a stage or a task, and the tasks depending on them
+        assert stale(pipe, only=['a']) == [0, 1, 2, 4], stale(pipe, only=['a'])
+        assert stale(pipe, only=['c']) == [3, 4], stale(pipe, only=['c'])
+        assert stale(pipe, only=['concat_files:b1']) == [1, 4], stale(pipe, only=['concat_files:b1'])
+        assert stale(pipe, force=True) == [0, 1, 2, 3, 4]
+
+
+def toy_image(shape, seed, n_extra_axis=0):
+    # a random float32 image with a TAN WCS of 0.5 arcsec pixels around (150, 2),
+    # with leading axes of size 1 like the frequency and Stokes axes of the radio images
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN']
+    wcs.wcs.crval = [150., 2.]
+    wcs.wcs.crpix = [shape[1] / 2, shape[0] / 2]
+    wcs.wcs.cdelt = [-0.5/3600, 0.5/3600]
+    header = wcs.to_header()
+    for k in range(3, 3 + n_extra_axis):
+        header['CTYPE%d'%(k)], header['CRVAL%d'%(k)], header['CDELT%d'%(k)], header['CRPIX%d'%(k)] = \
+            ['FREQ', 'STOKES'][k - 3], 1., 1., 1.
+    data = np.random.default_rng(seed).normal(size=shape).astype(np.float32)
+    return data, wcs, header
+
+def check_cutouts():
+    """
+    Purpose
+        Cut the stamps of random sources (inside, on the edges and outside the images, and one
+        without position) out of two small images, one with radio-like leading axes, on a
+        process pool, and compare the cubes with the brute-force stamps cut pixel by pixel.
+    """
+    rng = np.random.default_rng(8)
+    n = 40
+    ra = 150. + rng.uniform(-20., 20., n) / 3600 / np.cos(np.deg2rad(2.))
+    dec = 2. + rng.uniform(-17., 17., n) / 3600
+    ra[0], dec[0] = 150. + 100./3600, 2.       # outside the images
+    ra[1] = np.nan
+    ids = np.arange(n) + 500
+
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        images, expected = {}, {}
+        for seed, (band, shape, n_extra_axis) in enumerate([('a', (50, 60), 0), ('b', (64, 48), 2)]):
+            data, wcs, header = toy_image(shape, seed, n_extra_axis)
+            images[band] = os.path.join(dir_tmp, 'image_%s.fits'%(band))
+            fits.PrimaryHDU(data.reshape((1,) * n_extra_axis + shape), header=header).writeto(images[band])
+            expected[band] = (data, wcs)
+        size = 3.2                                   # 7 pixels of 0.5 arcsec
+        fn_out_fmt = os.path.join(dir_tmp, 'cutout_%s.fits')
+        with contextlib.redirect_stdout(io.StringIO()):
+            n_stamp = fc.make_cutouts(ra, dec, images, size, fn_out_fmt, ids=ids, n_workers=2)
+
+        for band, (data, wcs) in expected.items():
+            with fits.open(fn_out_fmt%(band)) as hdul:
+                stamps, sources = hdul[0].data, hdul['SOURCES'].data
+                assert hdul[0].header['STAMPSZ'] == 7 and stamps.shape == (n, 7, 7), stamps.shape
+                # the header of a dataless HDU has NAXIS = 0, which WCS warns about
+                header_wcs = hdul['IMAGE_WCS'].header.copy()
+                del header_wcs['NAXIS']
+                wcs_out = WCS(header_wcs)
+            x, y = wcs.all_world2pix(ra, dec, 0)
+            brute = np.full((n, 7, 7), np.nan, dtype=np.float32)
+            for i in np.flatnonzero(np.isfinite(x)):
+                x0, y0 = int(np.round(x[i])) - 3, int(np.round(y[i])) - 3
+                assert sources['X0'][i] == x0 and sources['Y0'][i] == y0, (band, i)
+                for iy in range(7):
+                    for ix in range(7):
+                        if 0 <= y0 + iy < data.shape[0] and 0 <= x0 + ix < data.shape[1]:
+                            brute[i, iy, ix] = data[y0 + iy, x0 + ix]
+            assert np.array_equal(stamps, brute, equal_nan=True), band
+            has_data = np.isfinite(brute).any(axis=(1, 2))
+            is_edge = has_data & np.isnan(brute).any(axis=(1, 2))
+            assert n_stamp[band] == has_data.sum() and not has_data[:2].any() and is_edge.any(), band
+            assert np.array_equal(sources['HAS_DATA'], has_data) and np.array_equal(sources['ID'], ids), band
+            assert np.allclose(wcs_out.all_world2pix(ra, dec, 0), [x, y], equal_nan=True), band
+
+
+CHECKS = {'index_column': check_index_column, 'compact_dtypes': check_compact_dtypes,
+          'streaming': check_streaming, 'dag': check_dag, 'manifest': check_manifest,
+          'cutouts': check_cutouts}
+
+
+if __name__ == '__main__':
+    args = parse_args(CHECKS, description='Check the pipeline pieces on small catalogs.')
+    main(checks=args.checks, all_checks=CHECKS)
@@ -24,3 +24,9 @@ PATH_TABLE  = ROOT_DIR + '/../data/COSMOS/Tables/'
 
 # figure
 PATH_FIGURE = ROOT_DIR + '/output/Figures/'
+
+# benchmark
+PATH_BENCHMARK = ROOT_DIR + '/output/Benchmark/'
+
+# cutout
+PATH_CUTOUT = ROOT_DIR + '/../data/COSMOS/Image/Cutout/'
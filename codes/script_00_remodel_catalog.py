@@ -2,20 +2,29 @@
 File: script_00_remodel_catalog.py
 Name: Chia-Lin Ko
 Date: Jul 23, 2021
-Last Modified Date: Oct 14, 2021
+Last Modified Date: Oct 18, 2026
 ------------------------
 This program aims to rename and convert the original catalog 
-from the archive websites to csv and fits format for analysis.
+from the archive websites to csv, fits and parquet format for analysis.
+
+The catalogs are converted in parallel, and a catalog is only parsed 
+again when its original file (content hash and mtime) or its settings changed.
 """
 import os
+import json
+import argparse
 import pandas as pd
 from astropy.table import Table
+from concurrent.futures import ProcessPoolExecutor
 
 # my own packing
 from path import PATH_CATALOG, PATH_ORG_CATALOG
+import FuncCatalogIO as cio
+import FuncCatalogIndex as ci
+from FuncPipeline import file_state
 
 
-def main():
+def main(fmt=cio.DEFAULT_FORMAT, is_save_csv=True, n_workers=None, force=False):
 
     fn_in_lst, fn_out_lst, add_col_name_lst = read_catalog_txt('catalog.txt')
 
@@ -25,15 +34,32 @@ def main():
         os.makedirs(PATH_CATALOG)
         print(f'Create new directory: {PATH_CATALOG}')
 
-    # remodel the catalog based on the catalog.txt file
-    for i in range(len(fn_in_lst)):
-        remodel_table(
-            fn_in = PATH_ORG_CATALOG+fn_in_lst[i],
-            fn_out = PATH_CATALOG+fn_out_lst[i],
-            added_col_name=add_col_name_lst[i],
-            is_save_csv=True,
-            is_save_fits=True
-        )
+    # remodel the catalog based on the catalog.txt file, one catalog per worker process
+    # fmt is the format read by the crossmatch (script_01_make_crossmatch.py --format)
+    binary_format = None if fmt == 'csv' else fmt
+    kwargs = dict(is_save_csv=is_save_csv or fmt == 'csv', is_save_fits=True, binary_format=binary_format, force=force)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(remodel_table, 
+                                   fn_in = PATH_ORG_CATALOG+fn_in_lst[i],
+                                   fn_out = PATH_CATALOG+fn_out_lst[i],
+                                   added_col_name=add_col_name_lst[i],
+                                   **kwargs)
+                   for i in range(len(fn_in_lst))]
+        for future in futures:
+            future.result()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Rename and convert the original COSMOS catalogs.')
+    parser.add_argument('--format', default=cio.DEFAULT_FORMAT, choices=list(cio.FORMAT_EXT),
+                        help='format of the catalogs for the crossmatch, as the --format of '
+                             'script_01_make_crossmatch.py (default: %(default)s)')
+    parser.add_argument('--no-csv', action='store_true',
+                        help='do not save the catalogs in csv, unless --format is csv')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--force', action='store_true',
+                        help='convert all the catalogs, even if they are unchanged')
+    return parser.parse_args()
 
 #-----------------------------------------------------------
 # Function for remodel tables
@@ -57,7 +83,22 @@ def read_catalog_txt(fn_txt):
     return  fn_in_lst, fn_out_lst, add_col_name_lst
 
 
-def remodel_table(fn_in, fn_out, added_col_name=None, is_save_csv=True, is_save_fits=True):
+def remodel_table(fn_in, fn_out, added_col_name=None, is_save_csv=True, is_save_fits=True, binary_format=None, 
+                  force=False):
+
+    # output files, skipped if the original catalog and the settings did not change
+    fn_out_lst = []
+    if is_save_csv:
+        fn_out_lst.append(fn_out+'.csv')
+    if is_save_fits:
+        fn_out_lst.append(fn_out+'.fits')
+    if binary_format is not None:
+        fn_out_lst.append(fn_out+cio.FORMAT_EXT[binary_format])
+    fn_stamp = fn_out + '.remodel.json'
+    stamp = read_stamp(fn_stamp)
+    if not force and is_unchanged(stamp, fn_in, fn_out_lst, added_col_name):
+        print('Skip unchanged catalog %s'%(fn_in))
+        return
     
     # input table format
     if 'txt' in fn_in:
@@ -71,7 +112,11 @@ def remodel_table(fn_in, fn_out, added_col_name=None, is_save_csv=True, is_save_
     else:
         print('Please check your input catalog format')
 
-    t = Table.read(fn_in, format=tb_format)
+    if tb_format == 'fits':
+        # memory-mapped, the columns are only read when they are written out
+        t = Table.read(fn_in, format=tb_format, memmap=True)
+    else:
+        t = Table.read(fn_in, format=tb_format)
 
     if added_col_name is not None:
         rename_column(t, added_col_name)
@@ -81,11 +126,34 @@ def remodel_table(fn_in, fn_out, added_col_name=None, is_save_csv=True, is_save_
         table2csv(t, fn_out+'.csv')
     if is_save_fits:
         table2fits(t, fn_out+'.fits')
+    if binary_format is not None:
+        table2binary(t, fn_out+cio.FORMAT_EXT[binary_format])
+
+    # stamp of the original catalog, written last
+    stamp = {'source': file_state(fn_in, (stamp or {}).get('source')), 'added_col_name': added_col_name, 
+             'outputs': fn_out_lst}
+    with ci.atomic_write(fn_stamp, mode='w') as f:
+        json.dump(stamp, f, indent=1)
+    print('Remodel catalog %s'%(fn_in))
+
+def read_stamp(fn_stamp):
+    if not os.path.exists(fn_stamp):
+        return None
+    with open(fn_stamp) as f:
+        return json.load(f)
+
+def is_unchanged(stamp, fn_in, fn_out_lst, added_col_name):
+    # same settings, all outputs on disk, and the same content of the original catalog
+    if stamp is None or stamp['added_col_name'] != added_col_name or stamp['outputs'] != fn_out_lst:
+        return False
+    if not all(os.path.exists(fn) for fn in fn_out_lst):
+        return False
+    return file_state(fn_in, stamp['source'])['hash'] == stamp['source']['hash']
 
 def rename_column(astro_table, added_col_name):
-    col_names = astro_table.colnames
-    for col_name in col_names:
-        astro_table.rename_column(col_name, col_name+added_col_name)
+    # rename all the columns at once
+    col_names = list(astro_table.colnames)
+    astro_table.rename_columns(col_names, [col_name+added_col_name for col_name in col_names])
 
 def table2csv(astro_table, fn_out):
     astro_table.write(fn_out, format='csv', overwrite=True)
@@ -93,9 +161,16 @@ def table2csv(astro_table, fn_out):
 def table2fits(astro_table, fn_out):
     astro_table.write(fn_out, format='fits', overwrite=True)
 
+def table2binary(astro_table, fn_out):
+    # columnar binary format (parquet or feather) for the crossmatch pipeline, with compact dtypes
+    astro_table = astro_table.copy(copy_data=False)
+    astro_table.convert_bytestring_to_unicode()
+    cio.write_catalog(cio.compact_dtypes(astro_table.to_pandas()), fn_out)
+
 def table2latex(astro_table, fn_out):
     astro_table.write(fn_out, format='latex', overwrite=True)
 
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    main(fmt=args.format, is_save_csv=not args.no_csv, n_workers=args.workers, force=args.force)
@@ -2,22 +2,34 @@
 File: script_make_crossmatch.py
 Name: Chia-Lin Ko
 Date: Jun 09, 2021
-Last Modified Date: Mar 04, 2022
+Last Modified Date: Oct 18, 2026
 ------------------------
 This program aims to crossmatch tables.
 """
 import numpy as np
 import pandas as pd
+import argparse
 import os
 
 # my own packing
 from path import PATH_CATALOG, PATH_CATALOG_CROSSMATCH
 import FuncTableCrossmatch as tc
+import FuncCatalogIndex as ci
+import FuncCatalogIO as cio
+import FuncLikelihoodRatio as flr
+from FuncPipeline import Pipeline
+from FuncCatalogStore import CatalogStore
+import FuncProfile as fp
 
 
-def main():
+def main(fmt=cio.DEFAULT_FORMAT, is_export_csv=True, n_workers=1, force=False, only=None, max_memory=4e9, 
+         chunksize=None, match_workers=None, fn_profile=None, cprofile=None, strategy=None, io_workers=2):
 
-    fn_dict = set_filename()
+    fn_dict = set_filename(fmt)
+
+    # run report of the stages, one json line per stage
+    if fn_profile is not None:
+        fp.enable(fn_profile, cprofile=cprofile)
 
     # create the directory if not exist
     isExist = os.path.exists(PATH_CATALOG_CROSSMATCH)
@@ -25,71 +37,165 @@ def main():
         os.makedirs(PATH_CATALOG_CROSSMATCH)
         print(f'Create new directory: {PATH_CATALOG_CROSSMATCH}')
 
-    # cross match
-    crossmatch_450um(fn_dict)
-    crossmatch_1d4GHz(fn_dict)
-    crossmatch_3GHz(fn_dict)
-    crossmatch_MIPS(fn_dict)
-    crossmatch_IRAC(fn_dict)
+    # cross match, as a DAG of tasks
+    # a serial run keeps the catalogs in memory, the worker processes exchange them by file;
+    # with io_workers, the store reads the next catalogs and writes the results in the background
+    store = CatalogStore(max_memory=max_memory, compact=True, io_workers=io_workers) if n_workers <= 1 else None
+    # with a chunksize, the radec crossmatches stream the f1 catalogs in chunks of rows
+    # with match_workers, each radec crossmatch is split into Dec zones on a process pool (serial run only)
+    if n_workers > 1 and match_workers is not None:
+        print('Ignore the match workers on a process pool of %d workers'%(n_workers))
+        match_workers = None
+    pipe = Pipeline(store=store, defaults={'chunksize': chunksize, 'match_workers': match_workers, 'strategy': strategy})
+    for stage in [crossmatch_450um, crossmatch_1d4GHz, crossmatch_3GHz, crossmatch_MIPS, crossmatch_IRAC]:
+        pipe.set_stage(stage.__name__)
+        stage(fn_dict, pipe)
+
+    # csv export of the crossmatch catalogs, as the optional final step
+    if is_export_csv and fmt != 'csv':
+        pipe.set_stage('export_csv')
+        export_csv(fn_dict, pipe)
+
+    # only rerun the stale tasks recorded in the build manifest
+    fn_manifest = PATH_CATALOG_CROSSMATCH + 'manifest.json'
+    pipe.run(n_workers=n_workers, fn_manifest=fn_manifest, force=force, only=only)
+    if fn_profile is not None:
+        fp.disable()
+        print(fp.summary(fn_profile).to_string(float_format='%.3f'))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Crossmatch the COSMOS catalogs.')
+    parser.add_argument('--format', default=cio.DEFAULT_FORMAT, choices=list(cio.FORMAT_EXT),
+                        help='format of the catalogs and the crossmatch catalogs')
+    parser.add_argument('--no-csv', action='store_true',
+                        help='do not export the crossmatch catalogs to csv')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of worker processes; with more than 1, the independent tasks run '
+                             'on a process pool, without the catalog store, --io-workers and '
+                             '--match-workers of the serial run (default: %(default)s, serial)')
+    parser.add_argument('--memory', type=float, default=4,
+                        help='memory budget in GB of the in-memory catalog store of a serial run')
+    parser.add_argument('--io-workers', type=int, default=2,
+                        help='number of background I/O threads of a serial run, which prefetch the '
+                             'catalogs of the next tasks and write the results (default: %(default)s, 0: no overlap)')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='stream the crossmatched catalogs in chunks of this many rows, '
+                             'to bound the memory for catalogs larger than RAM')
+    parser.add_argument('--match-workers', type=int, default=None,
+                        help='number of worker processes of each radec crossmatch, '
+                             'matching Dec zones of the sky in parallel (only with -j 1)')
+    parser.add_argument('--strategy', choices=['best', 'greedy', 'mutual', 'lr'], default=None,
+                        help='best match of the radec crossmatches: the nearest counterpart (best, default), '
+                             'one-to-one matches, assigned nearest first (greedy) or only between '
+                             'mutual nearest neighbours (mutual), or the most reliable counterpart '
+                             'by likelihood ratio (lr)')
+    parser.add_argument('--profile', default=None, metavar='REPORT',
+                        help='append the time, phases, counts and peak memory of each stage '
+                             'to this json-lines report, and print a summary')
+    parser.add_argument('--cprofile', action='append', metavar='STAGE',
+                        help='also run this stage (e.g. do_merge_radec) or output under cProfile, '
+                             'can be repeated')
+    parser.add_argument('--force', action='store_true',
+                        help='rerun all the stages, even if their inputs and parameters are unchanged')
+    parser.add_argument('--only', action='append', metavar='STAGE',
+                        help='only rerun this stage (e.g. crossmatch_IRAC) or task, and the tasks '
+                             'using its outputs, can be repeated')
+    return parser.parse_args()
 
     
 #-----------------------------------------------------------
 # Functions for crossmatch tables
-def set_filename():
+def set_filename(fmt=cio.DEFAULT_FORMAT):
     fn_dict = {}
+    ext = cio.FORMAT_EXT[fmt]
 
     # original catalog
-    fn_dict['fn_JCMT_450umUgne']  = '%scosmos_jcmt_450um_SEDUgne_2020cat.csv'%(PATH_CATALOG)
-    fn_dict['fn_JCMT_450umLim']   = '%scosmos_jcmt_450um_2020cat.csv'%(PATH_CATALOG)
-    fn_dict['fn_JCMT_450umGao']   = '%scosmos_jcmt_450um_2021cat.csv'%(PATH_CATALOG)
-    fn_dict['fn_VLA_1d4GHzdp']    = '%scosmos_vla_1d4GHz_dp_2011cat.csv'%(PATH_CATALOG)
-    fn_dict['fn_VLA_1d4GHzXS']    = '%scosmos_vla_1d4GHz_XS_2021cat.csv'%(PATH_CATALOG)
-    fn_dict['fn_VLA_3GHzlp']      = '%scosmos_vla_3GHz_2017cat.csv'%(PATH_CATALOG)
-    fn_dict['fn_VLA_3GHzAGN']     = '%scosmos_vla_3GHz_multiAGN_2017cat.csv'%(PATH_CATALOG)
-    fn_dict['fn_VLA_3GHzXS']      = '%scosmos_vla_3GHz_10GHz_XS_2021cat.csv'%(PATH_CATALOG)
-    fn_dict['fn_IRAC']            = '%scosmos_irac_2007cat.csv'%(PATH_CATALOG)
-    fn_dict['fn_MIPS_LeFloch']    = '%scosmos_mips_24um_LeFloch_2008cat.csv'%(PATH_CATALOG)
-    fn_dict['fn_MIPS_whwang']     = '%scosmos_mips_24um_whwang_2020cat.csv'%(PATH_CATALOG)
+    fn_dict['fn_JCMT_450umUgne']  = '%scosmos_jcmt_450um_SEDUgne_2020cat%s'%(PATH_CATALOG, ext)
+    fn_dict['fn_JCMT_450umLim']   = '%scosmos_jcmt_450um_2020cat%s'%(PATH_CATALOG, ext)
+    fn_dict['fn_JCMT_450umGao']   = '%scosmos_jcmt_450um_2021cat%s'%(PATH_CATALOG, ext)
+    fn_dict['fn_VLA_1d4GHzdp']    = '%scosmos_vla_1d4GHz_dp_2011cat%s'%(PATH_CATALOG, ext)
+    fn_dict['fn_VLA_1d4GHzXS']    = '%scosmos_vla_1d4GHz_XS_2021cat%s'%(PATH_CATALOG, ext)
+    fn_dict['fn_VLA_3GHzlp']      = '%scosmos_vla_3GHz_2017cat%s'%(PATH_CATALOG, ext)
+    fn_dict['fn_VLA_3GHzAGN']     = '%scosmos_vla_3GHz_multiAGN_2017cat%s'%(PATH_CATALOG, ext)
+    fn_dict['fn_VLA_3GHzXS']      = '%scosmos_vla_3GHz_10GHz_XS_2021cat%s'%(PATH_CATALOG, ext)
+    fn_dict['fn_IRAC']            = '%scosmos_irac_2007cat%s'%(PATH_CATALOG, ext)
+    fn_dict['fn_MIPS_LeFloch']    = '%scosmos_mips_24um_LeFloch_2008cat%s'%(PATH_CATALOG, ext)
+    fn_dict['fn_MIPS_whwang']     = '%scosmos_mips_24um_whwang_2020cat%s'%(PATH_CATALOG, ext)
+
+    # merged catalog
+    fn_dict['fn_MIPS_union']      = '%scosmos_mips_24um_union%s'%(PATH_CATALOG_CROSSMATCH, ext)
 
     # cross-matched catalog
-    fn_dict['fn_match_3GHzlpAGN']                           = '%scosmos_match_3GHzlpAGN.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_3GHzlpAGN_1d4GHzdp']                  = '%scosmos_match_3GHzlpAGN_1d4GHzdp.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_3GHzlpAGN_1d4GHzXS']                  = '%scosmos_match_3GHzlpAGN_1d4GHzXS.csv'%(PATH_CATALOG_CROSSMATCH)
+    fn_dict['fn_match_3GHzlpAGN']                           = '%scosmos_match_3GHzlpAGN%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_3GHzlpAGN_1d4GHzdp']                  = '%scosmos_match_3GHzlpAGN_1d4GHzdp%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_3GHzlpAGN_1d4GHzXS']                  = '%scosmos_match_3GHzlpAGN_1d4GHzXS%s'%(PATH_CATALOG_CROSSMATCH, ext)
 
     # Ugne based crossmatch catalogs
-    fn_dict['fn_match_UgneLim']                             = '%scosmos_match_450umUgneLim.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_UgneLim_1d4GHzXS']                    = '%scosmos_match_450umUgneLim_1d4GHzXS.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp']             = '%scosmos_match_450umUgneLim_1d4GHzXS_3GHzlp.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_irac']        = '%scosmos_match_450umUgneLim_1d4GHzXS_3GHzlp_irac.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsW']       = '%scosmos_match_450umUgneLim_1d4GHzXS_3GHzlp_mipsW.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsL']       = '%scosmos_match_450umUgneLim_1d4GHzXS_3GHzlp_mipsL.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsW_irac']  = '%scosmos_match_450umUgneLim_1d4GHzXS_3GHzlp_mipsW_irac.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsL_irac']  = '%scosmos_match_450umUgneLim_1d4GHzXS_3GHzlp_mipsL_irac.csv'%(PATH_CATALOG_CROSSMATCH)
+    fn_dict['fn_match_UgneLim']                             = '%scosmos_match_450umUgneLim%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_UgneLim_1d4GHzXS']                    = '%scosmos_match_450umUgneLim_1d4GHzXS%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp']             = '%scosmos_match_450umUgneLim_1d4GHzXS_3GHzlp%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_irac']        = '%scosmos_match_450umUgneLim_1d4GHzXS_3GHzlp_irac%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsU']       = '%scosmos_match_450umUgneLim_1d4GHzXS_3GHzlp_mipsU%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsU_irac']  = '%scosmos_match_450umUgneLim_1d4GHzXS_3GHzlp_mipsU_irac%s'%(PATH_CATALOG_CROSSMATCH, ext)
 
     # Lim based crossmatch catalogs
-    fn_dict['fn_match_Lim_1d4GHzXS']                        = '%scosmos_match_450umLim_1d4GHzXS.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp']                 = '%scosmos_match_450umLim_1d4GHzXS_3GHzlp.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_irac']            = '%scosmos_match_450umLim_1d4GHzXS_3GHzlp_irac.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsW']            = '%scosmos_match_450umLim_1d4GHzXS_3GHzlp_mipsW.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsL']            = '%scosmos_match_450umLim_1d4GHzXS_3GHzlp_mipsL.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsW_irac']       = '%scosmos_match_450umLim_1d4GHzXS_3GHzlp_mipsW_irac.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsL_irac']       = '%scosmos_match_450umLim_1d4GHzXS_3GHzlp_mipsL_irac.csv'%(PATH_CATALOG_CROSSMATCH)
+    fn_dict['fn_match_Lim_1d4GHzXS']                        = '%scosmos_match_450umLim_1d4GHzXS%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp']                 = '%scosmos_match_450umLim_1d4GHzXS_3GHzlp%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_irac']            = '%scosmos_match_450umLim_1d4GHzXS_3GHzlp_irac%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsU']            = '%scosmos_match_450umLim_1d4GHzXS_3GHzlp_mipsU%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsU_irac']       = '%scosmos_match_450umLim_1d4GHzXS_3GHzlp_mipsU_irac%s'%(PATH_CATALOG_CROSSMATCH, ext)
 
     # Gao based crossmatch catalogs
-    fn_dict['fn_match_GaoLim']                             = '%scosmos_match_450umGaoLim.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_GaoLim_1d4GHzXS']                    = '%scosmos_match_450umGaoLim_1d4GHzXS.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp']             = '%scosmos_match_450umGaoLim_1d4GHzXS_3GHzlp.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_irac']        = '%scosmos_match_450umGaoLim_1d4GHzXS_3GHzlp_irac.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsW']       = '%scosmos_match_450umGaoLim_1d4GHzXS_3GHzlp_mipsW.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsL']       = '%scosmos_match_450umGaoLim_1d4GHzXS_3GHzlp_mipsL.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsW_irac']  = '%scosmos_match_450umGaoLim_1d4GHzXS_3GHzlp_mipsW_irac.csv'%(PATH_CATALOG_CROSSMATCH)
-    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsL_irac']  = '%scosmos_match_450umGaoLim_1d4GHzXS_3GHzlp_mipsL_irac.csv'%(PATH_CATALOG_CROSSMATCH)
+    fn_dict['fn_match_GaoLim']                             = '%scosmos_match_450umGaoLim%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_GaoLim_1d4GHzXS']                    = '%scosmos_match_450umGaoLim_1d4GHzXS%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp']             = '%scosmos_match_450umGaoLim_1d4GHzXS_3GHzlp%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_irac']        = '%scosmos_match_450umGaoLim_1d4GHzXS_3GHzlp_irac%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsU']       = '%scosmos_match_450umGaoLim_1d4GHzXS_3GHzlp_mipsU%s'%(PATH_CATALOG_CROSSMATCH, ext)
+    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsU_irac']  = '%scosmos_match_450umGaoLim_1d4GHzXS_3GHzlp_mipsU_irac%s'%(PATH_CATALOG_CROSSMATCH, ext)
 
     return fn_dict
 
-def adjust_450umLim(fn, col_name):
+def export_csv(fn_dict, pipe):
+    # csv copy of every crossmatch catalog (and of the MIPS union) written by the pipeline,
+    # the catalogs of set_RadioDet and set_RadioNotDet_MipsDet keep their row index as in the csv pipeline
+    outputs = set(fn for task in pipe.tasks for fn in task.outputs)
+    indexed = set(fn for task in pipe.tasks if task.func in (set_RadioDet, set_RadioNotDet_MipsDet) 
+                  for fn in task.outputs)
+    for key, fn in fn_dict.items():
+        if key.startswith(('fn_match', 'fn_MIPS_union')) and fn in outputs:
+            pipe.add(save_csv, fn, index=fn in indexed, inputs=[fn], outputs=[cio.with_format(fn, 'csv')])
+
+def save_csv(fn, index=False, store=None):
+    fn_csv = cio.with_format(fn, 'csv')
+    cio.write_catalog(load_catalog(fn, store), fn_csv, index=index)
+    print('Save csv catalog %s'%(fn_csv))
+
+def load_catalog(fn, store=None, columns=None):
+    # read the catalog (or only the given columns) with compact dtypes, from the in-memory store if given
+    with fp.phase('read'):
+        if store is None:
+            df = cio.read_catalog(fn, columns=columns, compact=True)
+        else:
+            df = store.get(fn, columns=columns)
+    fp.record_df('read', df)
+    return df
+
+def save_catalog(df, fn, store=None, index=False):
+    # save the catalog with compact dtypes, to the in-memory store if given,
+    # with index, the row index becomes the 'Unnamed: 0' column read back by the next tasks
+    if index:
+        df = cio.index_to_column(df)
+    df = cio.compact_dtypes(df)
+    fp.record_df('write', df)
+    with fp.phase('write'):
+        if store is None:
+            cio.write_catalog(df, fn, index=index)
+        else:
+            store.put(fn, df, index=index)
+
+def adjust_450umLim(fn, col_name, store=None):
     
-    df = pd.read_csv(fn)
+    df = load_catalog(fn, store)
 
     # rename RA and Dec
     df = df.rename(columns={'RA_450_450umLim':'RA_450umLim'})
@@ -99,15 +205,21 @@ def adjust_450umLim(fn, col_name):
     df = df.drop([col_name], axis=1, errors='ignore')
     df.insert(0,col_name, df.index)
 
-    df.to_csv(fn, index=False, header=True)
+    save_catalog(df, fn, store, index=False)
 
-def split_column_to_another_column(fn, column_name, new_column_name):
-    df = pd.read_csv(fn)
+def split_column_to_another_column(fn, column_name, new_column_name, store=None):
+    df = load_catalog(fn, store)
     df = df.drop([new_column_name], axis=1, errors='ignore')
-    df.insert(0, new_column_name, df[column_name].str.split("_",expand=True)[1])
-    df.to_csv(fn, index=False, header=True)
+    new_column = df[column_name].str.split("_",expand=True)[1]
+    try:
+        # numeric ID, as it is read back from a csv file
+        new_column = pd.to_numeric(new_column)
+    except ValueError:
+        pass
+    df.insert(0, new_column_name, new_column)
+    save_catalog(df, fn, store, index=False)
 
-def crossmatch_450um(fn_dict):
+def crossmatch_450um(fn_dict, pipe):
 
     input_dict = {} # filename, column_ra, column_dec
     input_dict['JCMT_450umUgne']   = [fn_dict['fn_JCMT_450umUgne'] ]
@@ -115,25 +227,27 @@ def crossmatch_450um(fn_dict):
     input_dict['JCMT_450umLim']    = [fn_dict['fn_JCMT_450umLim'],   'RA_450umLim',     'DEC_450umLim']
 
     # create the ID_450umLim for the 450umLim and the 450SEDUgne csv files
-    adjust_450umLim(fn_dict['fn_JCMT_450umLim'], 'ID_450umLim')
-    split_column_to_another_column(fn_dict['fn_JCMT_450umUgne'], 'ID_450umSEDUgne', 'ID_450umLim')
+    pipe.add(adjust_450umLim, fn_dict['fn_JCMT_450umLim'], 'ID_450umLim', 
+        inputs=[fn_dict['fn_JCMT_450umLim']], outputs=[fn_dict['fn_JCMT_450umLim']])
+    pipe.add(split_column_to_another_column, fn_dict['fn_JCMT_450umUgne'], 'ID_450umSEDUgne', 'ID_450umLim', 
+        inputs=[fn_dict['fn_JCMT_450umUgne']], outputs=[fn_dict['fn_JCMT_450umUgne']])
 
     # cross match with JCMT 450 um, Lim
-    do_merge_value(input_dict, f1_key= 'JCMT_450umUgne', f2_key = 'JCMT_450umLim', 
+    add_merge_value(pipe, input_dict, f1_key= 'JCMT_450umUgne', f2_key = 'JCMT_450umLim', 
         f1_value='ID_450umLim', f2_value='ID_450umLim', join_type = 'inner', fn_match = fn_dict['fn_match_UgneLim'] )    
-    do_merge_radec(input_dict, f1_key= 'JCMT_450umGao',  f2_key = 'JCMT_450umLim', radius=4, fn_bestmatch = fn_dict['fn_match_GaoLim'])
+    add_merge_radec(pipe, input_dict, f1_key= 'JCMT_450umGao',  f2_key = 'JCMT_450umLim', radius=4, fn_bestmatch = fn_dict['fn_match_GaoLim'])
 
 def set_450umID(fn_in):
     # Ugne SED
 
-    df = pd.read_csv(fn_in)
+    df = cio.read_catalog(fn_in)
     df.insert(0,'ID_450umLim', df.index)
 
     # Lim 
-    df = pd.read_csv(fn_in)
+    df = cio.read_catalog(fn_in)
     df.insert(0,'ID_450umLim', df['ID_450umSEDUgne'].str.split("_",expand=True)[1])
 
-def crossmatch_1d4GHz(fn_dict):  
+def crossmatch_1d4GHz(fn_dict, pipe):  
 
     input_dict = {} # filename, column_ra, column_dec
     input_dict['VLA_1d4GHzXS']      = [fn_dict['fn_VLA_1d4GHzXS'],     'RA_1d4GHzXS',       'DEC_1d4GHzXS']
@@ -141,11 +255,11 @@ def crossmatch_1d4GHz(fn_dict):
     input_dict['JCMT_450umLim']     = [fn_dict['fn_JCMT_450umLim'],    'RA_450umLim',       'DEC_450umLim']
     input_dict['match_GaoLim']      = [fn_dict['fn_match_GaoLim'],     'RA_450umGao',       'Dec_450umGao']
 
-    do_merge_radec(input_dict, f1_key= 'match_UgneLim', f2_key = 'VLA_1d4GHzXS', radius=3, fn_bestmatch = fn_dict['fn_match_UgneLim_1d4GHzXS'])
-    do_merge_radec(input_dict, f1_key= 'JCMT_450umLim', f2_key = 'VLA_1d4GHzXS', radius=3, fn_bestmatch = fn_dict['fn_match_Lim_1d4GHzXS'])
-    do_merge_radec(input_dict, f1_key= 'match_GaoLim',  f2_key = 'VLA_1d4GHzXS', radius=3, fn_bestmatch = fn_dict['fn_match_GaoLim_1d4GHzXS'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_UgneLim', f2_key = 'VLA_1d4GHzXS', radius=3, fn_bestmatch = fn_dict['fn_match_UgneLim_1d4GHzXS'])
+    add_merge_radec(pipe, input_dict, f1_key= 'JCMT_450umLim', f2_key = 'VLA_1d4GHzXS', radius=3, fn_bestmatch = fn_dict['fn_match_Lim_1d4GHzXS'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_GaoLim',  f2_key = 'VLA_1d4GHzXS', radius=3, fn_bestmatch = fn_dict['fn_match_GaoLim_1d4GHzXS'])
 
-def crossmatch_3GHz(fn_dict):
+def crossmatch_3GHz(fn_dict, pipe):
 
     input_dict = {} # filename, column_ra, column_dec
     input_dict['VLA_3GHzlp']                = [fn_dict['fn_VLA_3GHzlp']  ]
@@ -156,89 +270,95 @@ def crossmatch_3GHz(fn_dict):
     input_dict['match_Lim_1d4GHzXS']        = [fn_dict['fn_match_Lim_1d4GHzXS'],        'RA_450umLim',    'DEC_450umLim']
     input_dict['match_GaoLim_1d4GHzXS']     = [fn_dict['fn_match_GaoLim_1d4GHzXS'],     'RA_450umGao',    'Dec_450umGao']
     
-    do_merge_value(input_dict, f1_key= 'VLA_3GHzlp', f2_key = 'VLA_3GHzAGN', 
+    add_merge_value(pipe, input_dict, f1_key= 'VLA_3GHzlp', f2_key = 'VLA_3GHzAGN', 
         f1_value='id_3GHzlp', f2_value='ID_VLA_3GHzMultiAGN', join_type = 'outer', fn_match = fn_dict['fn_match_3GHzlpAGN'])
 
-    do_merge_radec(input_dict, f1_key= 'match_UgneLim_1d4GHzXS',f2_key = 'VLA_3GHzlpAGN', radius=4, fn_bestmatch = fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp'])
-    do_merge_radec(input_dict, f1_key= 'match_Lim_1d4GHzXS',    f2_key = 'VLA_3GHzlpAGN', radius=4, fn_bestmatch = fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp'])
-    do_merge_radec(input_dict, f1_key= 'match_GaoLim_1d4GHzXS', f2_key = 'VLA_3GHzlpAGN', radius=4, fn_bestmatch = fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_UgneLim_1d4GHzXS',f2_key = 'VLA_3GHzlpAGN', radius=4, fn_bestmatch = fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_Lim_1d4GHzXS',    f2_key = 'VLA_3GHzlpAGN', radius=4, fn_bestmatch = fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_GaoLim_1d4GHzXS', f2_key = 'VLA_3GHzlpAGN', radius=4, fn_bestmatch = fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp'])
     
-    set_RadioDet(fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp'],   fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp'])
-    set_RadioDet(fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp'],       fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp'])
-    set_RadioDet(fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp'],    fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp'])
+    add_set_RadioDet(pipe, fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp'], fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp'])
+    add_set_RadioDet(pipe, fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp'],     fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp'])
+    add_set_RadioDet(pipe, fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp'], fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp'])
+
+def add_set_RadioDet(pipe, fn_in, fn_out):
+    pipe.add(set_RadioDet, fn_in, fn_out, inputs=[fn_in], outputs=[fn_out])
 
-def set_RadioDet(fn_in, fn_out):
+@fp.profiled
+def set_RadioDet(fn_in, fn_out, store=None):
 
-    df = pd.read_csv(fn_in)
-    df['ra_radio']      = np.where(df['ra_3GHzlp'].notna(), df['ra_3GHzlp'], df['RA_1d4GHzXS'])
-    df['ra_err_radio']  = np.where(df['ra_3GHzlp'].notna(), df['ra_err_3GHzlp'], df['E_RA_1d4GHzXS'])
-    df['dec_radio']     = np.where(df['ra_3GHzlp'].notna(), df['dec_3GHzlp'], df['DEC_1d4GHzXS'])
-    df['dec_err_radio'] = np.where(df['ra_3GHzlp'].notna(), df['dec_err_3GHzlp'], df['E_DEC_1d4GHzXS'])
+    df = load_catalog(fn_in, store)
+    with fp.phase('compute'):
+        df['ra_radio']      = np.where(df['ra_3GHzlp'].notna(), df['ra_3GHzlp'], df['RA_1d4GHzXS'])
+        df['ra_err_radio']  = np.where(df['ra_3GHzlp'].notna(), df['ra_err_3GHzlp'], df['E_RA_1d4GHzXS'])
+        df['dec_radio']     = np.where(df['ra_3GHzlp'].notna(), df['dec_3GHzlp'], df['DEC_1d4GHzXS'])
+        df['dec_err_radio'] = np.where(df['ra_3GHzlp'].notna(), df['dec_err_3GHzlp'], df['E_DEC_1d4GHzXS'])
 
-    # radio detection
-    conditions          = [df['ra_3GHzlp'].notna() & df['RA_1d4GHzXS'].notna(), df['ra_3GHzlp'].notna(), df['RA_1d4GHzXS'].notna()]
-    choices             = ['3 & 1.4', '3', '1.4']
-    df['radio_det']     = np.select(conditions, choices, default=np.nan)
+        # radio detection
+        conditions          = [df['ra_3GHzlp'].notna() & df['RA_1d4GHzXS'].notna(), df['ra_3GHzlp'].notna(), df['RA_1d4GHzXS'].notna()]
+        choices             = ['3 & 1.4', '3', '1.4']
+        df['radio_det']     = pd.Categorical(np.select(conditions, choices, default=''), categories=choices)
 
     if 'Unnamed: 0' in df.columns:
         df.drop(df.columns[df.columns.str.contains('unnamed',case = False)],axis = 1, inplace = True)
 
     # save csv
-    df.to_csv(fn_out, index=True, header=True)
+    save_catalog(df, fn_out, store, index=True)
     print('Save matched catalog %s'%(fn_out))
 
-def crossmatch_MIPS(fn_dict):
+def crossmatch_MIPS(fn_dict, pipe):
     
-    fn_Ugne_mipsL    = fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsL']
-    fn_Ugne_mipsW    = fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsW']
-    fn_Lim_mipsL     = fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsL']
-    fn_Lim_mipsW     = fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsW']    
-    fn_Gao_mipsL     = fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsL']
-    fn_Gao_mipsW     = fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsW']
+    fn_Ugne_mipsU    = fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsU']
+    fn_Lim_mipsU     = fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsU']
+    fn_Gao_mipsU     = fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsU']
 
     
     input_dict = {} # filename, column_ra, column_dec
     input_dict['MIPS_LeFloch']                     = [fn_dict['fn_MIPS_LeFloch'],                      'RA_J2000_24umLeFloch',  'DEC_J2000_24umLeFloch']
     input_dict['MIPS_whwang']                      = [fn_dict['fn_MIPS_whwang'],                       'RA_mips24_24umWang',    'DEC_mips24_24umWang']
+    input_dict['MIPS_union']                       = [fn_dict['fn_MIPS_union'],                        'ra_union',              'dec_union']
     input_dict['match_UgneLim_1d4GHzXS_3GHzlp']    = [fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp'],     'RA_450umLim',           'DEC_450umLim']
     input_dict['match_Lim_1d4GHzXS_3GHzlp']        = [fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp'],         'RA_450umLim',           'DEC_450umLim']
     input_dict['match_GaoLim_1d4GHzXS_3GHzlp']     = [fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp'],      'RA_450umGao',           'Dec_450umGao']    
 
-    # LeFloch
-    do_merge_radec(input_dict, f1_key= 'match_UgneLim_1d4GHzXS_3GHzlp',f2_key = 'MIPS_LeFloch', radius=4, fn_bestmatch = fn_Ugne_mipsL)
-    do_merge_radec(input_dict, f1_key= 'match_Lim_1d4GHzXS_3GHzlp',    f2_key = 'MIPS_LeFloch', radius=4, fn_bestmatch = fn_Lim_mipsL)
-    do_merge_radec(input_dict, f1_key= 'match_GaoLim_1d4GHzXS_3GHzlp', f2_key = 'MIPS_LeFloch', radius=4, fn_bestmatch = fn_Gao_mipsL)
-    set_RadioNotDet_MipsDet(fn_Ugne_mipsL, fn_Ugne_mipsL, mips='LeFloch')
-    set_RadioNotDet_MipsDet(fn_Lim_mipsL,  fn_Lim_mipsL, mips='LeFloch')
-    set_RadioNotDet_MipsDet(fn_Gao_mipsL,  fn_Gao_mipsL, mips='LeFloch')
-
-    # Whwang
-    do_merge_radec(input_dict, f1_key= 'match_UgneLim_1d4GHzXS_3GHzlp',f2_key = 'MIPS_whwang', radius=4, fn_bestmatch = fn_Ugne_mipsW)
-    do_merge_radec(input_dict, f1_key= 'match_Lim_1d4GHzXS_3GHzlp',    f2_key = 'MIPS_whwang', radius=4, fn_bestmatch = fn_Lim_mipsW)
-    do_merge_radec(input_dict, f1_key= 'match_GaoLim_1d4GHzXS_3GHzlp', f2_key = 'MIPS_whwang', radius=4, fn_bestmatch = fn_Gao_mipsW)
-    set_RadioNotDet_MipsDet(fn_Ugne_mipsW, fn_Ugne_mipsW, mips='whwang')
-    set_RadioNotDet_MipsDet(fn_Lim_mipsW,  fn_Lim_mipsW, mips='whwang')
-    set_RadioNotDet_MipsDet(fn_Gao_mipsW,  fn_Gao_mipsW, mips='whwang')
-
-
-def set_RadioNotDet_MipsDet(fn_in, fn_out, mips='LeFloch'):
-
-    df = pd.read_csv(fn_in)
-    if mips =='LeFloch':
-        df['ra_nradio_mips']       = np.where(df['ra_radio'].notna(), np.nan, df['RA_J2000_24umLeFloch'])
-        df['dec_nradio_mips']      = np.where(df['ra_radio'].notna(), np.nan, df['DEC_J2000_24umLeFloch'])
-    elif mips =='whwang':
-        df['ra_nradio_mips']       = np.where(df['ra_radio'].notna(), np.nan, df['RA_mips24_24umWang'])
-        df['dec_nradio_mips']      = np.where(df['ra_radio'].notna(), np.nan, df['DEC_mips24_24umWang'])
+    # Union of LeFloch and Whwang, deduplicated, with the LeFloch positions first,
+    # which carries the columns of both catalogs, so the 450um catalogs are matched once
+    add_union_radec(pipe, input_dict, keys=['MIPS_LeFloch', 'MIPS_whwang'], names=['24umLeFloch', '24umWang'], 
+                    radius=2, fn_union=fn_dict['fn_MIPS_union'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_UgneLim_1d4GHzXS_3GHzlp',f2_key = 'MIPS_union', radius=4, fn_bestmatch = fn_Ugne_mipsU)
+    add_merge_radec(pipe, input_dict, f1_key= 'match_Lim_1d4GHzXS_3GHzlp',    f2_key = 'MIPS_union', radius=4, fn_bestmatch = fn_Lim_mipsU)
+    add_merge_radec(pipe, input_dict, f1_key= 'match_GaoLim_1d4GHzXS_3GHzlp', f2_key = 'MIPS_union', radius=4, fn_bestmatch = fn_Gao_mipsU)
+    add_set_RadioNotDet_MipsDet(pipe, fn_Ugne_mipsU, fn_Ugne_mipsU, mips='union')
+    add_set_RadioNotDet_MipsDet(pipe, fn_Lim_mipsU, fn_Lim_mipsU, mips='union')
+    add_set_RadioNotDet_MipsDet(pipe, fn_Gao_mipsU, fn_Gao_mipsU, mips='union')
+
+
+def add_set_RadioNotDet_MipsDet(pipe, fn_in, fn_out, mips='LeFloch'):
+    pipe.add(set_RadioNotDet_MipsDet, fn_in, fn_out, mips=mips, inputs=[fn_in], outputs=[fn_out])
+
+@fp.profiled
+def set_RadioNotDet_MipsDet(fn_in, fn_out, mips='LeFloch', store=None):
+
+    df = load_catalog(fn_in, store)
+    with fp.phase('compute'):
+        if mips =='LeFloch':
+            df['ra_nradio_mips']       = np.where(df['ra_radio'].notna(), np.nan, df['RA_J2000_24umLeFloch'])
+            df['dec_nradio_mips']      = np.where(df['ra_radio'].notna(), np.nan, df['DEC_J2000_24umLeFloch'])
+        elif mips =='whwang':
+            df['ra_nradio_mips']       = np.where(df['ra_radio'].notna(), np.nan, df['RA_mips24_24umWang'])
+            df['dec_nradio_mips']      = np.where(df['ra_radio'].notna(), np.nan, df['DEC_mips24_24umWang'])
+        elif mips =='union':
+            df['ra_nradio_mips']       = np.where(df['ra_radio'].notna(), np.nan, df['ra_union'])
+            df['dec_nradio_mips']      = np.where(df['ra_radio'].notna(), np.nan, df['dec_union'])
 
     if 'Unnamed: 0' in df.columns:
         df.drop(df.columns[df.columns.str.contains('unnamed',case = False)],axis = 1, inplace = True)
 
     # save csv
-    df.to_csv(fn_out, index=True, header=True)
+    save_catalog(df, fn_out, store, index=True)
     print('Save matched catalog %s'%(fn_out))
 
-def crossmatch_IRAC(fn_dict):
+def crossmatch_IRAC(fn_dict, pipe):
     
     input_dict = {} # filename, column_ra, column_dec
     input_dict['IRAC']                                      = [fn_dict['fn_IRAC'],                              'ra_irac',          'dec_irac']
@@ -247,82 +367,413 @@ def crossmatch_IRAC(fn_dict):
     input_dict['match_UgneLim_1d4GHzXS_3GHzlp_IRAC']    = [fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp'],     'ra_radio',         'dec_radio']
     input_dict['match_Lim_1d4GHzXS_3GHzlp_IRAC']        = [fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp'],         'ra_radio',         'dec_radio']
     input_dict['match_GaoLim_1d4GHzXS_3GHzlp_IRAC']     = [fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp'],      'ra_radio',         'dec_radio']
-    do_merge_radec(input_dict, f1_key= 'match_UgneLim_1d4GHzXS_3GHzlp_IRAC',   f2_key = 'IRAC', radius=1, fn_bestmatch = fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_irac'])
-    do_merge_radec(input_dict, f1_key= 'match_Lim_1d4GHzXS_3GHzlp_IRAC',        f2_key = 'IRAC', radius=1, fn_bestmatch = fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_irac'])
-    do_merge_radec(input_dict, f1_key= 'match_GaoLim_1d4GHzXS_3GHzlp_IRAC',    f2_key = 'IRAC', radius=1, fn_bestmatch = fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_irac'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_UgneLim_1d4GHzXS_3GHzlp_IRAC',   f2_key = 'IRAC', radius=1, fn_bestmatch = fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_irac'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_Lim_1d4GHzXS_3GHzlp_IRAC',        f2_key = 'IRAC', radius=1, fn_bestmatch = fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_irac'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_GaoLim_1d4GHzXS_3GHzlp_IRAC',    f2_key = 'IRAC', radius=1, fn_bestmatch = fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_irac'])
     
     # radio non-detected
-    # LeFloch
-    input_dict['match_UgneLim_1d4GHzXS_3GHzlp_mipsL_IRAC']  = [fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsL'],   'ra_nradio_mips',   'dec_nradio_mips']
-    input_dict['match_Lim_1d4GHzXS_3GHzlp_mipsL_IRAC']      = [fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsL'],       'ra_nradio_mips',   'dec_nradio_mips']
-    input_dict['match_GaoLim_1d4GHzXS_3GHzlp_mipsL_IRAC']   = [fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsL'],    'ra_nradio_mips',   'dec_nradio_mips']
-    do_merge_radec(input_dict, f1_key= 'match_UgneLim_1d4GHzXS_3GHzlp_mipsL_IRAC', f2_key = 'IRAC', radius=2, fn_bestmatch = fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsL_irac'])
-    do_merge_radec(input_dict, f1_key= 'match_Lim_1d4GHzXS_3GHzlp_mipsL_IRAC',     f2_key = 'IRAC', radius=2, fn_bestmatch = fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsL_irac'])
-    do_merge_radec(input_dict, f1_key= 'match_GaoLim_1d4GHzXS_3GHzlp_mipsL_IRAC',  f2_key = 'IRAC', radius=2, fn_bestmatch = fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsL_irac'])
+    # Union of LeFloch and Wang
+    input_dict['match_UgneLim_1d4GHzXS_3GHzlp_mipsU_IRAC']  = [fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsU'],   'ra_nradio_mips',   'dec_nradio_mips']
+    input_dict['match_Lim_1d4GHzXS_3GHzlp_mipsU_IRAC']      = [fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsU'],       'ra_nradio_mips',   'dec_nradio_mips']
+    input_dict['match_GaoLim_1d4GHzXS_3GHzlp_mipsU_IRAC']   = [fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsU'],    'ra_nradio_mips',   'dec_nradio_mips']
+    add_merge_radec(pipe, input_dict, f1_key= 'match_UgneLim_1d4GHzXS_3GHzlp_mipsU_IRAC', f2_key = 'IRAC', radius=2, fn_bestmatch = fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsU_irac'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_Lim_1d4GHzXS_3GHzlp_mipsU_IRAC',     f2_key = 'IRAC', radius=2, fn_bestmatch = fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsU_irac'])
+    add_merge_radec(pipe, input_dict, f1_key= 'match_GaoLim_1d4GHzXS_3GHzlp_mipsU_IRAC',  f2_key = 'IRAC', radius=2, fn_bestmatch = fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsU_irac'])
+
+
+
+def add_merge_value(pipe, input_dict, f1_key, f2_key, **kwargs):
+    # task of do_merge_value, reading the f1 and f2 catalogs
+    input_dict = {f1_key: input_dict[f1_key], f2_key: input_dict[f2_key]}
+    pipe.add(do_merge_value, input_dict, f1_key, f2_key, 
+        inputs=[input_dict[f1_key][0], input_dict[f2_key][0]], outputs=[kwargs.get('fn_match')], **kwargs)
+
+def add_merge_radec(pipe, input_dict, f1_key, f2_key, **kwargs):
+    # task of do_merge_radec, reading the f1 and f2 catalogs
+    input_dict = {f1_key: input_dict[f1_key], f2_key: input_dict[f2_key]}
+    outputs = []
+    for key in ['fn_allmatch', 'fn_bestmatch', 'fn_innerjoin']:
+        fn = kwargs.get(key)
+        outputs += list(fn) if isinstance(fn, (list, tuple)) else [fn]
+    pipe.add(do_merge_radec, input_dict, f1_key, f2_key, 
+        inputs=[input_dict[f1_key][0], input_dict[f2_key][0]], outputs=outputs, **kwargs)
+
+def add_union_radec(pipe, input_dict, keys, names, **kwargs):
+    # task of do_union_radec, reading the catalogs of keys
+    input_dict = {key: input_dict[key] for key in keys}
+    pipe.add(do_union_radec, input_dict, keys, names, 
+        inputs=[input_dict[key][0] for key in keys], outputs=[kwargs.get('fn_union')], **kwargs)
+
+@fp.profiled
+def do_union_radec(input_dict, keys, names, radius=2, fn_union=None, store=None):
+    # merge the overlapping catalogs of keys into one deduplicated catalog (see tc.catalog_union),
+    # the catalogs are listed by priority, names are the suffixes of their provenance columns
 
-    # Wang
-    input_dict['match_UgneLim_1d4GHzXS_3GHzlp_mipsW_IRAC']  = [fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsW'],   'ra_nradio_mips',   'dec_nradio_mips']
-    input_dict['match_Lim_1d4GHzXS_3GHzlp_mipsW_IRAC']      = [fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsW'],       'ra_nradio_mips',   'dec_nradio_mips']
-    input_dict['match_GaoLim_1d4GHzXS_3GHzlp_mipsW_IRAC']   = [fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsW'],    'ra_nradio_mips',   'dec_nradio_mips']
-    do_merge_radec(input_dict, f1_key= 'match_UgneLim_1d4GHzXS_3GHzlp_mipsW_IRAC', f2_key = 'IRAC', radius=2, fn_bestmatch = fn_dict['fn_match_UgneLim_1d4GHzXS_3GHzlp_mipsW_irac'])
-    do_merge_radec(input_dict, f1_key= 'match_Lim_1d4GHzXS_3GHzlp_mipsW_IRAC',     f2_key = 'IRAC', radius=2, fn_bestmatch = fn_dict['fn_match_Lim_1d4GHzXS_3GHzlp_mipsW_irac'])
-    do_merge_radec(input_dict, f1_key= 'match_GaoLim_1d4GHzXS_3GHzlp_mipsW_IRAC',  f2_key = 'IRAC', radius=2, fn_bestmatch = fn_dict['fn_match_GaoLim_1d4GHzXS_3GHzlp_mipsW_irac'])
+    print('-------------------------------------------------')
+    print('Start to merge catalog %s'%(', '.join(keys)))
+    specs = []
+    for key, name in zip(keys, names):
+        fn, ra, dec = input_dict[key]
+        specs.append((load_catalog(fn, store), ra, dec, name))
+    with fp.phase('union'):
+        df_union = tc.catalog_union(specs, radius)
+    fp.record(n_union=len(df_union))
+    print('The union number is: %d'%(len(df_union)))
+    for (df, ra, dec, name) in specs:
+        print('The number of %s is: %d, duplicated: %d'%(name, len(df), (df_union['n_' + name] > 1).sum()))
 
+    # save csv
+    if fn_union is not None:
+        save_catalog(df_union, fn_union, store, index=False)
+        print('Save union catalog %s'%(fn_union))
 
+@fp.profiled
+def do_merge_value(input_dict, f1_key, f2_key, f1_value, f2_value, join_type='inner', fn_match=None, 
+        columns1=None, columns2=None, store=None):
+    # columns1 and columns2 select the output columns of f1 and f2 (by default, all the columns);
+    # then only the key columns are loaded for the merge, the others are gathered at output time
 
-def do_merge_value(input_dict, f1_key, f2_key, f1_value, f2_value, join_type='inner', fn_match=None):
     # init parm
     fn_f1 = input_dict[f1_key][0]
     fn_f2 = input_dict[f2_key][0]
 
     print('-------------------------------------------------')
     print('Start to merge catalog %s and %s'%(f1_key, f2_key))
-    df1 = pd.read_csv(fn_f1)
-    df2 = pd.read_csv(fn_f2)
-
-    df_m = df1.merge(df2, left_on=f1_value, right_on=f2_value, how=join_type, suffixes=['_1', '_2'])
+    if columns1 is None and columns2 is None:
+        df1 = load_catalog(fn_f1, store)
+        df2 = load_catalog(fn_f2, store)
+        with fp.phase('merge'):
+            df_m = df1.merge(df2, left_on=f1_value, right_on=f2_value, how=join_type, suffixes=['_1', '_2'])
+    else:
+        key1 = load_catalog(fn_f1, store, columns=[f1_value])[f1_value]
+        key2 = load_catalog(fn_f2, store, columns=[f2_value])[f2_value]
+        with fp.phase('merge'):
+            left_ind, right_ind, key = tc.merge_indexers(key1, key2, how=join_type)
+        df1 = load_catalog(fn_f1, store, columns=columns1)
+        df2 = load_catalog(fn_f2, store, columns=columns2)
+        if f1_value == f2_value:
+            # a shared key column is kept once, as in pd.merge
+            df2 = df2.drop(columns=[f2_value], errors='ignore')
+        with fp.phase('gather'):
+            df_m = tc.join_rows(df1, df2, left_ind, right_ind)
+        if f1_value == f2_value and f1_value in df_m.columns:
+            df_m[f1_value] = key
     print('The match number is: %d'%(df_m.shape[0]))
     if 'Unnamed: 0' in df_m.columns:
         df_m.drop(df_m.columns[df_m.columns.str.contains('unnamed',case = False)],axis = 1, inplace = True)
 
     # save csv
     if fn_match is not None:
-        df_m.to_csv(fn_match, index=False, header=True)
+        save_catalog(df_m, fn_match, store, index=False)
         print('Save matched catalog %s'%(fn_match))
  
 
+@fp.profiled
 def do_merge_radec(input_dict, f1_key, f2_key, radius=1, 
-        fn_allmatch = None, fn_bestmatch = None, fn_innerjoin = None):
+        fn_allmatch = None, fn_bestmatch = None, fn_innerjoin = None, use_index = True, chunksize = None, 
+        match_workers = None, columns1 = None, columns2 = None, strategy = 'best', 
+        error1 = None, error2 = None, n_sigma = 3, min_radius = 0, 
+        lr_flux = None, lr_background = 60, min_reliability = 0, store = None):
+    # radius can be a list of radii (in arcsec), with a list of output filenames per radius;
+    # the catalogs are then queried once at the largest radius
+    # error1 and error2 are the positional errors (in arcsec) of f1 and f2: a column, a list of columns
+    # added in quadrature (e.g. the RA and Dec errors), or a number; if any is given, the radius of each 
+    # pair is n_sigma times their combined error, at least min_radius and at most radius
+    # strategy selects the best match of each f1 source: 'best' (its nearest f2 source), or
+    # 'greedy' / 'mutual' for one-to-one matches (see FuncTableCrossmatch.one_to_one), or 'lr' for 
+    # the most reliable candidate by likelihood ratio (see FuncLikelihoodRatio), from the flux column lr_flux 
+    # of f2 (if given) and the positional errors (radius / n_sigma without errors), with the background 
+    # density counted out to lr_background (in arcsec); the candidates below min_reliability are dropped
+    # columns1 and columns2 select the output columns of f1 and f2 (by default, all the columns);
+    # only the RA/DEC columns are loaded for the match, the others are gathered at output time
 
     # init parm
     fn_f1, ra_f1, dec_f1 = input_dict[f1_key]
     fn_f2, ra_f2, dec_f2 = input_dict[f2_key]
+    is_multi = isinstance(radius, (list, tuple))
+    radius_lst = list(radius) if is_multi else [radius]
+    fn_out_lst = list(zip(*[radius_filenames(fn, len(radius_lst)) for fn in [fn_allmatch, fn_bestmatch, fn_innerjoin]]))
+    is_allmatch_lst = [fn_out[0] is not None for fn_out in fn_out_lst]
 
     print('-------------------------------------------------')
     print('Start to merge catalog %s and %s'%(f1_key, f2_key))
-    df1 = pd.read_csv(fn_f1)
-    df2 = pd.read_csv(fn_f2)
-    ind, dist = tc.crossmatch_angular(  X1 = df1[[ra_f1, dec_f1]].values, 
-                                        X2 = df2[[ra_f2, dec_f2]].values,
-                                        max_distance = radius/3600, return_dist = True)
-    df_m    = tc.merge_df(df1, df2, ind, dist)      # all match
-    df_bm   = tc.best_match(df_m, df_m.columns[0])  # best match
-    df_bmi  = tc.inner_join(df_bm)                  # inner join
-    print('The all match number is: %d'%(df_m.shape[0]))
-    print('The best match number is: %d'%(df_bm.shape[0]))
-    print('The inner join best match number is: %d'%(df_bmi.shape[0]))
+    is_error = error1 is not None or error2 is not None
+    if is_error:
+        print('Match radius of %g sigma of the positional errors, from %g to %g arcsec'%(n_sigma, min_radius, max(radius_lst)))
+        err2 = position_error(load_catalog(fn_f2, store, columns=[ra_f2, dec_f2] + error_columns(error2)), error2)
+    coord1 = [ra_f1, dec_f1] + error_columns(error1)
+    if strategy == 'lr':
+        mag2 = flux_magnitude(load_catalog(fn_f2, store, columns=[lr_flux])[lr_flux]) if lr_flux is not None else None
+        lr_args = (mag2, max(radius_lst) / n_sigma, lr_background, min_reliability)
+    with fp.phase('index'):
+        if store is not None:
+            X2 = store.get_index(fn_f2, ra_f2, dec_f2)
+        elif use_index:
+            # coordinate index of f2 cached next to the catalog
+            X2 = ci.load_index(fn_f2, ra_f2, dec_f2)
+        else:
+            X2 = load_catalog(fn_f2, store, columns=[ra_f2, dec_f2]).values
+
+    if chunksize is None:
+        df1 = load_catalog(fn_f1, store, columns=coord1)
+        error = (position_error(df1, error1), err2, n_sigma, min_radius) if is_error else None
+        lr = lr_setting(error, *lr_args) if strategy == 'lr' else None
+        pair_lst = match_pairs(df1[[ra_f1, dec_f1]].values, X2, radius_lst, is_allmatch_lst, n_workers=match_workers, 
+                               strategy=strategy, error=error, lr=lr)
+
+        # the selected columns, gathered by the matched rows
+        df1 = load_catalog(fn_f1, store, columns=columns1)
+        df2 = load_catalog(fn_f2, store, columns=columns2)
+        df_lst = merge_pairs(df1, df2, pair_lst)
+        for r, (df_m, df_bm, df_bmi), (fn_allmatch, fn_bestmatch, fn_innerjoin) in zip(radius_lst, df_lst, fn_out_lst):
+            if is_multi:
+                print('Radius %g arcsec'%(r))
+            if fn_allmatch is not None:
+                print('The all match number is: %d'%(df_m.shape[0]))
+            print('The best match number is: %d'%(df_bm.shape[0]))
+            print('The inner join best match number is: %d'%(df_bmi.shape[0]))
+
+            # save csv
+            if fn_allmatch is not None:
+                save_catalog(df_m, fn_allmatch, store, index=False)
+                print('Save all-match catalog %s'%(fn_allmatch))
+            if fn_bestmatch is not None:
+                save_catalog(df_bm, fn_bestmatch, store, index=False)
+                print('Save best-match catalog %s'%(fn_bestmatch))
+            if fn_innerjoin is not None:
+                save_catalog(df_bmi, fn_innerjoin, store, index=False)
+                print('Save best-match, inner join catalog %s'%(fn_innerjoin))
+        return
+
+    # streaming: match f1 chunk by chunk against the f2 index, and append to the outputs
+    if store is not None:
+        # f1 is read from disk, and the outputs are written there directly
+        store.flush(fn_f1)
+        for fn_out in fn_out_lst:
+            for fn in fn_out:
+                if fn is not None:
+                    store.discard(fn)
+    df2 = load_catalog(fn_f2, store, columns=columns2)
+    if not isinstance(X2, tc.CatalogIndex):
+        # the tree of f2 is built once for all the chunks
+        X2 = tc.CatalogIndex.from_radec(X2)
+    columns_read = None if columns1 is None else list(dict.fromkeys(list(columns1) + coord1))
+    pair_all = None
+    if strategy != 'best':
+        # the one-to-one matches depend on all the f1 sources, so the coordinates of f1
+        # are matched first, and the pairs of each chunk are sliced from them
+        df1 = cio.read_catalog(fn_f1, columns=coord1)
+        error = (position_error(df1, error1), err2, n_sigma, min_radius) if is_error else None
+        lr = lr_setting(error, *lr_args) if strategy == 'lr' else None
+        pair_all = match_pairs(df1[[ra_f1, dec_f1]].values, X2, radius_lst, is_allmatch_lst, n_workers=match_workers, 
+                               strategy=strategy, error=error, lr=lr)
+        del df1
+        is_count = [bool((bestmatch[3] > 1).any()) for _, bestmatch in pair_all]
+    else:
+        # the 'Count' column is added as in the in-memory path, if any f1 source has more 
+        # than one candidate, so the candidates are counted over all the chunks first
+        is_count = [False] * len(radius_lst)
+        with fp.phase('count'):
+            for df1 in cio.iter_catalog(fn_f1, chunksize, columns=coord1):
+                error = (position_error(df1, error1), err2, n_sigma, min_radius) if is_error else None
+                count_lst = candidate_counts(df1[[ra_f1, dec_f1]].values, X2, radius_lst, error=error)
+                is_count = [is_k or bool((count > 1).any()) for is_k, count in zip(is_count, count_lst)]
+    writers = [[cio.CatalogWriter(fn) if fn is not None else None for fn in fn_out] for fn_out in fn_out_lst]
+    n_match = np.zeros((len(radius_lst), 3), dtype=int)
+    is_complete = False
+    try:
+        is_empty = True
+        start = 0
+        for df1 in fp.timed_iter('read', cio.iter_catalog(fn_f1, chunksize, columns=columns_read)):
+            is_empty = False
+            fp.record_df('read', df1)
+            if pair_all is None:
+                error = (position_error(df1, error1), err2, n_sigma, min_radius) if is_error else None
+                pair_lst = match_pairs(df1[[ra_f1, dec_f1]].values, X2, radius_lst, is_allmatch_lst, n_workers=match_workers, 
+                                       error=error)
+            else:
+                pair_lst = slice_pairs(pair_all, start, start + len(df1))
+            start += len(df1)
+            df_lst = merge_pairs(df1 if columns1 is None else df1[list(columns1)], df2, pair_lst, add_count=is_count)
+            for k in range(len(radius_lst)):
+                for i in range(3):
+                    if df_lst[k][i] is not None:
+                        n_match[k, i] += df_lst[k][i].shape[0]
+                        if writers[k][i] is not None:
+                            with fp.phase('write'):
+                                writers[k][i].write(df_lst[k][i])
+        if is_empty:
+            # write the (empty) outputs with their columns
+            df1 = cio.read_catalog(fn_f1, columns=columns_read)
+            error = (position_error(df1, error1), err2, n_sigma, min_radius) if is_error else None
+            pair_lst = match_pairs(df1[[ra_f1, dec_f1]].values, X2, radius_lst, is_allmatch_lst, error=error)
+            df_lst = merge_pairs(df1 if columns1 is None else df1[list(columns1)], df2, pair_lst, add_count=is_count)
+            for k in range(len(radius_lst)):
+                for i in range(3):
+                    if writers[k][i] is not None:
+                        writers[k][i].write(df_lst[k][i])
+        is_complete = True
+    finally:
+        # the outputs are only moved in place if all the chunks are written
+        for writer in sum(writers, []):
+            if writer is not None:
+                writer.close(is_complete=is_complete)
+    for k, r in enumerate(radius_lst):
+        if is_multi:
+            print('Radius %g arcsec'%(r))
+        if is_allmatch_lst[k]:
+            print('The all match number is: %d'%(n_match[k, 0]))
+        print('The best match number is: %d'%(n_match[k, 1]))
+        print('The inner join best match number is: %d'%(n_match[k, 2]))
+        for fn in fn_out_lst[k]:
+            if fn is not None:
+                print('Save matched catalog %s'%(fn))
+
+def radius_filenames(fn, n_radius):
+    # output filenames of each radius: a list of n_radius filenames, or a single filename (or None)
+    if isinstance(fn, (list, tuple)):
+        if len(fn) != n_radius:
+            raise ValueError('Expect one output filename per radius, got %s'%(fn,))
+        return list(fn)
+    if fn is not None and n_radius > 1:
+        raise ValueError('Expect one output filename per radius, got %s'%(fn))
+    return [fn] * n_radius
+
+def match_pairs(X1, X2, radius_lst, is_allmatch_lst, n_workers=None, strategy='best', error=None, lr=None):
+    # matched pairs of X1 and X2 at each radius: the sorted all-match pairs (offset, ind, sep, columns), 
+    # if is_allmatch, and the best-match pairs (of the strategy) (offset, ind, sep, count, columns) 
+    # with the number of candidates and the per-pair columns (None, or the likelihood ratios of strategy 'lr');
+    # error is (err1, err2, n_sigma, min_radius) for the radii from the positional errors,
+    # lr is (mag2, err1, err2, background_radius, min_reliability) of strategy 'lr' (see lr_setting)
+    with fp.phase('match'):
+        pair_lst = match_pairs_radius(X1, X2, radius_lst, is_allmatch_lst, n_workers=n_workers, strategy=strategy, 
+                                      error=error, lr=lr)
+    for allmatch, bestmatch in pair_lst:
+        fp.record(n_pair=len(allmatch[1]) if allmatch is not None else 0, n_bestmatch=len(bestmatch[1]))
+    return pair_lst
+
+def match_pairs_radius(X1, X2, radius_lst, is_allmatch_lst, n_workers=None, strategy='best', error=None, lr=None):
+    if strategy not in ['best', 'greedy', 'mutual', 'lr']:
+        raise ValueError('Unknown match strategy %s'%(strategy))
+    if len(radius_lst) == 1 and not is_allmatch_lst[0] and strategy == 'best' and error is None:
+        # best match directly from the nearest neighbour, without the all-match pairs
+        with fp.phase('query'):
+            offset, ind, sep, count = tc.crossmatch_angular_nearest(X1, X2, max_distance = radius_lst[0]/3600, n_workers = n_workers)
+        return [(None, (offset, ind, sep, count, None))]
+
+    # query once at the largest radius, and filter the sorted pairs for the smaller ones
+    pair_lst = []
+    max_radius = max(radius_lst)
+    with fp.phase('query'):
+        if error is None:
+            offset_max, ind_max, sep_max = tc.crossmatch_angular(X1, X2, max_distance = max_radius/3600, return_dist = True, 
+                                                                 flat = True, n_workers = n_workers)
+        else:
+            # one query with the radius of each X1 source from the errors, capped by the largest radius
+            err1, err2, n_sigma, min_radius = error
+            offset_max, ind_max, sep_max = tc.crossmatch_angular_error(X1, X2, err1/3600, err2/3600, n_sigma, 
+                                                                       min_radius/3600, max_radius/3600, n_workers = n_workers)
+    with fp.phase('sort'):
+        ind_max, sep_max = tc.sort_pairs(offset_max, ind_max, sep_max)
+    if error is not None and len(radius_lst) > 1:
+        row = np.repeat(np.arange(len(X1)), np.diff(offset_max))
+        radius_pair = tc.error_radius(err1[row], err2[ind_max], n_sigma, min_radius, max_radius)
+    for radius, is_allmatch in zip(radius_lst, is_allmatch_lst):
+        if radius == max_radius:
+            offset, ind, sep = offset_max, ind_max, sep_max
+        elif error is None:
+            offset, ind, sep = tc.filter_radius(offset_max, ind_max, sep_max, radius)
+        else:
+            offset, ind, sep = tc.filter_radius(offset_max, ind_max, sep_max, np.minimum(radius_pair, radius))
+        count = np.diff(offset)
+        columns = None
+        if strategy == 'best':
+            bestmatch = tc.nearest_pairs(offset, ind, sep)
+        elif strategy == 'lr':
+            mag2, err1_lr, err2_lr, background_radius, min_reliability = lr
+            with fp.phase('lr'):
+                columns, Q = flr.likelihood_ratio(X1, X2, offset, ind, sep, radius, mag2=mag2, err1=err1_lr, err2=err2_lr, 
+                                                  background_radius=background_radius)
+                bestmatch = flr.best_reliability(offset, ind, sep, columns, min_reliability)
+            print('The fraction of sources with a counterpart (Q) is: %.3f'%(Q))
+        else:
+            with fp.phase('one_to_one'):
+                bestmatch = tc.one_to_one(offset, ind, sep, method=strategy)
+        if len(bestmatch) == 3:
+            bestmatch += (None,)
+        pair_lst.append(((offset, ind, sep, columns) if is_allmatch else None, bestmatch[:3] + (count, bestmatch[3])))
+    return pair_lst
+
+def lr_setting(error, mag2, sigma, background_radius, min_reliability):
+    # lr argument of match_pairs: the positional errors of the pairs are the ones of 
+    # the error setting, or sigma (in arcsec) without errors
+    err1, err2 = (error[0], error[1]) if error is not None else (sigma, 0.)
+    return (mag2, err1, err2, background_radius, min_reliability)
+
+def flux_magnitude(flux):
+    # magnitude-like value of the fluxes for the likelihood ratio, NaN if not positive
+    flux = np.asarray(flux, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(flux > 0, -2.5 * np.log10(flux), np.nan)
+
+def error_columns(error):
+    # the catalog columns of a positional error setting of do_merge_radec
+    if isinstance(error, str):
+        return [error]
+    if isinstance(error, (list, tuple)):
+        return list(error)
+    return []
+
+def position_error(df, error):
+    # positional error (in arcsec) of each row: a column, the quadrature sum of columns, or a number
+    columns = error_columns(error)
+    if len(columns) == 0:
+        return np.full(len(df), 0. if error is None else float(error))
+    err = [df[col].to_numpy(dtype=float, na_value=np.nan) for col in columns]
+    return np.sqrt(np.sum(np.square(err), axis=0))
+
+def slice_pairs(pair_lst, start, stop):
+    # the pairs of match_pairs for the f1 rows start to stop
+    pair_slice = []
+    for allmatch, (offset, ind, sep, count, columns) in pair_lst:
+        offset, ind, sep, columns = slice_match(offset, ind, sep, columns, start, stop)
+        pair_slice.append((slice_match(*allmatch, start, stop) if allmatch is not None else None,
+                           (offset, ind, sep, count[start:stop], columns)))
+    return pair_slice
+
+def slice_match(offset, ind, sep, columns, start, stop):
+    # the pairs and the per-pair columns (if any) of the f1 rows start to stop
+    if columns is not None:
+        lo, hi = offset[start], offset[stop]
+        columns = {col: values[lo:hi] for col, values in columns.items()}
+    return tc.slice_rows(offset, ind, sep, start, stop) + (columns,)
+
+def candidate_counts(X1, X2, radius_lst, error=None):
+    # the number of candidates of each X1 source at each radius, as the count of match_pairs
+    if error is None:
+        Y1 = tc.radec_to_xyz(X1)
+        return [X2.count(Y1, tc.angle_to_chord(radius/3600)) for radius in radius_lst]
+    pair_lst = match_pairs_radius(X1, X2, radius_lst, [False] * len(radius_lst), error=error)
+    return [bestmatch[3] for _, bestmatch in pair_lst]
+
+def merge_pairs(df1, df2, pair_lst, add_count=None):
+    # all-match (if any), best-match and inner join best-match tables of each radius,
+    # add_count is the add_count of merge_flat, or a list of it per radius
+    df_lst = []
+    add_count_lst = add_count if isinstance(add_count, list) else [add_count] * len(pair_lst)
+    with fp.phase('merge'):
+        for (allmatch, (offset, ind, sep, count, columns)), add_count in zip(pair_lst, add_count_lst):
+            df_m    = tc.merge_flat(df1, df2, *allmatch[:3], add_count=add_count, 
+                                    pair_columns=allmatch[3]) if allmatch is not None else None                     # all match
+            df_bm   = tc.merge_flat(df1, df2, offset, ind, sep, count, add_count=add_count, pair_columns=columns)     # best match
+            df_bmi  = tc.inner_join(df_bm)                                                                       # inner join
+            df_lst.append((df_m, df_bm, df_bmi))
+    return df_lst
 
-    # save csv
-    if fn_allmatch is not None:
-        df_m.to_csv(fn_allmatch, index=False, header=True)
-        print('Save all-match catalog %s'%(fn_allmatch))
-    if fn_bestmatch is not None:
-        df_bm.to_csv(fn_bestmatch, index=False, header=True)
-        print('Save best-match catalog %s'%(fn_bestmatch))
-    if fn_innerjoin is not None:
-        df_bmi.to_csv(fn_innerjoin, index=False, header=True)
-        print('Save best-match, inner join catalog %s'%(fn_innerjoin))
-    
 
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    main(fmt=args.format, is_export_csv=not args.no_csv, n_workers=args.workers, 
+         force=args.force, only=args.only, max_memory=args.memory*1e9, chunksize=args.chunksize, 
+         match_workers=args.match_workers, fn_profile=args.profile, cprofile=args.cprofile, 
+         strategy=args.strategy, io_workers=args.io_workers)
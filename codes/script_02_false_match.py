@@ -0,0 +1,86 @@
+"""
+File: script_02_false_match.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to estimate the false-match rate of the crossmatches
+as a function of the radius, to choose the matching radii of
+script_01_make_crossmatch.py (see FuncFalseMatch.py).
+"""
+import os
+import argparse
+import numpy as np
+
+# my own packing
+from path import PATH_TABLE
+import FuncCatalogIO as cio
+import FuncCatalogIndex as ci
+import FuncFalseMatch as fm
+from script_01_make_crossmatch import set_filename
+
+# name: (catalog, RA, DEC) of the shifted catalog, and of the matched catalog
+PAIRS = {
+    '450umGao_1d4GHzXS' : [('fn_JCMT_450umGao', 'RA_450umGao', 'Dec_450umGao'), ('fn_VLA_1d4GHzXS', 'RA_1d4GHzXS', 'DEC_1d4GHzXS')],
+    '450umGao_3GHzlp'   : [('fn_JCMT_450umGao', 'RA_450umGao', 'Dec_450umGao'), ('fn_VLA_3GHzlp', 'ra_3GHzlp', 'dec_3GHzlp')],
+    '450umGao_mipsL'    : [('fn_JCMT_450umGao', 'RA_450umGao', 'Dec_450umGao'), ('fn_MIPS_LeFloch', 'RA_J2000_24umLeFloch', 'DEC_J2000_24umLeFloch')],
+    '450umGao_mipsW'    : [('fn_JCMT_450umGao', 'RA_450umGao', 'Dec_450umGao'), ('fn_MIPS_whwang', 'RA_mips24_24umWang', 'DEC_mips24_24umWang')],
+    '3GHzlp_irac'       : [('fn_VLA_3GHzlp', 'ra_3GHzlp', 'dec_3GHzlp'), ('fn_IRAC', 'ra_irac', 'dec_irac')],
+    'mipsL_irac'        : [('fn_MIPS_LeFloch', 'RA_J2000_24umLeFloch', 'DEC_J2000_24umLeFloch'), ('fn_IRAC', 'ra_irac', 'dec_irac')],
+}
+
+
+def main(fmt=cio.DEFAULT_FORMAT, pairs=None, radii=None, n_realization=100, min_shift=10., max_shift=60.,
+         seed=None, n_workers=None):
+
+    fn_dict = set_filename(fmt)
+    if pairs is None:
+        pairs = list(PAIRS)
+    if radii is None:
+        radii = np.arange(0.5, 5.01, 0.5)
+
+    # create the directory if not exist
+    isExist = os.path.exists(PATH_TABLE)
+    if not isExist:
+        os.makedirs(PATH_TABLE)
+        print(f'Create new directory: {PATH_TABLE}')
+
+    for name in pairs:
+        (key1, ra1, dec1), (key2, ra2, dec2) = PAIRS[name]
+        X1 = cio.read_catalog(fn_dict[key1], columns=[ra1, dec1]).values
+        index2 = ci.load_index(fn_dict[key2], ra2, dec2)
+
+        print('-------------------------------------------------')
+        print('False-match rate of %s, %d realizations'%(name, n_realization))
+        df = fm.false_match_rate(X1, index2, radii, n_realization=n_realization, min_shift=min_shift,
+                                 max_shift=max_shift, seed=seed, n_workers=n_workers)
+        print(df.to_string(index=False, float_format='%.4f'))
+
+        fn_out = '%sfalse_match_%s.csv'%(PATH_TABLE, name)
+        cio.write_catalog(df, fn_out)
+        print('Save false-match table %s'%(fn_out))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Estimate the false-match rate of the COSMOS crossmatches.')
+    parser.add_argument('--format', choices=list(cio.FORMAT_EXT), default=cio.DEFAULT_FORMAT,
+                        help='format of the catalogs (default: %(default)s)')
+    parser.add_argument('--pair', action='append', choices=list(PAIRS),
+                        help='only estimate this pair of catalogs, can be repeated (default: all)')
+    parser.add_argument('--radii', type=float, nargs='+', default=None,
+                        help='matching radii in arcsec (default: 0.5 to 5 in steps of 0.5)')
+    parser.add_argument('-n', '--realizations', type=int, default=100,
+                        help='number of random shifts (default: %(default)s)')
+    parser.add_argument('--min-shift', type=float, default=10.,
+                        help='smallest shift in arcsec (default: %(default)s)')
+    parser.add_argument('--max-shift', type=float, default=60.,
+                        help='largest shift in arcsec (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='random seed')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(fmt=args.format, pairs=args.pair, radii=args.radii, n_realization=args.realizations,
+         min_shift=args.min_shift, max_shift=args.max_shift, seed=args.seed, n_workers=args.workers)
@@ -0,0 +1,74 @@
+"""
+File: script_03_make_cutout.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to make the postage stamps of the sources of a crossmatch
+catalog (e.g. cosmos_match_450umLim_1d4GHzXS_3GHzlp_irac) in several bands,
+one FITS cube per band (see FuncCutout.py).
+
+Example:
+    python script_03_make_cutout.py --catalog fn_match_Lim_1d4GHzXS_3GHzlp_irac \
+        --image irac1=irac_ch1_mosaic.fits --image vla3GHz=vla_3ghz_mosaic.fits
+"""
+import os
+import argparse
+
+# my own packing
+from path import PATH_IMG, PATH_CUTOUT
+import FuncCatalogIO as cio
+import FuncCutout as fc
+from script_01_make_crossmatch import set_filename
+
+
+def main(catalog, images, col_ra='ra_radio', col_dec='dec_radio', col_id=None, size=10., 
+         fmt=cio.DEFAULT_FORMAT, n_workers=None):
+
+    fn_cat = set_filename(fmt)[catalog]
+    images = {band: os.path.join(PATH_IMG, fn) for band, fn in images.items()}
+
+    # create the directory if not exist
+    isExist = os.path.exists(PATH_CUTOUT)
+    if not isExist:
+        os.makedirs(PATH_CUTOUT)
+        print(f'Create new directory: {PATH_CUTOUT}')
+
+    # only the positions (and IDs) of the sources are read, the stamps follow the row order
+    columns = [col_ra, col_dec] + ([col_id] if col_id is not None else [])
+    df = cio.read_catalog(fn_cat, columns=columns)
+    ids = df[col_id].values if col_id is not None else None
+    print('Cut %d sources of %s in %d bands'%(len(df), fn_cat, len(images)))
+
+    name = os.path.splitext(os.path.basename(fn_cat))[0]
+    fn_out_fmt = '%s%s_%%s.fits'%(PATH_CUTOUT, name)
+    n_stamp = fc.make_cutouts(df[col_ra].values, df[col_dec].values, images, size, fn_out_fmt, 
+                              ids=ids, n_workers=n_workers)
+    for band, n in n_stamp.items():
+        print('Save %d stamps of %s in %s'%(n, band, fn_out_fmt%(band)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Make the postage stamps of the sources of a crossmatch catalog.')
+    parser.add_argument('--catalog', required=True,
+                        help='the crossmatch catalog, as its key in set_filename (e.g. fn_match_Lim_1d4GHzXS_3GHzlp_irac)')
+    parser.add_argument('--image', action='append', required=True, metavar='BAND=FILE',
+                        help='the image of a band, relative to PATH_IMG, can be repeated')
+    parser.add_argument('--ra', default='ra_radio',
+                        help='the RA column of the catalog (default: %(default)s)')
+    parser.add_argument('--dec', default='dec_radio',
+                        help='the Dec column of the catalog (default: %(default)s)')
+    parser.add_argument('--id', default=None,
+                        help='the ID column of the catalog (default: the row numbers)')
+    parser.add_argument('--size', type=float, default=10.,
+                        help='stamp size in arcsec (default: %(default)s)')
+    parser.add_argument('--format', choices=list(cio.FORMAT_EXT), default=cio.DEFAULT_FORMAT,
+                        help='format of the catalogs (default: %(default)s)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of worker processes, one band per process (default: number of cores)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    images = dict(image.split('=', 1) for image in args.image)
+    main(args.catalog, images, col_ra=args.ra, col_dec=args.dec, col_id=args.id, size=args.size,
+         fmt=args.format, n_workers=args.workers)
@@ -0,0 +1,81 @@
+"""
+File: script_04_cone_server.py
+Name: Chia-Lin Ko
+Create Date: Oct 18, 2026
+------------------------
+This program aims to serve cone searches and crossmatches against the
+catalogs of catalog.txt from a local server, which loads their indexes
+once (see FuncConeSearch.py). The notebooks query it with
+FuncConeSearch.ConeSearchClient.
+
+Example:
+    python script_04_cone_server.py --catalog 3GHzlp --catalog irac --port 8765
+"""
+import os
+import argparse
+
+# my own packing
+from path import PATH_CATALOG
+import FuncCatalogIO as cio
+import FuncConeSearch as cs
+from script_00_remodel_catalog import read_catalog_txt
+
+
+def main(fmt=cio.DEFAULT_FORMAT, host=cs.DEFAULT_HOST, port=cs.DEFAULT_PORT, names=None, max_memory=4e9):
+
+    catalogs = set_catalogs(fmt, names)
+    server = cs.ConeSearchServer(catalogs, address=(host, port), max_memory=max_memory)
+    server.warm()
+    print('Serve %d catalogs on http://%s:%d'%(len(catalogs), host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve cone searches against the COSMOS catalogs.')
+    parser.add_argument('--format', choices=list(cio.FORMAT_EXT), default=cio.DEFAULT_FORMAT,
+                        help='format of the catalogs (default: %(default)s)')
+    parser.add_argument('--host', default=cs.DEFAULT_HOST,
+                        help='host of the server (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=cs.DEFAULT_PORT,
+                        help='port of the server (default: %(default)s)')
+    parser.add_argument('--catalog', action='append', metavar='NAME',
+                        help='only serve this catalog, by its suffix in catalog.txt (e.g. 3GHzlp), '
+                             'can be repeated (default: all the converted catalogs)')
+    parser.add_argument('--memory', type=float, default=4,
+                        help='memory budget in GB of the catalog columns kept by the server')
+    return parser.parse_args()
+
+def set_catalogs(fmt=cio.DEFAULT_FORMAT, names=None):
+    # name (the suffix of catalog.txt, without '_') -> (filename, col_ra, col_dec) of the converted catalogs
+    fn_txt = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.txt')
+    _, fn_out_lst, add_col_name_lst = read_catalog_txt(fn_txt)
+    catalogs = {}
+    for fn_out, suffix in zip(fn_out_lst, add_col_name_lst):
+        name = suffix.lstrip('_')
+        fn = PATH_CATALOG + fn_out + cio.FORMAT_EXT[fmt]
+        if names is not None and name not in names:
+            continue
+        if not os.path.exists(fn):
+            print('Skip catalog %s, %s is not found'%(name, fn))
+            continue
+        try:
+            col_ra, col_dec = cs.coord_columns(cio.catalog_columns(fn))
+        except ValueError:
+            # e.g. the tables without positions, joined by ID
+            print('Skip catalog %s, no RA/DEC columns'%(name))
+            continue
+        catalogs[name] = (fn, col_ra, col_dec)
+    if names is not None:
+        missing = [name for name in names if name not in catalogs]
+        if missing:
+            raise ValueError('Catalogs %s are not available'%(missing))
+    return catalogs
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(fmt=args.format, host=args.host, port=args.port, names=args.catalog, max_memory=args.memory*1e9)